@@ -21,7 +21,9 @@ from pycbio.sys import pipeline
 class FileIn(object):
     """Object used to specified an input File as an argument to a command.
     Using an instance of this object in a command line automatically adds it
-    as a requirement.  It also support automatic decompression of the file.
+    as a requirement.  It also support automatic decompression of the file,
+    with the compression format determined by magic number if the file exists,
+    otherwise by extension.
 
     The prefix attribute is used in construction arguments when an
     option-equals is prepended to the file (--in=fname).  The prefix
@@ -132,17 +134,17 @@ class File(Production):
 
     def openOut(self, autoCompress=True):
         """open the output file for writing from the ExRun process"""
-        path = self.__setupOut(autoCompress)
+        path = self.getOutPath(autoCompress)
         if fileOps.isCompressed(path) and autoCompress:
-            return fileOps.openz(path, "w")
+            return fileOps.opengz(path, "w")
         else:
             return open(path, "w")
 
     def openIn(self, autoDecompress=True):
         """open the input file for reading in the ExRun process"""
-        path = self.__setupIn()
-        if fileOps.isCompressed(path) and autoDecompress:
-            return fileOps.openz(path)
+        path = self.getInPath(autoDecompress)
+        if (fileOps.getCompressFormat(path) is not None) and autoDecompress:
+            return fileOps.opengz(path)
         else:
             return open(path)
 
@@ -216,7 +218,7 @@ class Cmd(list):
 
         # handle File object, include arg prefix
         path = fspec.file.getInPath()
-        if fileOps.isCompressed(path) and fspec.autoDecompress:
+        if (fileOps.getCompressFormat(path) is not None) and fspec.autoDecompress:
             pdev = pipeline.Pipe()
             pdag.create((fileOps.decompressCmd(path), path), stdout=pdev)
             return pipeline.PIn(pdev, fspec.prefix)
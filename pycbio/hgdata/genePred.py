@@ -557,9 +557,10 @@ class GenePredTbl(list):
             self.rangeMap.add(gene.chrom, gene.txStart, gene.txEnd, gene, gene.strand)
 
 class GenePredReader(object):
-    """Read genePreds from a tab file."""
+    """Read genePreds from a tab file.  The fileName may also be a list of
+    commands or a Pipeline to read from, see fileOps.openInput()."""
     def __init__(self, fileName):
-        self.fh = fileOps.opengz(fileName)
+        self.fh = fileOps.openInput(fileName)
 
     def __iter__(self):
         return self
@@ -427,9 +427,13 @@ class Psl(object):
 class PslReader(object):
     """Read PSLs from a tab file"""
 
-    def __init__(self, fileName):
+    def __init__(self, fileName, inFh=None):
+        """fileName - file to read, or a list of commands or a Pipeline to read
+          from, see fileOps.openInput().
+        inFh - If not None, this is used as the open file, rather than
+          opening fileName.  Closed when the end of file is reached."""
         self.fh = None  # required for __del__ if open fails
-        self.fh = fileOps.opengz(fileName)
+        self.fh = inFh if inFh is not None else fileOps.openInput(fileName)
 
     def __del__(self):
         if self.fh is not None:
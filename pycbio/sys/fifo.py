@@ -15,16 +15,16 @@ class _Fifo(object):
             self.close()
         except: pass
 
-    def getRfh(self):
-        "get read file object"
+    def getRfh(self, bufSize=-1):
+        "get read file object, bufSize is used when it is first created"
         if self.rfh is None:
-            self.rfh = os.fdopen(self.rfd)
+            self.rfh = os.fdopen(self.rfd, "r", bufSize)
         return self.rfh
 
-    def getWfh(self):
-        "get write file object"
+    def getWfh(self, bufSize=-1):
+        "get write file object, bufSize is used when it is first created"
         if self.wfh is None:
-            self.wfh = os.fdopen(self.wfd, "w")
+            self.wfh = os.fdopen(self.wfd, "w", bufSize)
         return self.wfh
 
     def rclose(self):
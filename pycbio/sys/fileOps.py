@@ -1,8 +1,8 @@
 # Copyright 2006-2012 Mark Diekhans
 """Miscellaneous file operations"""
 
-import os, errno, sys, stat, fcntl, socket, random, shutil, string, gzip
-
+import os, errno, sys, stat, fcntl, socket, random, shutil, string, gzip, bz2, zlib, struct
+import threading, Queue, collections, multiprocessing, mmap, array, bisect
 
 class TemporaryFilePath(object):
     """
@@ -35,13 +35,17 @@ class TemporaryDirectoryPath(object):
 
 
 _pipelineMod = None
-def _getPipelineClass():
-    """To avoid mutual import issues, we get the Pipeline class dynamically on
+def _getPipelineMod():
+    """To avoid mutual import issues, we get the pipeline module dynamically on
     first use"""
     global _pipelineMod
     if _pipelineMod is None:
         _pipelineMod = __import__("pycbio.sys.pipeline", fromlist=["pycbio.sys.pipeline"])
-    return _pipelineMod.Pipeline
+    return _pipelineMod
+
+def _getPipelineClass():
+    "get the Pipeline class, see _getPipelineMod()"
+    return _getPipelineMod().Pipeline
 
 def ensureDir(dir):
     """Ensure that a directory exists, creating it (and parents) if needed."""
@@ -83,9 +87,146 @@ def rmTree(root):
     "In case anyone has any legacy uses"
     shutil.rmtree(root)
 
+# zero-copy kernel calls are accessed through ctypes, as they are not in the
+# Python 2 os module
+_libc = None
+_libcLoaded = False
+_SPLICE_F_MOVE = 1
+
+def _getLibc():
+    "get libc with sendfile and splice, or None if not available"
+    global _libc, _libcLoaded
+    if not _libcLoaded:
+        _libcLoaded = True
+        if sys.platform.startswith("linux"):
+            try:
+                import ctypes, ctypes.util
+                libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+                libc.sendfile.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t]
+                libc.sendfile.restype = ctypes.c_ssize_t
+                libc.splice.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p,
+                                        ctypes.c_size_t, ctypes.c_uint]
+                libc.splice.restype = ctypes.c_ssize_t
+                _libc = libc
+            except (ImportError, OSError, AttributeError):
+                pass
+    return _libc
+
+def _getKernelCopyFunc(inFd, outFd):
+    """get function(inFd, outFd, size) to copy data in the kernel between
+    the file descriptors, or None if not possible"""
+    libc = _getLibc()
+    if libc is None:
+        return None
+    if stat.S_ISFIFO(os.fstat(inFd).st_mode) or stat.S_ISFIFO(os.fstat(outFd).st_mode):
+        return lambda inFd, outFd, size: libc.splice(inFd, None, outFd, None, size, _SPLICE_F_MOVE)
+    elif stat.S_ISREG(os.fstat(inFd).st_mode):
+        return lambda inFd, outFd, size: libc.sendfile(outFd, inFd, None, size)
+    else:
+        return None
+
+def _kernelCopy(copyFunc, inFd, outFd, count, bufSize):
+    "copy using kernel call, return bytes copied or None if not supported"
+    import ctypes
+    copied = 0
+    while (count is None) or (copied < count):
+        cnt = copyFunc(inFd, outFd, bufSize if count is None else min(bufSize, count - copied))
+        if cnt < 0:
+            err = ctypes.get_errno()
+            if err == errno.EINTR:
+                continue
+            if (copied == 0) and (err in (errno.EINVAL, errno.ENOSYS)):
+                return None
+            raise OSError(err, os.strerror(err))
+        if cnt == 0:
+            break
+        copied += cnt
+    return copied
+
+def _bufferCopy(inFd, outFd, count, bufSize):
+    "copy using read and write"
+    copied = 0
+    while (count is None) or (copied < count):
+        try:
+            buf = os.read(inFd, bufSize if count is None else min(bufSize, count - copied))
+        except OSError as ex:
+            if ex.errno == errno.EINTR:
+                continue
+            raise
+        if len(buf) == 0:
+            break
+        copied += len(buf)
+        while len(buf) > 0:
+            try:
+                buf = buf[os.write(outFd, buf):]
+            except OSError as ex:
+                if ex.errno != errno.EINTR:
+                    raise
+    return copied
+
+def copyFd(inFd, outFd, count=None, zeroCopy=True, bufSize=1024*1024):
+    """Copy from file descriptor inFd to outFd until EOF, or until count
+    bytes have been copied, starting at the current file offsets.  If
+    zeroCopy is True and the system supports it, the data is moved in the
+    kernel with splice(2) when either descriptor is a pipe, or with
+    sendfile(2) from a regular file, rather than passing through Python
+    buffers.  Otherwise, or if the descriptors don't support this, read and
+    write of bufSize blocks are used.  Returns the number of bytes copied."""
+    if zeroCopy:
+        copyFunc = _getKernelCopyFunc(inFd, outFd)
+        if copyFunc is not None:
+            copied = _kernelCopy(copyFunc, inFd, outFd, count, bufSize)
+            if copied is not None:
+                return copied
+    return _bufferCopy(inFd, outFd, count, bufSize)
+
+def copyFile(srcPath, destPath, zeroCopy=True):
+    """copy contents of file srcPath to destPath using copyFd, returning the
+    number of bytes copied"""
+    inFd = os.open(srcPath, os.O_RDONLY)
+    try:
+        outFd = os.open(destPath, os.O_WRONLY|os.O_CREAT|os.O_TRUNC, 0666)
+        try:
+            return copyFd(inFd, outFd, zeroCopy=zeroCopy)
+        finally:
+            os.close(outFd)
+    finally:
+        os.close(inFd)
+
+compressExts = (".gz", ".bz2", ".Z", ".zst", ".lz4")
+
+# magic numbers at start of files, mapped to compression extension
+_compressMagics = (("\x1f\x8b", ".gz"),
+                   ("BZh", ".bz2"),
+                   ("\x1f\x9d", ".Z"),
+                   ("\x28\xb5\x2f\xfd", ".zst"),
+                   ("\x04\x22\x4d\x18", ".lz4"),
+                   ("\x02\x21\x4c\x18", ".lz4"))  # legacy lz4 format
+
+def _getCompressExt(path):
+    "get compression extension of a path, or None"
+    for ext in compressExts:
+        if path.endswith(ext):
+            return ext
+    return None
+
 def isCompressed(path):
     "determine if a file appears to be compressed by extension"
-    return path.endswith(".gz") or path.endswith(".bz2") or path.endswith(".Z")
+    return _getCompressExt(path) is not None
+
+def getCompressFormat(path):
+    """Determine compression of a file, returning the compression extension
+    (one of compressExts) or None if not compressed.  If the path is a
+    regular file, this is determined by the magic number at the start of the
+    file, otherwise by extension, so that FIFOs and devices such as
+    /dev/stdin are not read."""
+    if os.path.isfile(path):
+        try:
+            with open(path, "rb") as fh:
+                return _getCompressFormat(fh)
+        except IOError:
+            pass
+    return _getCompressExt(path)
 
 def compressCmd(path, default="cat"):
     """return the command to compress the path, or default if not compressed, which defaults
@@ -96,35 +237,757 @@ def compressCmd(path, default="cat"):
         return "gzip"
     elif path.endswith(".bz2"):
         return "bzip2"
+    elif path.endswith(".zst"):
+        return "zstd"
+    elif path.endswith(".lz4"):
+        return "lz4"
     else:
         return default
 
 def decompressCmd(path, default="cat"):
     """"return the command to decompress the file to stdout, or default if not compressed, which defaults
-    to the `cat' command, so that it just gets written through"""
-    if path.endswith(".Z") or path.endswith(".gz"):
+    to the `cat' command, so that it just gets written through.  Compression
+    is determined by getCompressFormat()"""
+    compFmt = getCompressFormat(path)
+    if compFmt in (".Z", ".gz"):
         return "zcat"
-    elif path.endswith(".bz2"):
+    elif compFmt == ".bz2":
         return "bzcat"
+    elif compFmt == ".zst":
+        return "zstdcat"
+    elif compFmt == ".lz4":
+        return "lz4cat"
     else:
         return default
 
-def opengz(file, mode="r"):
-    """Transparently open a potentially gzipped file. If mode is writing, infer compression based on
-    mode + file ending."""
+class _ThreadedReader(object):
+    """Read-only file-like object where blocks are read by a background thread
+    into a bounded queue.  The readFunc is called with the block size and
+    returns an empty string on EOF.  This allows I/O or decompression to
+    overlap with parsing, as zlib and file reads release the GIL."""
+
+    def __init__(self, name, readFunc, closeFunc, blockSize=1024*1024, maxBlocks=8):
+        self.name = name
+        self.closeFunc = closeFunc
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.stopping = False
+        self.queue = Queue.Queue(maxBlocks)
+        self.thread = threading.Thread(target=self.__reader, args=(readFunc, blockSize))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __del__(self):
+        try:
+            self.close()
+        except: pass
+
+    def __reader(self, readFunc, blockSize):
+        "thread function, queues blocks, EOF or an exception info tuple"
+        try:
+            while not self.stopping:
+                blk = readFunc(blockSize)
+                self.queue.put(blk)
+                if len(blk) == 0:
+                    break
+        except Exception:
+            self.queue.put(sys.exc_info())
+
+    def __fill(self):
+        "add the next block to the buffer, return False on EOF"
+        if self.eof:
+            return False
+        blk = self.queue.get()
+        if isinstance(blk, tuple):
+            self.eof = True
+            raise blk[0], blk[1], blk[2]
+        if len(blk) == 0:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + blk
+        self.pos = 0
+        return True
+
+    def read(self, size=-1):
+        if size < 0:
+            while self.__fill():
+                pass
+        else:
+            while ((len(self.buf) - self.pos) < size) and self.__fill():
+                pass
+        end = len(self.buf) if size < 0 else self.pos + size
+        data = self.buf[self.pos:end]
+        self.pos += len(data)
+        return data
+
+    def readline(self, size=-1):
+        while True:
+            i = self.buf.find("\n", self.pos)
+            if i >= 0:
+                end = i + 1
+                break
+            if not self.__fill():
+                end = len(self.buf)
+                break
+        if (size >= 0) and (end - self.pos > size):
+            end = self.pos + size
+        line = self.buf[self.pos:end]
+        self.pos = end
+        return line
+
+    def readlines(self, size=-1):
+        return list(self)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line = self.readline()
+        if len(line) == 0:
+            raise StopIteration
+        return line
+
+    def close(self):
+        "stop thread and close"
+        if self.thread is not None:
+            self.stopping = True
+            # drain queue so thread is not blocked
+            while self.thread.isAlive():
+                try:
+                    self.queue.get(True, 0.1)
+                except Queue.Empty:
+                    pass
+            self.thread = None
+            self.closeFunc()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+class ReadAheadReader(_ThreadedReader):
+    """Read-only file-like object that reads large blocks in a background
+    thread into a bounded queue, so that I/O, and decompression for
+    compressed files, overlaps with parsing.  This is useful for network
+    file systems, where small synchronous reads stall.  It can be passed to
+    readers that accept an open file, such as the inFh argument of TsvReader
+    and PslReader, or read_fasta."""
+
+    def __init__(self, fspec, blockSize=4*1024*1024, maxBlocks=8):
+        """fspec is either a file name, which is opened with opengz, or a file
+        object.  In either case, the underlying file is closed on close().
+        Up to maxBlocks of blockSize are read ahead."""
+        if isinstance(fspec, str):
+            fh = opengz(fspec)
+        else:
+            fh = fspec
+        _ThreadedReader.__init__(self, getattr(fh, "name", str(fspec)), fh.read, fh.close, blockSize, maxBlocks)
+
+# decompression methods for opengz
+DECOMPRESS_AUTO = "auto"      # select based on size and available programs
+DECOMPRESS_INPROC = "inproc"  # gzip or bz2 modules
+DECOMPRESS_PIPE = "pipe"      # pigz, zcat, bzcat, zstdcat or lz4cat in a Pipeline
+DECOMPRESS_THREAD = "thread"  # gzip or bz2 modules in a background thread
+
+# minimum compressed size to decompress with a subprocess in auto mode
+autoPipeMinSize = 4 * 1024 * 1024
+
+def _findProg(prog):
+    "find a program on the PATH, None if not found"
+    from pycbio.sys import procOps  # avoid mutual import
+    return procOps.findProg(prog)
+
+def _getCompressFormat(fh):
+    "determine compression format from magic number, returning a file extension or None"
+    magic = fh.read(4)
+    fh.seek(0)
+    for (compMagic, compFmt) in _compressMagics:
+        if magic.startswith(compMagic):
+            return compFmt
+    return None
+
+# formats that can only be handled by external programs
+_pipeOnlyFormats = (".Z", ".zst", ".lz4")
+
+def _pipeDecompressCmd(compFmt):
+    "get command to decompress with a pipe, or None if none are available"
+    if compFmt == ".gz":
+        progs = ("pigz", "zcat")
+    elif compFmt == ".Z":
+        progs = ("zcat",)
+    elif compFmt == ".zst":
+        progs = ("zstdcat",)
+    elif compFmt == ".lz4":
+        progs = ("lz4cat",)
+    else:
+        progs = ("bzcat",)
+    for prog in progs:
+        if _findProg(prog) is not None:
+            return [prog, "-dc"] if prog == "pigz" else [prog]
+    return None
+
+class _PipeReader(object):
+    """Read-only file-like object for a file decompressed by a Pipeline.  The
+    stderr of the decompression program is collected and a failure of the
+    program is reported on close as an IOError, as with the gzip and bz2
+    modules."""
+
+    def __init__(self, file, cmd):
+        self.name = file
+        pipelineMod = _getPipelineMod()
+        self.pl = pipelineMod.Pipeline(cmd, "r", otherEnd=file, stderr=pipelineMod.DataReader())
+
+    def read(self, size=-1):
+        return self.pl.read(size)
+
+    def readline(self, size=-1):
+        return self.pl.readline(size)
+
+    def readlines(self, size=-1):
+        return self.pl.readlines(size)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        return self.pl.next()
+
+    def fileno(self):
+        return self.pl.fileno()
+
+    def close(self):
+        "wait for the decompression program, raising IOError if it failed"
+        if self.pl is not None:
+            pl = self.pl
+            self.pl = None
+            try:
+                pl.close()
+            except _getPipelineMod().ProcException as ex:
+                raise IOError(errno.EIO, "decompression failed: " + str(ex), self.name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+def _selectDecompress(fh, decompress):
+    "determine decompression method for the auto case"
+    if decompress != DECOMPRESS_AUTO:
+        return decompress
+    if os.fstat(fh.fileno()).st_size >= autoPipeMinSize:
+        return DECOMPRESS_PIPE
+    else:
+        return DECOMPRESS_INPROC
+
+def _openInproc(file, f, compFmt):
+    if compFmt == ".gz":
+        return gzip.GzipFile(fileobj=f, mode="rb")
+    else:
+        f.close()
+        return bz2.BZ2File(file, "r")
+
+def _openDecompress(file, f, compFmt, decompress):
+    "open a compressed file for reading with the specified method"
+    if compFmt in _pipeOnlyFormats:
+        f.close()
+        cmd = _pipeDecompressCmd(compFmt)
+        if cmd is None:
+            raise IOError(errno.ENOENT, "can't find decompression program for " + compFmt + " file", file)
+        return _PipeReader(file, cmd)
+    decompress = _selectDecompress(f, decompress)
+    if decompress == DECOMPRESS_PIPE:
+        cmd = _pipeDecompressCmd(compFmt)
+        if cmd is not None:
+            f.close()
+            return _PipeReader(file, cmd)
+        decompress = DECOMPRESS_INPROC
+    cfh = _openInproc(file, f, compFmt)
+    if decompress == DECOMPRESS_THREAD:
+        return _ThreadedReader(file, cfh.read, cfh.close)
+    elif decompress == DECOMPRESS_INPROC:
+        return cfh
+    else:
+        cfh.close()
+        raise ValueError("invalid decompress method: " + str(decompress))
+
+def _gzipMember(data, level, bgzf=False):
+    """compress data into a complete gzip member, optionally with the BGZF
+    extra field containing the block size"""
+    co = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    body = co.compress(data) + co.flush()
+    if not bgzf:
+        header = "\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+    else:
+        # BSIZE is total block size - 1
+        header = ("\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00"
+                  + struct.pack("<H", len(body) + _bgzfOverhead - 1))
+    return header + body + struct.pack("<II", zlib.crc32(data) & 0xffffffff, len(data) & 0xffffffff)
+
+class _CompressJob(object):
+    "block being compressed by _ParallelGzipWriter"
+    __slots__ = ("data", "result", "exceptInfo", "done")
+
+    def __init__(self, data):
+        self.data = data
+        self.result = self.exceptInfo = None
+        self.done = threading.Event()
+
+class _ParallelGzipWriter(object):
+    """Write a gzip file, compressing blocks in multiple threads, as zlib
+    releases the GIL.  Each block is written as a separate gzip member, which
+    is standard gzip, and blocks are written in order by the calling
+    thread."""
+
+    def __init__(self, path, level=9, numThreads=None, blockSize=1024*1024):
+        self.name = path
+        self.level = level
+        self.blockSize = blockSize
+        self.numThreads = numThreads if numThreads is not None else multiprocessing.cpu_count()
+        self.fh = open(path, "wb")
+        self.buf = []
+        self.bufLen = 0
+        self.numBlocks = 0
+        self.pending = collections.deque()
+        self.queue = Queue.Queue()
+        self.threads = [threading.Thread(target=self.__compressor) for i in xrange(self.numThreads)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def __del__(self):
+        try:
+            self.close()
+        except: pass
+
+    def __compressor(self):
+        "thread function"
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            try:
+                job.result = _gzipMember(job.data, self.level)
+            except Exception:
+                job.exceptInfo = sys.exc_info()
+            job.data = None
+            job.done.set()
+
+    def __writeOldest(self):
+        job = self.pending.popleft()
+        job.done.wait()
+        if job.exceptInfo is not None:
+            raise job.exceptInfo[0], job.exceptInfo[1], job.exceptInfo[2]
+        self.fh.write(job.result)
+
+    def __submit(self):
+        job = _CompressJob("".join(self.buf))
+        self.buf = []
+        self.bufLen = 0
+        self.numBlocks += 1
+        self.queue.put(job)
+        self.pending.append(job)
+        while len(self.pending) > 2 * self.numThreads:
+            self.__writeOldest()
+
+    def write(self, data):
+        self.buf.append(data)
+        self.bufLen += len(data)
+        if self.bufLen >= self.blockSize:
+            self.__submit()
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        "compress and write all buffered data"
+        if (self.bufLen > 0) or (self.numBlocks == 0):
+            self.__submit()  # empty file must still have a member
+        while len(self.pending) > 0:
+            self.__writeOldest()
+        self.fh.flush()
+
+    def close(self):
+        if self.threads is not None:
+            try:
+                self.flush()
+            finally:
+                for thread in self.threads:
+                    self.queue.put(None)
+                for thread in self.threads:
+                    thread.join()
+                self.threads = None
+                self.fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+# compression methods for opengz
+COMPRESS_AUTO = "auto"      # thread if there are multiple CPUs, otherwise inproc
+COMPRESS_INPROC = "inproc"  # gzip module
+COMPRESS_PIPE = "pipe"      # pigz or gzip in a Pipeline
+COMPRESS_THREAD = "thread"  # compress blocks in multiple threads
+
+_gzipDefaultLevel = 9
+
+def _pipeCompressCmd(path, level, numThreads):
+    """get command to compress with a pipe, using pigz if available for gzip.
+    If level is None, zstd and lz4 use their default level."""
+    if path.endswith(".zst"):
+        cmd = ["zstd", "-q"]
+        if numThreads is not None:
+            cmd.append("-T" + str(numThreads))
+    elif path.endswith(".lz4"):
+        cmd = ["lz4", "-q"]
+    elif _findProg("pigz") is not None:
+        cmd = ["pigz"]
+        if numThreads is not None:
+            cmd.extend(["-p", str(numThreads)])
+    else:
+        cmd = [compressCmd(path)]
+        if level is None:
+            level = _gzipDefaultLevel
+    if level is not None:
+        cmd.append("-" + str(level))
+    return cmd
+
+def _openCompress(file, compress, compressLevel, compressThreads):
+    "open a gzip, zstd, or lz4 file for writing with the specified method"
+    if file.endswith(".zst") or file.endswith(".lz4"):
+        return _getPipelineClass()(_pipeCompressCmd(file, compressLevel, compressThreads), "w", otherEnd=file)
+    if compress == COMPRESS_AUTO:
+        compress = COMPRESS_THREAD if multiprocessing.cpu_count() > 1 else COMPRESS_INPROC
+    if compressLevel is None:
+        compressLevel = _gzipDefaultLevel
+    if compress == COMPRESS_INPROC:
+        return gzip.open(file, 'wb', compressLevel)
+    elif compress == COMPRESS_THREAD:
+        return _ParallelGzipWriter(file, compressLevel, compressThreads)
+    elif compress == COMPRESS_PIPE:
+        return _getPipelineClass()(_pipeCompressCmd(".gz", compressLevel, compressThreads), "w", otherEnd=file)
+    else:
+        raise ValueError("invalid compress method: " + str(compress))
+
+def opengz(file, mode="r", decompress=DECOMPRESS_INPROC, compress=COMPRESS_INPROC, compressLevel=None, compressThreads=None):
+    """Transparently open a potentially gzip, bzip2, zstd, or lz4 compressed
+    file. If mode is writing, infer compression based on mode + file ending.
+    When reading, compression is detected by magic number.  Compress (.Z),
+    zstd and lz4 files are always read and written using a Pipeline running
+    zcat, zstd, or lz4, for gzip and bzip2, decompress selects the method,
+    defaulting to inproc:
+       - DECOMPRESS_INPROC - use the gzip or bz2 modules.
+       - DECOMPRESS_PIPE - use pigz or zcat/bzcat in a Pipeline, falling back
+         to inproc if the programs are not found.  A failure of the program
+         is reported as an IOError when the file is closed.
+       - DECOMPRESS_THREAD - use the gzip or bz2 modules in a background
+         thread.
+       - DECOMPRESS_AUTO - use pipe for files of at least autoPipeMinSize,
+         otherwise inproc.
+    When writing gzip files, compress selects the method, defaulting to
+    inproc, as the other methods use a thread or process per CPU for each
+    open file:
+       - COMPRESS_INPROC - use the gzip module.
+       - COMPRESS_PIPE - use pigz, or gzip if not found, in a Pipeline.
+       - COMPRESS_THREAD - compress blocks in parallel threads.
+       - COMPRESS_AUTO - use thread if there are multiple CPUs, otherwise
+         inproc.
+    compressLevel is the compression level, defaulting to 9 for gzip and the
+    program's default for zstd and lz4.  compressThreads is the
+    number of threads for the thread and pipe methods, defaulting to the
+    number of CPUs.  All methods produce standard gzip files.
+    """
     assert mode in ['r', 'rb', 'a', 'ab', 'w', 'wb']
-    if mode == 'wb' or (mode == 'w' and file.endswith('.gz')):
-        return gzip.open(file, 'wb')
+    if mode == 'wb' or (mode == 'w' and (file.endswith('.gz') or file.endswith('.zst') or file.endswith('.lz4'))):
+        return _openCompress(file, compress, compressLevel, compressThreads)
     elif mode == 'w':
         return open(file, 'w')
     f = open(file, 'rb')
-    if f.read(2) == '\x1f\x8b':
-        f.seek(0)
+    compFmt = _getCompressFormat(f)
+    if (compFmt == ".gz") and (mode not in ('r', 'rb')):
         return gzip.GzipFile(fileobj=f, mode=mode)
+    elif compFmt is not None:
+        return _openDecompress(file, f, compFmt, decompress)
     else:
         f.close()
         return open(file, mode)
 
+# buffer size used when reading record output from a pipeline
+pipeReadBufSize = 1024 * 1024
+
+def openInput(src):
+    """Open input for record readers.  The src is either a file name, opened
+    with opengz(), a list of commands, as with Pipeline, whose output is read,
+    or an existing read Pipeline object, which is returned as-is.  Closing the
+    resulting Pipeline waits for the processes and raises an exception if
+    one failed."""
+    pipelineCls = _getPipelineClass()
+    if isinstance(src, pipelineCls):
+        if src.mode != "r":
+            raise ValueError("Pipeline must be opened for read: " + str(src))
+        return src
+    elif isinstance(src, (list, tuple)):
+        return pipelineCls(src, "r", bufSize=pipeReadBufSize)
+    else:
+        return opengz(src)
+
+
+# BGZF (blocked gzip) format, as defined in the SAM specification.  Each
+# block is a gzip member with an extra field containing the compressed size of
+# the block.  Virtual offsets are (compressed block offset << 16) | offset in
+# uncompressed block.
+_bgzfOverhead = 26  # header and trailer bytes in a block
+_bgzfMaxBlockData = 0xff00  # maximum uncompressed data per block, as in htslib
+_bgzfEofBlock = ("\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00\x1b\x00"
+                 "\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00")
+
+class BgzfException(Exception):
+    "error reading a BGZF file"
+    pass
+
+def bgzfVirtualOffset(blockOffset, dataOffset):
+    "construct a BGZF virtual offset"
+    return (blockOffset << 16) | dataOffset
+
+def _readBgzfBlock(fh, blockOffset):
+    """Read the BGZF block at the specified compressed offset, return
+    (data, nextBlockOffset), or (None, None) at EOF"""
+    fh.seek(blockOffset)
+    header = fh.read(12)
+    if len(header) == 0:
+        return (None, None)
+    if (len(header) < 12) or (header[0:4] != "\x1f\x8b\x08\x04"):
+        raise BgzfException("%s: invalid BGZF block header at offset %d" % (fh.name, blockOffset))
+    xlen = struct.unpack("<H", header[10:12])[0]
+    extra = fh.read(xlen)
+    bsize = None
+    i = 0
+    while i + 4 <= len(extra):
+        slen = struct.unpack("<H", extra[i+2:i+4])[0]
+        if (extra[i:i+2] == "BC") and (slen == 2):
+            bsize = struct.unpack("<H", extra[i+4:i+6])[0]
+        i += 4 + slen
+    if bsize is None:
+        raise BgzfException("%s: block at offset %d does not have BGZF BC field" % (fh.name, blockOffset))
+    cdata = fh.read(bsize - xlen - 19)
+    (crc, isize) = struct.unpack("<II", fh.read(8))
+    data = zlib.decompress(cdata, -zlib.MAX_WBITS)
+    if (len(data) != isize) or ((zlib.crc32(data) & 0xffffffff) != crc):
+        raise BgzfException("%s: corrupt BGZF block at offset %d" % (fh.name, blockOffset))
+    return (data, blockOffset + bsize + 1)
+
+def isBgzf(path):
+    "check if a file is BGZF format by examining the first block header"
+    with open(path, "rb") as fh:
+        header = fh.read(16)
+    return (len(header) == 16) and header.startswith("\x1f\x8b\x08\x04") and (header[12:14] == "BC")
+
+class BgzfWriter(object):
+    """Write a BGZF file.  The tell() method returns the virtual offset
+    of the next data to be written, which can be saved in an index to allow
+    random access with BgzfReader."""
+
+    def __init__(self, path, compressLevel=6):
+        self.name = path
+        self.compressLevel = compressLevel
+        self.fh = open(path, "wb")
+        self.buf = []
+        self.bufLen = 0
+
+    def __del__(self):
+        try:
+            self.close()
+        except: pass
+
+    def __writeBlock(self, data):
+        self.fh.write(_gzipMember(data, self.compressLevel, bgzf=True))
+
+    def write(self, data):
+        self.buf.append(data)
+        self.bufLen += len(data)
+        if self.bufLen >= _bgzfMaxBlockData:
+            data = "".join(self.buf)
+            while len(data) >= _bgzfMaxBlockData:
+                self.__writeBlock(data[0:_bgzfMaxBlockData])
+                data = data[_bgzfMaxBlockData:]
+            self.buf = [data]
+            self.bufLen = len(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def tell(self):
+        "get virtual offset of next data to write"
+        return bgzfVirtualOffset(self.fh.tell(), self.bufLen)
+
+    def flush(self):
+        "write a partial block, if data is buffered"
+        if self.bufLen > 0:
+            self.__writeBlock("".join(self.buf))
+            self.buf = []
+            self.bufLen = 0
+        self.fh.flush()
+
+    def close(self):
+        "flush and add the EOF marker block"
+        if self.fh is not None:
+            try:
+                self.flush()
+                self.fh.write(_bgzfEofBlock)
+            finally:
+                self.fh.close()
+                self.fh = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+class BgzfReader(object):
+    """Read a BGZF file, with support for seeking to virtual offsets.
+    The tell() method returns the virtual offset of the next data to read."""
+
+    def __init__(self, path):
+        self.name = path
+        self.fh = open(path, "rb")
+        self.blockOffset = None
+        self.nextBlockOffset = 0
+        self.data = ""
+        self.pos = 0
+
+    def __del__(self):
+        try:
+            self.close()
+        except: pass
+
+    def close(self):
+        if self.fh is not None:
+            self.fh.close()
+            self.fh = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __loadBlock(self, blockOffset):
+        "load a block, return False on EOF"
+        (data, nextBlockOffset) = _readBgzfBlock(self.fh, blockOffset)
+        if data is None:
+            return False
+        self.blockOffset = blockOffset
+        self.nextBlockOffset = nextBlockOffset
+        self.data = data
+        self.pos = 0
+        return True
+
+    def __nextData(self):
+        "advance to next block with data if needed, return False on EOF"
+        while self.pos >= len(self.data):
+            if not self.__loadBlock(self.nextBlockOffset):
+                return False
+        return True
+
+    def seek(self, virtualOffset):
+        "seek to a virtual offset"
+        blockOffset = virtualOffset >> 16
+        if blockOffset != self.blockOffset:
+            if not self.__loadBlock(blockOffset):
+                raise BgzfException("%s: seek past EOF to virtual offset %d" % (self.name, virtualOffset))
+        self.pos = virtualOffset & 0xffff
+        if self.pos > len(self.data):
+            raise BgzfException("%s: invalid virtual offset %d" % (self.name, virtualOffset))
+
+    def tell(self):
+        "get virtual offset of next data to read"
+        if self.blockOffset is None:
+            return 0
+        elif self.pos >= len(self.data):
+            return bgzfVirtualOffset(self.nextBlockOffset, 0)  # at end of block
+        else:
+            return bgzfVirtualOffset(self.blockOffset, self.pos)
+
+    def read(self, size=-1):
+        parts = []
+        while ((size < 0) or (size > 0)) and self.__nextData():
+            end = len(self.data) if size < 0 else min(self.pos + size, len(self.data))
+            parts.append(self.data[self.pos:end])
+            if size > 0:
+                size -= end - self.pos
+            self.pos = end
+        return "".join(parts)
+
+    def readline(self):
+        parts = []
+        while self.__nextData():
+            i = self.data.find("\n", self.pos)
+            end = len(self.data) if i < 0 else i + 1
+            parts.append(self.data[self.pos:end])
+            self.pos = end
+            if i >= 0:
+                break
+        return "".join(parts)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line = self.readline()
+        if len(line) == 0:
+            raise StopIteration
+        return line
+
+def bgzfBlockOffsets(path):
+    "generator over the compressed offsets of the data blocks in a BGZF file"
+    with open(path, "rb") as fh:
+        blockOffset = 0
+        while True:
+            (data, nextBlockOffset) = _readBgzfBlock(fh, blockOffset)
+            if data is None:
+                break
+            if len(data) > 0:
+                yield blockOffset
+            blockOffset = nextBlockOffset
+
+def bgzfLineAlignedRanges(path, numRanges):
+    """Split a BGZF file into up to numRanges ranges of approximately equal
+    compressed size that start at the beginning of a line.  Returns a list of
+    (startVirtualOffset, endVirtualOffset) tuples, with the last end being
+    None to indicate EOF.  A reader seeks to the start and reads lines while
+    tell() is less than the end."""
+    blockOffsets = list(bgzfBlockOffsets(path))
+    if len(blockOffsets) == 0:
+        return []
+    rangeSize = max(os.path.getsize(path) // max(numRanges, 1), 1)
+    bounds = [0]
+    with open(path, "rb") as fh:
+        nextSplit = rangeSize
+        for i in xrange(1, len(blockOffsets)):
+            if blockOffsets[i] < nextSplit:
+                continue
+            # find the start of the first line in this block from the
+            # last newline in the previous block
+            prevData = _readBgzfBlock(fh, blockOffsets[i-1])[0]
+            j = prevData.rfind("\n")
+            if j < 0:
+                continue  # no line start
+            elif j == len(prevData) - 1:
+                bound = bgzfVirtualOffset(blockOffsets[i], 0)
+            else:
+                bound = bgzfVirtualOffset(blockOffsets[i-1], j + 1)
+            if bound > bounds[-1]:
+                bounds.append(bound)
+                nextSplit = blockOffsets[i] + rangeSize
+    bounds.append(None)
+    return [(bounds[i], bounds[i+1]) for i in xrange(len(bounds)-1)]
 
 # FIXME: make these consistent and remove redundant code.  Maybe use
 # keyword for flush
@@ -203,34 +1066,18 @@ def prStrs(fh, *objs):
 def prRow(fh, row):
     """Print a row (list or tupe) to a tab file.
     Does string conversion on each columns"""
-    first = True
-    for col in row:
-        if not first:
-            fh.write("\t")
-        fh.write(str(col))
-        first = False
-    fh.write("\n")
+    fh.write("\t".join([str(col) for col in row]) + "\n")
 
 def prRowv(fh, *objs):
     """Print a row from each argument to a tab file.
     Does string conversion on each columns"""
-    first = True
-    for col in objs:
-        if not first:
-            fh.write("\t")
-        fh.write(str(col))
-        first = False
-    fh.write("\n")
+    prRow(fh, objs)
 
 def readFileLines(fname):
     "read lines from a file into a list, removing the newlines"
-    fh = opengz(fname)
     lines = []
-    for l in fh:
-        if l[-1:] == "\n":
-            l = l[:-1]
-        lines.append(l)
-    fh.close()
+    for batch in iterLineBatches(fname):
+        lines.extend(batch)
     return lines
 
 def readLine(fh):
@@ -242,39 +1089,269 @@ def readLine(fh):
         l = l[:-1]
     return l
 
-def iterLines(fspec, skipLines=0):
-    """generator over lines in file, dropping newlines.  If fspec is a string,
-    open the file and close at end. Otherwise it is file-like object and will
-    not be closed."""
+# size of blocks read by line iterators
+lineBufSize = 64*1024
+
+def _iterLineBlocks(fh, bufSize):
+    """generator over lists of lines, without newlines, from reading blocks of
+    bufSize from a file-like object"""
+    partial = ""
+    while True:
+        buf = fh.read(bufSize)
+        if len(buf) == 0:
+            break
+        lines = buf.split("\n")
+        lines[0] = partial + lines[0]
+        partial = lines.pop()
+        if len(lines) > 0:
+            yield lines
+    if len(partial) > 0:
+        yield [partial]
+
+def iterLineBatches(fspec, skipLines=0, bufSize=lineBufSize):
+    """generator over batches of lines in file, dropping newlines.  Each batch
+    is a list of the lines from reading a block of about bufSize.  If fspec is
+    a string, open the file and close at end. Otherwise it is file-like object
+    and will not be closed, however data past the last line returned maybe
+    have been read."""
     if isinstance(fspec, str):
         fh = opengz(fspec)
     else:
         fh = fspec
     try:
-        _ = [fh.next() for _ in range(skipLines)]
-        for line in fh:
-            yield line[:-1]
+        for lines in _iterLineBlocks(fh, bufSize):
+            if skipLines > 0:
+                n = min(skipLines, len(lines))
+                skipLines -= n
+                lines = lines[n:]
+                if len(lines) == 0:
+                    continue
+            yield lines
     finally:
         if isinstance(fspec, str):
             fh.close()
 
-def iterRows(fspec, skipLines=0, skipComments=True):
+def _iterFileLines(fh, skipLines):
+    """generator over lines, without newlines, read one at a time from a
+    file-like object, so that the file is not read past the last line returned"""
+    for line in iter(fh.readline, ""):
+        if skipLines > 0:
+            skipLines -= 1
+        else:
+            yield line[:-1] if line.endswith("\n") else line
+
+def iterLines(fspec, skipLines=0, bufSize=lineBufSize):
+    """generator over lines in file, dropping newlines.  If fspec is a string,
+    open the file, read it in blocks of bufSize, and close at end. Otherwise it
+    is file-like object that is read a line at a time and will not be closed,
+    so the caller may continue reading it.  See iterLineBatches."""
+    if not isinstance(fspec, str):
+        for line in _iterFileLines(fspec, skipLines):
+            yield line
+        return
+    for lines in iterLineBatches(fspec, skipLines, bufSize):
+        for line in lines:
+            yield line
+
+def iterRowBatches(fspec, skipLines=0, skipComments=True, bufSize=lineBufSize):
+    """generator over batches of rows in a tab-separated file.  Each line of the
+    file is parsed, split into columns, and a list of rows for each block read
+    is returned.  Lines starting with # are skipped if skipComments is True.
+    See iterLineBatches for other arguments."""
+    for lines in iterLineBatches(fspec, skipLines, bufSize):
+        if skipComments:
+            rows = [line.split("\t") for line in lines if not line.startswith('#')]
+        else:
+            rows = [line.split("\t") for line in lines]
+        if len(rows) > 0:
+            yield rows
+
+def iterRows(fspec, skipLines=0, skipComments=True, bufSize=lineBufSize):
     """generator over rows in a tab-separated file.  Each line of the file is
     parsed, split into columns and returned.  If fspec is a string, open the
     file and close at end. Otherwise it is file-like object and will not be
-    closed."""
+    closed.  As with iterLines, only file names are read in blocks.  See
+    iterRowBatches."""
+    # split each line as it is returned rather than using iterRowBatches,
+    # as holding a block of split rows is slower than reusing the memory
     if isinstance(fspec, str):
-        fh = opengz(fspec)
+        batches = iterLineBatches(fspec, skipLines, bufSize)
     else:
-        fh = fspec
-    try:
-        _ = [fh.next() for _ in range(skipLines)]
-        for line in fh:
-            if not line.startswith('#'):
-                yield line[0:-1].split("\t")
-    finally:
-        if isinstance(fspec, str):
-            fh.close()
+        batches = [_iterFileLines(fspec, skipLines)]
+    for lines in batches:
+        for line in lines:
+            if not (skipComments and line.startswith('#')):
+                yield line.split("\t")
+
+def lineAlignedRanges(path, numRanges, startOff=0):
+    """Split an uncompressed file into up to numRanges byte ranges of
+    approximately equal size, with each range adjusted to start at the
+    beginning of a line.  Ranges start at startOff, which must be the start of
+    a line.  Returns a list of (start, end) tuples, empty ranges are not
+    included."""
+    fileSize = os.path.getsize(path)
+    rangeSize = max((fileSize - startOff) // max(numRanges, 1), 1)
+    bounds = [startOff]
+    with open(path, "rb") as fh:
+        while bounds[-1] < fileSize:
+            off = bounds[-1] + rangeSize
+            if off >= fileSize:
+                break
+            fh.seek(off - 1)
+            fh.readline()  # advance to start of next line
+            off = fh.tell()
+            if off >= fileSize:
+                break
+            bounds.append(off)
+    bounds.append(fileSize)
+    return [(bounds[i], bounds[i+1]) for i in xrange(len(bounds)-1) if bounds[i] < bounds[i+1]]
+
+lineIndexExt = ".lineidx"
+_lineIndexHdr = struct.Struct("=8sqdi")  # magic, file size, mtime, offset size
+_lineIndexMagic = "lineIdx1"
+
+# size of blocks of a mmaped file scanned for line starts
+_lineScanBlockSize = 4 * 1024 * 1024
+
+def _buildLineOffsets(mm, fileSize, blockSize=_lineScanBlockSize):
+    """scan a mmaped file for line starts, including end of file as the last
+    entry.  The file is split into lines a block at a time, rather than
+    searching the mmap for each newline."""
+    offsets = array.array("l", [0])
+    append = offsets.append
+    for blockStart in xrange(0, fileSize, blockSize):
+        lines = mm[blockStart:blockStart + blockSize].split("\n")
+        lines.pop()  # part of a line, continued in the next block
+        pos = blockStart
+        for line in lines:
+            pos += len(line) + 1
+            append(pos)
+    if offsets[-1] != fileSize:
+        append(fileSize)  # last line without newline
+    return offsets
+
+class LineIndex(object):
+    """Index of the starting offsets of lines of an uncompressed file, with
+    the file memory mapped, providing random access to lines by number.  The
+    index is cached in a sidecar file, path + lineIndexExt, and reused if the
+    size and modification time of the file have not changed.  Failure to
+    write the sidecar, such as for a read-only directory, is not an error.
+    Lines are returned without the newline."""
+
+    def __init__(self, path, useCache=True):
+        self.path = path
+        self.cacheFile = path + lineIndexExt
+        self.fh = open(path, "rb")
+        st = os.fstat(self.fh.fileno())
+        self.fileSize = st.st_size
+        # mmap of an empty file fails
+        self.mm = mmap.mmap(self.fh.fileno(), 0, access=mmap.ACCESS_READ) if self.fileSize > 0 else ""
+        self.offsets = self.__readCache(st) if useCache else None
+        if self.offsets is None:
+            self.offsets = _buildLineOffsets(self.mm, self.fileSize)
+            if useCache:
+                self.__writeCache(st)
+
+    def __del__(self):
+        try:
+            self.close()
+        except: pass
+
+    def close(self):
+        if self.fh is not None:
+            if self.fileSize > 0:
+                self.mm.close()
+            self.mm = None
+            self.fh.close()
+            self.fh = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __readCache(self, st):
+        "read cached index, return None if it doesn't exist or is out of date"
+        try:
+            with open(self.cacheFile, "rb") as fh:
+                hdr = fh.read(_lineIndexHdr.size)
+                if len(hdr) != _lineIndexHdr.size:
+                    return None
+                (magic, fileSize, mtime, itemSize) = _lineIndexHdr.unpack(hdr)
+                offsets = array.array("l")
+                if ((magic != _lineIndexMagic) or (fileSize != st.st_size) or (mtime != st.st_mtime)
+                    or (itemSize != offsets.itemsize)):
+                    return None
+                offsets.fromstring(fh.read())
+        except IOError:
+            return None
+        if (len(offsets) == 0) or (offsets[-1] != self.fileSize):
+            return None
+        return offsets
+
+    def __writeCache(self, st):
+        try:
+            tmpFile = atomicTmpFile(self.cacheFile)
+            with open(tmpFile, "wb") as fh:
+                fh.write(_lineIndexHdr.pack(_lineIndexMagic, st.st_size, st.st_mtime, self.offsets.itemsize))
+                self.offsets.tofile(fh)
+            atomicInstall(tmpFile, self.cacheFile)
+        except (IOError, OSError):
+            pass
+
+    def __len__(self):
+        "number of lines"
+        return len(self.offsets) - 1
+
+    def getOffset(self, lineNum):
+        "get byte offset of the start of a line"
+        if not (0 <= lineNum < len(self.offsets) - 1):
+            raise IndexError("line number out of range: " + str(lineNum))
+        return self.offsets[lineNum]
+
+    def __getitem__(self, lineNum):
+        "get a line by number, without newline"
+        start = self.getOffset(lineNum)
+        end = self.offsets[lineNum + 1]
+        if (end > start) and (self.mm[end - 1] == "\n"):
+            end -= 1
+        return self.mm[start:end]
+
+    def getLineNum(self, offset):
+        """get the number of the line containing a byte offset, such as to
+        resume a scan from the last offset processed"""
+        if not (0 <= offset < self.fileSize):
+            raise IndexError("offset out of range: " + str(offset))
+        return bisect.bisect_right(self.offsets, offset) - 1
+
+    def iterLines(self, startLine=0, endLine=None):
+        "generator over lines in the range [startLine, endLine)"
+        if endLine is None:
+            endLine = len(self)
+        for lineNum in xrange(startLine, endLine):
+            yield self[lineNum]
+
+    def lineRanges(self, numRanges, startLine=0):
+        """Split lines into up to numRanges (startLine, endLine) ranges with
+        approximately equal numbers of bytes.  Empty ranges are not
+        included."""
+        offsets = self.offsets
+        numLines = len(self)
+        startOff = offsets[startLine] if startLine < numLines else self.fileSize
+        rangeSize = max((self.fileSize - startOff) // max(numRanges, 1), 1)
+        bounds = [startLine]
+        for i in xrange(1, numRanges):
+            lineNum = bisect.bisect_left(offsets, startOff + i * rangeSize, bounds[-1], numLines)
+            if lineNum > bounds[-1]:
+                bounds.append(lineNum)
+        bounds.append(numLines)
+        return [(bounds[i], bounds[i+1]) for i in xrange(len(bounds)-1) if bounds[i] < bounds[i+1]]
+
+    def byteRanges(self, numRanges, startLine=0):
+        """Split the file into up to numRanges (start, end) byte ranges that
+        start on line boundaries, as with lineAlignedRanges()."""
+        return [(self.offsets[s], self.offsets[e]) for s, e in self.lineRanges(numRanges, startLine)]
 
 __tmpFileCnt = 0
 def tmpFileGet(prefix=None, suffix="tmp", tmpDir=None):
@@ -316,9 +1393,283 @@ def atomicInstall(tmpPath, finalPath):
         os.rename(tmp, finalPath)
         os.remove(tmpPath)
 
+class AtomicOutputSet(object):
+    """Set of output files that are written to temporary files and atomically
+    installed, or removed, together.  This is intended for jobs creating
+    many outputs, such as shards.  Temporary files are in the same directory
+    as the final file, with unique names constructed from the host, process
+    id, and a counter, and created exclusively, so no existence checks are
+    needed.  Output files are opened with large buffers.  Files ending in
+    .gz, .zst or .lz4 are compressed with opengz, with gzip compressed in
+    the calling thread; other compressed extensions are an error.  The methods are
+    thread-safe, so a set can be shared by exrun task threads.
+
+    When used with a with statement, the outputs are committed if no
+    exception occurs, otherwise they are rolled back.
+    """
+    _cntLock = threading.Lock()
+    _cnt = 0
+
+    def __init__(self, bufSize=1024*1024):
+        self.bufSize = bufSize
+        self.lock = threading.Lock()
+        self.outputs = collections.OrderedDict()  # final path -> (tmpPath, fh)
+        self.tmpPre = "." + socket.gethostname() + "." + str(os.getpid()) + "."
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+    @classmethod
+    def __nextCnt(cls):
+        with cls._cntLock:
+            cls._cnt += 1
+            return cls._cnt
+
+    _writeCompressExts = (".gz", ".zst", ".lz4")
+
+    @classmethod
+    def __getOutputCompressExt(cls, path):
+        "get compression extension for an output, error if it can't be written"
+        ext = _getCompressExt(path)
+        if (ext is not None) and (ext not in cls._writeCompressExts):
+            raise ValueError("writing " + ext + " compressed files is not supported: " + path)
+        return ext
+
+    def __getTmpPath(self, path, ext):
+        return path + self.tmpPre + str(self.__nextCnt()) + ".tmp" + ("" if ext is None else ext)
+
+    def __openTmp(self, tmpPath, ext):
+        fd = os.open(tmpPath, os.O_WRONLY|os.O_CREAT|os.O_EXCL, 0666)
+        if ext is not None:
+            os.close(fd)  # name is now reserved
+            try:
+                return opengz(tmpPath, "w", compress=COMPRESS_INPROC)
+            except:
+                os.unlink(tmpPath)
+                raise
+        else:
+            return os.fdopen(fd, "w", self.bufSize)
+
+    def open(self, path):
+        """open an output file, returning a file object for writing.  The
+        file object should not be closed by the caller."""
+        with self.lock:
+            if path in self.outputs:
+                raise Exception("output already opened in AtomicOutputSet: " + path)
+            ext = self.__getOutputCompressExt(path)
+            tmpPath = self.__getTmpPath(path, ext)
+            fh = self.__openTmp(tmpPath, ext)
+            self.outputs[path] = (tmpPath, fh)
+            return fh
+
+    def getTmpPath(self, path):
+        "get the temporary file being written for path"
+        with self.lock:
+            return self.outputs[path][0]
+
+    def __closeAll(self):
+        "close all files, return first exception info or None"
+        exInfo = None
+        for (tmpPath, fh) in self.outputs.itervalues():
+            try:
+                if fh is not None:
+                    fh.close()
+            except Exception:
+                if exInfo is None:
+                    exInfo = sys.exc_info()
+        return exInfo
+
+    def __removeAll(self):
+        for (tmpPath, fh) in self.outputs.itervalues():
+            try:
+                os.unlink(tmpPath)
+            except OSError:
+                pass
+        self.outputs.clear()
+
+    def commit(self):
+        """Close all outputs and install them as the final files.  If any file
+        fails to close, all files are removed and the error is raised."""
+        with self.lock:
+            exInfo = self.__closeAll()
+            if exInfo is not None:
+                self.__removeAll()
+                raise exInfo[0], exInfo[1], exInfo[2]
+            for (path, (tmpPath, fh)) in self.outputs.iteritems():
+                atomicInstall(tmpPath, path)
+            self.outputs.clear()
+
+    def rollback(self):
+        "close and remove all outputs, without installing them"
+        with self.lock:
+            self.__closeAll()
+            self.__removeAll()
+
+def hashShardKey(name, numShards):
+    "get a shard number for a name, stable across runs and processes"
+    return (zlib.crc32(name) & 0xffffffff) % numShards
+
+class _Shard(object):
+    "one output of ShardedWriter"
+    __slots__ = ("key", "path", "buf", "bufLen", "count", "fh", "created")
+
+    def __init__(self, key, path):
+        self.key = key
+        self.path = path
+        self.buf = []
+        self.bufLen = 0
+        self.count = 0
+        self.fh = None
+        self.created = False
+
+class ShardedWriter(object):
+    """Write records to multiple output files, or shards, selected by a key,
+    such as a chromosome name or a hashed name from hashShardKey().  Records
+    are buffered per shard and written when the buffer exceeds bufSize, or
+    all buffers are written when their total exceeds maxBuffered, which
+    bounds memory use with many shards.  A least-recently-used set of at most maxOpen file handles is kept, with
+    shards reopened for append as needed, so the number of shards is not
+    limited by the maximum number of open files.  Shard files ending in .gz are compressed, with each
+    buffer written as a gzip member; other compression formats are not
+    supported.  If manifestPath is specified, a TSV file of key, path, and
+    record count for each shard is written on close.  When used in a with
+    statement, the manifest is not written if an exception occurs, as the
+    shards are incomplete.
+    """
+    def __init__(self, shardPath, maxOpen=None, bufSize=256*1024, header=None,
+                 manifestPath=None, compressLevel=6, maxBuffered=64*1024*1024):
+        """shardPath is either a function that takes the key and returns the
+        path to the shard, or a string that is formatted with
+        shardPath.format(key=key).  If header is not None, it is written at the
+        start of each shard, a newline is added if needed.  maxOpen defaults
+        to half of pipeline.MAXFD.  Shard directories are created as needed."""
+        self.shardPath = shardPath
+        self.maxOpen = max(maxOpen if maxOpen is not None else _getPipelineMod().MAXFD // 2, 1)
+        self.bufSize = bufSize
+        self.maxBuffered = maxBuffered
+        self.bufferedBytes = 0  # total in all shard buffers
+        self.header = header
+        if (header is not None) and not header.endswith("\n"):
+            self.header += "\n"
+        self.manifestPath = manifestPath
+        self.compressLevel = compressLevel
+        self.shards = collections.OrderedDict()  # key -> _Shard, in order created
+        self.openShards = collections.OrderedDict()  # LRU of shards with open handles
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close(writeManifest=(type is None))
+
+    def __getShardPath(self, key):
+        if callable(self.shardPath):
+            return self.shardPath(key)
+        else:
+            return self.shardPath.format(key=key)
+
+    def __getShard(self, key):
+        shard = self.shards.get(key)
+        if shard is None:
+            path = self.__getShardPath(key)
+            if isCompressed(path) and not path.endswith(".gz"):
+                raise ValueError("only gzip compression is supported for shards: " + path)
+            shard = self.shards[key] = _Shard(key, path)
+            if self.header is not None:
+                shard.buf.append(self.header)
+                shard.bufLen += len(self.header)
+                self.bufferedBytes += len(self.header)
+        return shard
+
+    def __getHandle(self, shard):
+        "get open file for shard, managing LRU"
+        if shard.fh is not None:
+            del self.openShards[shard.key]
+        else:
+            while len(self.openShards) >= self.maxOpen:
+                oldShard = self.openShards.popitem(last=False)[1]
+                oldShard.fh.close()
+                oldShard.fh = None
+            if not shard.created:
+                ensureFileDir(shard.path)
+            shard.fh = open(shard.path, "ab" if shard.created else "wb")
+            shard.created = True
+        self.openShards[shard.key] = shard
+        return shard.fh
+
+    def __flushShard(self, shard):
+        if shard.bufLen > 0:
+            data = "".join(shard.buf)
+            if shard.path.endswith(".gz"):
+                data = _gzipMember(data, self.compressLevel)
+            self.__getHandle(shard).write(data)
+            self.bufferedBytes -= shard.bufLen
+            shard.buf = []
+            shard.bufLen = 0
+
+    def write(self, key, line):
+        "write a line, without a newline, to the shard for key"
+        shard = self.__getShard(key)
+        shard.buf.append(line + "\n")
+        shard.bufLen += len(line) + 1
+        self.bufferedBytes += len(line) + 1
+        shard.count += 1
+        if shard.bufLen >= self.bufSize:
+            self.__flushShard(shard)
+        elif self.bufferedBytes >= self.maxBuffered:
+            self.__flushBuffers()
+
+    def writeRow(self, key, row):
+        "write a row of columns to the shard for key, converting columns with str()"
+        self.write(key, "\t".join([str(c) for c in row]))
+
+    def __flushBuffers(self):
+        for shard in self.shards.itervalues():
+            self.__flushShard(shard)
+
+    def flush(self):
+        "write all buffered data"
+        self.__flushBuffers()
+        for shard in self.openShards.itervalues():
+            shard.fh.flush()
+
+    def getShards(self):
+        "get a list of (key, path, count) for the shards"
+        return [(shard.key, shard.path, shard.count) for shard in self.shards.itervalues()]
+
+    def writeManifest(self, manifestPath):
+        "write a TSV file with the key, path, and record count of each shard"
+        fh = open(manifestPath, "w")
+        try:
+            prRowv(fh, "key", "path", "count")
+            for row in self.getShards():
+                prRow(fh, row)
+        finally:
+            fh.close()
+
+    def close(self, writeManifest=True):
+        """flush and close all shards, writing the manifest if requested and
+        writeManifest is True"""
+        if not self.closed:
+            self.flush()
+            for shard in self.openShards.itervalues():
+                shard.fh.close()
+                shard.fh = None
+            self.openShards.clear()
+            self.closed = True
+            if writeManifest and (self.manifestPath is not None):
+                self.writeManifest(self.manifestPath)
+
 def uncompressedBase(path):
     "return the file path, removing a compression extension if it exists"
-    if path.endswith(".gz") or path.endswith(".bz2") or path.endswith(".Z"):
+    if isCompressed(path):
         return os.path.splitext(path)[0]
     else:
         return path
@@ -3,6 +3,7 @@
 Process pipelines constructed as a DAG.
 """
 import os, sys, fcntl, stat, signal, socket, errno, threading, traceback, pickle, time
+import collections, multiprocessing, Queue
 from pycbio.sys import strOps, trace, PycbioException, fifo
 
 # FIXME:
@@ -23,6 +24,119 @@ try:
 except:
     MAXFD = 256
 
+def _getOpenFds():
+    """get list of open file descriptors from /proc or /dev/fd, or None if
+    they can't be listed.  This includes the closed descriptor used for the
+    listing."""
+    for fdDir in ("/proc/self/fd", "/dev/fd"):
+        try:
+            return [int(fd) for fd in os.listdir(fdDir)]
+        except OSError:
+            pass
+    return None
+
+class _Spawner(object):
+    """Start processes with posix_spawnp(3), which is accessed through
+    ctypes, as it is not available in Python 2.  The GNU C library implements
+    this with vfork semantics, avoiding the cost of copying the page tables
+    of a large parent process that fork has.  Only used with versions of
+    the library that have posix_spawn_file_actions_addclosefrom_np (2.34)."""
+    # glibc values
+    POSIX_SPAWN_SETPGROUP = 0x02
+    POSIX_SPAWN_SETSIGDEF = 0x04
+    structSize = 1024   # larger than posix_spawn_file_actions_t, posix_spawnattr_t and sigset_t
+
+    def __init__(self, libc):
+        import ctypes
+        self.ctypes = ctypes
+        self.libc = libc
+        libc.posix_spawnattr_setflags.argtypes = [ctypes.c_void_p, ctypes.c_short]
+        libc.posix_spawnattr_setpgroup.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        libc.posix_spawn_file_actions_addopen.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_char_p,
+                                                          ctypes.c_int, ctypes.c_uint]
+        self.environ = ctypes.c_void_p.in_dll(libc, "environ")
+
+    @staticmethod
+    def load():
+        "return a _Spawner object, or None if not supported on this system"
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            import ctypes, ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            if not hasattr(libc, "posix_spawn_file_actions_addclosefrom_np"):
+                return None
+            return _Spawner(libc)
+        except (ImportError, OSError, AttributeError, ValueError):
+            return None
+
+    @staticmethod
+    def __check(err):
+        if err != 0:
+            raise OSError(err, os.strerror(err))
+
+    def __setupFileActions(self, fileActs, stdioActs):
+        libc = self.libc
+        for act in stdioActs:
+            if act[0] == "dup2":
+                self.__check(libc.posix_spawn_file_actions_adddup2(fileActs, act[1], act[2]))
+            else:
+                self.__check(libc.posix_spawn_file_actions_addopen(fileActs, act[1], act[2], act[3], 0666))
+        self.__check(libc.posix_spawn_file_actions_addclosefrom_np(fileActs, 3))
+
+    def __setupAttrs(self, attrs, pgid):
+        libc = self.libc
+        sigset = self.ctypes.create_string_buffer(self.structSize)
+        libc.sigemptyset(sigset)
+        libc.sigaddset(sigset, signal.SIGPIPE)
+        self.__check(libc.posix_spawnattr_setsigdefault(attrs, sigset))
+        self.__check(libc.posix_spawnattr_setpgroup(attrs, pgid if (pgid is not None) else 0))
+        self.__check(libc.posix_spawnattr_setflags(attrs, self.POSIX_SPAWN_SETPGROUP|self.POSIX_SPAWN_SETSIGDEF))
+
+    def spawn(self, progPath, cmd, stdioActs, pgid):
+        """Start a process running cmd, returning the pid.  If progPath is not
+        None, it is the path to the program, otherwise PATH is searched for
+        cmd[0].  The stdioActs is
+        a list of ("dup2", fd, stdfd) or ("open", stdfd, path, flags), other
+        files are closed.  The process is put in process group pgid, or a new
+        group if None.  Raises OSError on failure, including exec failure."""
+        ctypes = self.ctypes
+        libc = self.libc
+        fileActs = ctypes.create_string_buffer(self.structSize)
+        attrs = ctypes.create_string_buffer(self.structSize)
+        self.__check(libc.posix_spawn_file_actions_init(fileActs))
+        try:
+            self.__check(libc.posix_spawnattr_init(attrs))
+            try:
+                self.__setupFileActions(fileActs, stdioActs)
+                self.__setupAttrs(attrs, pgid)
+                argv = (ctypes.c_char_p * (len(cmd) + 1))(*(list(cmd) + [None]))
+                pid = ctypes.c_int()
+                if progPath is not None:
+                    self.__check(libc.posix_spawn(ctypes.byref(pid), progPath, fileActs, attrs, argv, self.environ))
+                else:
+                    self.__check(libc.posix_spawnp(ctypes.byref(pid), cmd[0], fileActs, attrs, argv, self.environ))
+                return pid.value
+            finally:
+                libc.posix_spawnattr_destroy(attrs)
+        finally:
+            libc.posix_spawn_file_actions_destroy(fileActs)
+
+# set to False to always start processes with fork
+spawnEnabled = True
+_spawner = None
+_spawnerLoaded = False
+
+def _getSpawner():
+    "get the _Spawner object, or None if it is not enabled or available"
+    global _spawner, _spawnerLoaded
+    if not spawnEnabled:
+        return None
+    if not _spawnerLoaded:
+        _spawner = _Spawner.load()
+        _spawnerLoaded = True
+    return _spawner
+
 def _getSigName(num):
     "get name for a signal number"
     # find name in signal namespace
@@ -80,6 +194,16 @@ class ProcDagException(PycbioException):
     def __init__(self, msg, cause=None):
         PycbioException.__init__(self, msg, cause)
 
+class ProcDagTimeout(ProcDagException):
+    """Exception raised when a ProcDag or a process exceeded its timeout and
+    was killed.  The running field is a list of descriptions of the processes
+    that were still running."""
+    def __init__(self, timeout, running):
+        self.timeout = timeout
+        self.running = running
+        ProcDagException.__init__(self, "timeout of %s seconds exceeded, killed running processes: %s"
+                                  % (timeout, " ; ".join(running)))
+
 def nonBlockClear(fd):
     "clear the non-blocking flag on a fd"
     flags = fcntl.fcntl(fd, fcntl.F_GETFL)
@@ -168,10 +292,11 @@ class PInOut(object):
         assert(not self.named)
         return self.dev.getFd(self)
         
-    def getFh(self):
-        "get file object for this object, or error if not supported by Dev"
+    def getFh(self, bufSize=-1):
+        """get file object for this object, or error if not supported by Dev.
+        The bufSize is the buffer size, as with open()."""
         assert(not self.named)
-        return self.dev.getFh(self)
+        return self.dev.getFh(self, bufSize)
         
     def getPath(self):
         "get path for this object"
@@ -294,7 +419,7 @@ class Dev(object):
         "get file descriptor for given PInOut object"
         raise AttributeError("getFd not implemented")
 
-    def getFh(self, pio):
+    def getFh(self, pio, bufSize=-1):
         "get file object for given PInOut object, or error if not supported"
         raise AttributeError("getFh not supported for this Dev: " + str(self.__class__))
         
@@ -430,6 +555,316 @@ class DataWriter(Dev):
         assert(pio == self.pin)
         return self.fifo.rpath
         
+class StreamReader(Dev):
+    """Object to incrementally read process output via a pipe.  A thread
+    reads chunks of up to chunkSize into a queue of at most maxChunks, so
+    the process blocks when the consumer falls behind, rather than the
+    output being buffered in memory.  This can only be used for stdout or
+    stderr, not as a file argument.
+
+    The output must be consumed with iterChunks() or iterLines() (or
+    iteration) after starting the ProcDag and before waiting on it,
+    otherwise the process will block on a full pipe and wait() will not
+    return.  Any output not consumed when the ProcDag finishes is
+    discarded.
+    """
+    def __init__(self, chunkSize=64*1024, maxChunks=16):
+        Dev.__init__(self)
+        self.chunkSize = chunkSize
+        self.queue = Queue.Queue(maxChunks)
+        self.fifo = None
+        self.thread = None
+        self.stopping = False
+        self.eof = False
+
+    def __str__(self):
+        return "[StreamReader]"
+
+    def preFork(self):
+        "pre-fork setup"
+        if self.pin is not None:
+            raise Exception(self.__class__.__name__ + " can't be used for process input")
+        if self.pout.named:
+            raise Exception(self.__class__.__name__ + " can't be used as a file argument")
+        self.fifo = fifo.factory()
+
+    def postExecParent(self):
+        "called to do any post-exec handling in the parent"
+        self.fifo.wclose()
+        self.thread = threading.Thread(target=self.__reader)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __read(self):
+        while True:
+            try:
+                return os.read(self.fifo.rfd, self.chunkSize)
+            except OSError as ex:
+                if ex.errno != errno.EINTR:
+                    raise
+
+    def __reader(self):
+        "read thread function, queues chunks, EOF or an exception info tuple"
+        try:
+            while not self.stopping:
+                data = self.__read()
+                self.queue.put(data)
+                if len(data) == 0:
+                    break
+        except Exception:
+            self.queue.put(sys.exc_info())
+
+    def finish(self):
+        "called in parent when processing is complete"
+        if self.thread is not None:
+            self.stopping = True
+            # drain queue so thread is not blocked
+            while self.thread.isAlive():
+                try:
+                    self.queue.get(True, 0.1)
+                except Queue.Empty:
+                    pass
+            self.thread = None
+        if self.fifo is not None:
+            self.fifo.close()
+
+    def iterChunks(self):
+        "generator over chunks of output"
+        while not self.eof:
+            data = self.queue.get()
+            if isinstance(data, tuple):
+                self.eof = True
+                raise data[0], data[1], data[2]
+            if len(data) == 0:
+                self.eof = True
+            else:
+                yield data
+
+    def iterLines(self):
+        "generator over lines of output, without newlines"
+        partial = ""
+        for data in self.iterChunks():
+            lines = data.split("\n")
+            lines[0] = partial + lines[0]
+            partial = lines.pop()
+            for line in lines:
+                yield line
+        if len(partial) > 0:
+            yield partial
+
+    def __iter__(self):
+        return self.iterLines()
+
+    def getFd(self, pio):
+        "get file descriptor for given PInOut object"
+        assert(pio == self.pout)
+        return self.fifo.wfd
+
+class StreamWriter(Dev):
+    """Object to write data to a process from an iterable, such as a
+    generator, of strings via a pipe.  The iterable is consumed by a thread
+    that blocks on the pipe when the process is not reading, so data is only
+    generated as fast as the process consumes it.  Note that a generator
+    is run in the writer thread.  If the process exits before reading all
+    of the data, the rest of the iterable is not consumed.  An exception
+    raised by the iterable is raised when the ProcDag finishes.
+    """
+    def __init__(self, iterable):
+        Dev.__init__(self)
+        self.iterable = iterable
+        self.fifo = None
+        self.thread = None
+        self.exceptInfo = None
+
+    def __str__(self):
+        return "[StreamWriter]"
+
+    def preFork(self):
+        "pre-fork setup"
+        if self.pout is not None:
+            raise Exception(self.__class__.__name__ + " can't be used for process output")
+        self.fifo = fifo.factory()
+
+    def postExecParent(self):
+        "called to do any post-exec handling in the parent"
+        if not self.pin.named:
+            self.fifo.rclose()
+        self.thread = threading.Thread(target=self.__writer)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __write(self, data):
+        "write data, return False if reader has exited"
+        while len(data) > 0:
+            try:
+                data = data[os.write(self.fifo.wfd, data):]
+            except OSError as ex:
+                if ex.errno == errno.EPIPE:
+                    return False
+                if ex.errno != errno.EINTR:
+                    raise
+        return True
+
+    def __writer(self):
+        "write thread function"
+        try:
+            for data in self.iterable:
+                if not self.__write(data):
+                    break
+        except Exception:
+            self.exceptInfo = sys.exc_info()
+        finally:
+            self.fifo.wclose()
+
+    def finish(self):
+        "called in parent when processing is complete"
+        if self.thread is not None:
+            # processes have exited, close read side so writer gets EPIPE
+            # if blocked on a named pipe
+            self.fifo.rclose()
+            self.thread.join()
+            self.thread = None
+        if self.fifo is not None:
+            self.fifo.close()
+        if self.exceptInfo is not None:
+            exceptInfo = self.exceptInfo
+            self.exceptInfo = None
+            raise exceptInfo[0], exceptInfo[1], exceptInfo[2]
+
+    def getFd(self, pio):
+        "get file descriptor for given PInOut object"
+        assert(pio == self.pin)
+        return self.fifo.rfd
+
+    def getPath(self, pio):
+        "get path for given PInOut object"
+        assert(pio == self.pin)
+        return self.fifo.rpath
+
+class Tee(Dev):
+    """Copy the output of one process to the input of several processes.
+    The Tee is specified as the output of one process and as the input of
+    any number of processes.  A thread copies blocks of bufSize from the
+    producer to each of the consumers through pipes, so the amount of data
+    buffered is bounded, with the producer running at the speed of the
+    slowest consumer.  If a consumer exits without reading all of its input,
+    copying to the other consumers continues.
+    """
+    def __init__(self, bufSize=64*1024):
+        Dev.__init__(self)
+        self.bufSize = bufSize
+        self.pins = []      # multiple process inputs
+        self.inFifo = None
+        self.outFifos = {}  # by PIn
+        self.thread = None
+        self.exceptInfo = None
+
+    def __str__(self):
+        return "[Tee]"
+
+    def _addPio(self, pio):
+        "add a PInOut object, allowing multiple PIns"
+        if isinstance(pio, PIn):
+            if pio not in self.pins:
+                self.pins.append(pio)
+        else:
+            Dev._addPio(self, pio)
+
+    def needNamed(self):
+        """does this device need a named pipe?"""
+        return Dev.needNamed(self) or any(pin.named for pin in self.pins)
+
+    def preFork(self):
+        "pre-fork setup"
+        if self.pout is None:
+            raise Exception(self.__class__.__name__ + " must be used for process output")
+        if len(self.pins) == 0:
+            raise Exception(self.__class__.__name__ + " must be used for process input")
+        self.inFifo = fifo.factory()
+        for pin in self.pins:
+            self.outFifos[pin] = fifo.factory()
+
+    def postExecParent(self):
+        "called to do any post-exec handling in the parent"
+        if not self.pout.named:
+            self.inFifo.wclose()
+        for pin in self.pins:
+            if not pin.named:
+                self.outFifos[pin].rclose()
+        self.thread = threading.Thread(target=self.__copier)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @staticmethod
+    def __write(fd, data):
+        "write data, return False if reader has exited"
+        while len(data) > 0:
+            try:
+                data = data[os.write(fd, data):]
+            except OSError as ex:
+                if ex.errno == errno.EPIPE:
+                    return False
+                if ex.errno != errno.EINTR:
+                    raise
+        return True
+
+    def __copy(self):
+        outFds = [self.outFifos[pin].wfd for pin in self.pins]
+        while len(outFds) > 0:
+            try:
+                data = os.read(self.inFifo.rfd, self.bufSize)
+            except OSError as ex:
+                if ex.errno == errno.EINTR:
+                    continue
+                raise
+            if len(data) == 0:
+                break
+            outFds = [fd for fd in outFds if self.__write(fd, data)]
+
+    def __copier(self):
+        "copy thread function"
+        try:
+            self.__copy()
+        except Exception:
+            self.exceptInfo = sys.exc_info()
+        finally:
+            # EOF to consumers, and SIGPIPE to producer if all consumers exited
+            for outFifo in self.outFifos.itervalues():
+                outFifo.wclose()
+            self.inFifo.rclose()
+
+    def finish(self):
+        "called in parent when processing is complete"
+        if self.thread is not None:
+            # processes have exited, close parent's ends of named pipes so
+            # thread doesn't block
+            self.inFifo.wclose()
+            for outFifo in self.outFifos.itervalues():
+                outFifo.rclose()
+            self.thread.join()
+            self.thread = None
+        for f in [self.inFifo] + self.outFifos.values():
+            if f is not None:
+                f.close()
+        if self.exceptInfo is not None:
+            exceptInfo = self.exceptInfo
+            self.exceptInfo = None
+            raise exceptInfo[0], exceptInfo[1], exceptInfo[2]
+
+    def getFd(self, pio):
+        "get file descriptor for given PInOut object"
+        if pio == self.pout:
+            return self.inFifo.wfd
+        else:
+            return self.outFifos[pio].rfd
+
+    def getPath(self, pio):
+        "get path for given PInOut object"
+        if pio == self.pout:
+            return self.inFifo.wpath
+        else:
+            return self.outFifos[pio].rpath
+
 class Pipe(Dev):
     """Interprocess communication between two Procs, either by named or
     anonymous pipes.  One end can also be attached to read/write
@@ -484,12 +919,12 @@ class Pipe(Dev):
         else:
             return self.fifo.wfd
         
-    def getFh(self, pio):
+    def getFh(self, pio, bufSize=-1):
         "get file object for given PInOut object"
         if pio == self.pin:
-            return self.fifo.getRfh()
+            return self.fifo.getRfh(bufSize)
         else:
-            return self.fifo.getWfh()
+            return self.fifo.getWfh(bufSize)
 
     def getPath(self, pio):
         "get path for given PInOut object"
@@ -512,21 +947,51 @@ class File(Dev):
     def __str__(self):
         return self.path
 
+    def getOpenFlags(self, pio):
+        "get os.open() flags for the given PInOut object"
+        if isinstance(pio, PIn):
+            return os.O_RDONLY
+        elif self.append:
+            return os.O_WRONLY|os.O_CREAT|os.O_APPEND
+        else:
+            return os.O_WRONLY|os.O_CREAT|os.O_TRUNC
+
     def getFd(self, pio):
         "get file descriptor for given PInOut object"
         if self.fd is None:
-            if isinstance(pio, PIn):
-                self.fd = os.open(self.path, os.O_RDONLY)
-            elif self.append:
-                self.fd = os.open(self.path, os.O_WRONLY|os.O_CREAT|os.O_APPEND, 0666)
-            else:
-                self.fd = os.open(self.path, os.O_WRONLY|os.O_CREAT|os.O_TRUNC, 0666)
+            self.fd = os.open(self.path, self.getOpenFlags(pio), 0666)
         return self.fd
         
     def getPath(self, pio):
         "get path for given PInOut object"
         return self.path
 
+class ProcResources(object):
+    """Resource usage of an exited process, obtained from wait4().  Times are
+    in seconds, maxRss is in kilobytes on Linux, and inBlocks and outBlocks
+    are the number of file system input and output operations.  The wallTime
+    is from when the process was started to when it was reaped."""
+    def __init__(self, userTime, sysTime, maxRss, inBlocks, outBlocks, wallTime):
+        self.userTime = userTime
+        self.sysTime = sysTime
+        self.maxRss = maxRss
+        self.inBlocks = inBlocks
+        self.outBlocks = outBlocks
+        self.wallTime = wallTime
+
+    @staticmethod
+    def fromRusage(rusage, wallTime):
+        "construct from a resource.struct_rusage"
+        return ProcResources(rusage.ru_utime, rusage.ru_stime, rusage.ru_maxrss,
+                             rusage.ru_inblock, rusage.ru_oublock, wallTime)
+
+    def __str__(self):
+        return "user=%0.3f sys=%0.3f maxRss=%d inBlocks=%d outBlocks=%d wall=%0.3f" % (
+            self.userTime, self.sysTime, self.maxRss, self.inBlocks, self.outBlocks, self.wallTime)
+
+# Dev types whose file descriptors and paths can be obtained in the parent
+_spawnDevTypes = (Pipe, File, DataReader, DataWriter, StreamReader, StreamWriter, Tee)
+
 class Proc(object):
     """A process, represented as a node in a DAG of Proc objects, connected by
     PInOut and Dev objects.  All processes in a ProcDag are part of the same
@@ -548,10 +1013,13 @@ class Proc(object):
     in as stderr, a DataReader object is created.
     """
 
-    def __init__(self, dag, cmd, stdin=None, stdout=None, stderr=None):
-        "setup process. start() must be call to start process"
+    def __init__(self, dag, cmd, stdin=None, stdout=None, stderr=None, timeout=None):
+        """setup process. start() must be call to start process.  If timeout
+        is not None, the process is killed if it runs longer than timeout
+        seconds"""
         self.cmd = tuple(cmd)
         self.dag = dag
+        self.timeout = timeout
         # stdio and argument Dev association
         self.pins = set()
         self.pouts = set()
@@ -568,6 +1036,9 @@ class Proc(object):
         self.started = False
         self.finished = False
         self.forced = False    # force termination during ProcDag cleanup
+        self.startTime = None
+        self.resources = None  # ProcResources once reaped
+        self.progPath = None   # resolved path to program
 
     @staticmethod
     def __devStr(dev):
@@ -583,7 +1054,7 @@ class Proc(object):
         for a in self.cmd:
             if isinstance(a, PIn):
                 strs.append("<(" + self.__devStr(a.dev) + ")")
-            elif isinstance(a, PIn):
+            elif isinstance(a, POut):
                 strs.append(">(" + self.__devStr(a.dev) + ")")
             else:
                 strs.append(_quoteStr(str(a)))
@@ -663,13 +1134,33 @@ class Proc(object):
             # Don't close source file here, must delay closing in case stdout/err is same fd
 
     def __closeFiles(self):
-        "clone non-stdio files"
+        """close non-stdio files.  Only the open files are closed if they
+        can be listed, as closing every possible descriptor up to MAXFD is
+        slow when the limit is large"""
         keepOpen = set([self.statusPipe.wfd]) | trace.getActiveTraceFds()
-        for fd in xrange(3, MAXFD+1):
-            try:
-                if not fd in keepOpen:
-                    os.close(fd)
-            except: pass
+        openFds = _getOpenFds()
+        if openFds is not None:
+            for fd in openFds:
+                if (fd > 2) and (fd not in keepOpen):
+                    try:
+                        os.close(fd)
+                    except OSError:
+                        pass
+        else:
+            start = 3
+            for fd in sorted(keepOpen):
+                os.closerange(start, fd)
+                start = max(start, fd+1)
+            os.closerange(start, MAXFD+1)
+
+    def _resolveProg(self):
+        """find the path to the program on PATH, raising ProcException if it
+        is not found.  Does nothing if the program is a PInOut."""
+        if not isinstance(self.cmd[0], PInOut):
+            from pycbio.sys import procOps  # avoid mutual import
+            self.progPath = procOps.findProg(str(self.cmd[0]))
+            if self.progPath is None:
+                raise ProcException(str(self), cause=OSError(errno.ENOENT, os.strerror(errno.ENOENT), str(self.cmd[0])))
 
     def __doChildStart(self):
         "guts of start child process"
@@ -681,7 +1172,10 @@ class Proc(object):
         self.__stdioSetup(self.stderr, 2)
         self.__closeFiles()
         signal.signal(signal.SIGPIPE, signal.SIG_DFL)
-        os.execvp(cmd[0], cmd)
+        if self.progPath is not None:
+            os.execv(self.progPath, cmd)
+        else:
+            os.execvp(cmd[0], cmd)
             
     def __childStart(self):
         "start in child process"
@@ -704,10 +1198,39 @@ class Proc(object):
             pass # igore error if child has already come and gone
         self.statusPipe.postForkParent()
 
-    def __start(self):
-        "do work of starting the process"
+    def __canSpawn(self):
+        """can the process be started with posix_spawn?  This requires that
+        all Devs are of types that don't need setup in the child process"""
+        for pio in self.getPios():
+            if not isinstance(pio.dev, _spawnDevTypes):
+                return False
+        return True
+
+    def __getSpawnStdioActs(self):
+        "get stdio setup actions for _Spawner.spawn"
+        acts = []
+        for (spec, stdfd) in ((self.stdin, 0), (self.stdout, 1), (self.stderr, 2)):
+            if isinstance(spec, PInOut) and isinstance(spec.dev, File):
+                acts.append(("open", stdfd, spec.dev.path, spec.dev.getOpenFlags(spec)))
+            else:
+                fd = spec.getFd() if isinstance(spec, PInOut) else spec
+                if (fd is not None) and (fd != stdfd):
+                    acts.append(("dup2", fd, stdfd))
+        return acts
+
+    def __spawnStart(self, spawner):
+        "start the process with posix_spawn"
+        try:
+            self.pid = spawner.spawn(self.progPath, self.__buildCmd(), self.__getSpawnStdioActs(), self.dag.pgid)
+        except Exception as ex:
+            self.finished = True  # no process to wait on
+            raise ProcException(str(self), cause=ex)
+        if self.dag.pgid is None:
+            self.dag.pgid = self.pid
+
+    def __forkStart(self):
+        "start the process with fork and exec"
         self.statusPipe = _StatusPipe()
-        self.started = True  # do first to prevent restarts on error
         self.pid = os.fork()
         if self.pid == 0:
             try:
@@ -717,6 +1240,16 @@ class Proc(object):
         else:
             self.__parentStart()
 
+    def __start(self):
+        "do work of starting the process"
+        self.started = True  # do first to prevent restarts on error
+        self.startTime = time.time()
+        spawner = _getSpawner()
+        if (spawner is not None) and self.__canSpawn():
+            self.__spawnStart(spawner)
+        else:
+            self.__forkStart()
+
     def _start(self):
         "start the process"
         try:
@@ -728,6 +1261,8 @@ class Proc(object):
 
     def _execWait(self):
         "receive status, raising the exception if one was send"
+        if self.statusPipe is None:
+            return  # started with posix_spawn, which reports exec errors
         ex = self.statusPipe.recvStatus()
         if isinstance(ex, Exception):
             if not isinstance(ex, ProcException):
@@ -766,11 +1301,20 @@ class Proc(object):
             stderr = self.stderr.dev.get()
         # FIXME: shouldn't save if we killed it
         self.exceptInfo = (ProcException(str(self), self.returncode, stderr), None, None)
+
+    def _updateErrStderr(self):
+        """Called after devices have finished, to include all of the saved
+        stderr in the exception, as the read thread may not have received it
+        when the process exited."""
+        if (self.exceptInfo is not None) and (self.returncode is not None) and isinstance(self.exceptInfo[0], ProcException):
+            self.__handleErrExit()
         
-    def _handleExit(self, waitStat):
-        """Handle process exiting, saving status   Call close on all PInOut objects
-        to disassociate """
+    def _handleExit(self, waitStat, rusage=None):
+        """Handle process exiting, saving status and resource usage, if
+        available.  Call close on all PInOut objects to disassociate """
         self.finished = True
+        if rusage is not None:
+            self.resources = ProcResources.fromRusage(rusage, time.time() - self.startTime)
         assert(os.WIFEXITED(waitStat) or os.WIFSIGNALED(waitStat))
         self.returncode = os.WEXITSTATUS(waitStat) if os.WIFEXITED(waitStat) else -os.WTERMSIG(waitStat)
         if not ((self.returncode == 0) or (self.returncode == -signal.SIGPIPE)):
@@ -785,9 +1329,9 @@ class Proc(object):
         has, False if it hasn't."""
         if self.finished:
             return True
-        w = os.waitpid(self.pid, os.WNOHANG)
+        w = os.wait4(self.pid, os.WNOHANG)
         if w[0] != 0:
-            self._handleExit(w[1])
+            self._handleExit(w[1], w[2])
         return (w[0] != 0)
 
     def _forceFinish(self):
@@ -799,13 +1343,63 @@ class Proc(object):
             if not self._poll():
                 self.forced = True
                 os.kill(self.pid, signal.SIGKILL)
-                w = os.waitpid(self.pid, 0)
-                self._handleExit(w[1])
+                w = os.wait4(self.pid, 0)
+                self._handleExit(w[1], w[2])
 
     def failed(self):
         "check if process failed, call after poll() or wait()"
         return (self.exceptInfo is not None)
 
+class _Watchdog(object):
+    """Thread that kills the processes of a ProcDag, or a single process, if
+    they run longer than timeout seconds.  SIGTERM is sent first, followed by
+    SIGKILL if they are still running after killGrace seconds."""
+    def __init__(self, dag, timeout, killGrace, proc=None):
+        self.dag = dag
+        self.timeout = timeout
+        self.killGrace = killGrace
+        self.proc = proc
+        self.expired = None  # ProcDagTimeout if fired
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.__watch)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def cancel(self):
+        "stop watching, return ProcDagTimeout if expired, otherwise None"
+        self.done.set()
+        self.thread.join()
+        return self.expired
+
+    def __getRunning(self):
+        procs = [self.proc] if (self.proc is not None) else self.dag.procs
+        return [p for p in procs if p.started and not p.finished]
+
+    def __kill(self, sig):
+        try:
+            if self.proc is not None:
+                if not self.proc.finished:
+                    os.kill(self.proc.pid, sig)
+            else:
+                self.dag.kill(sig)
+        except OSError as ex:
+            if ex.errno != errno.ESRCH:
+                raise
+
+    def __watch(self):
+        "watch thread function"
+        if self.done.wait(self.timeout):
+            return
+        running = self.__getRunning()
+        if len(running) == 0:
+            return
+        self.expired = ProcDagTimeout(self.timeout, [str(p) for p in running])
+        self.__kill(signal.SIGTERM)
+        if not self.done.wait(self.killGrace):
+            self.__kill(signal.SIGKILL)
+
 class _ProcDagDesc(object):
     """Generate a description of a ProcDag for debugging purposes."""
     def __init__(self, dag):
@@ -843,6 +1437,11 @@ class _ProcDagDesc(object):
                 break
         return pline
 
+    @staticmethod
+    def __isConnPipe(spec):
+        "is spec a Pipe with a process on the other end"
+        return PInOut.pIsPipe(spec) and PInOut.pHasOtherProc(spec)
+
     def __partPipelines(self):
         """find linear pipelines and partition into ones whose stdin/out are
         or are not connected to other process args/stderr"""
@@ -853,7 +1452,7 @@ class _ProcDagDesc(object):
             if not proc in done:
                 pl = self.__findPipeline(proc)
                 done |= set(pl)
-                if PInOut.pHasOtherProc(pl[0].stdin) or PInOut.pHasOtherProc(pl[-1].stdout):
+                if self.__isConnPipe(pl[0].stdin) or self.__isConnPipe(pl[-1].stdout):
                     areConn.append(pl)
                 else:
                     notConn.append(pl)
@@ -964,22 +1563,33 @@ class _ProcDagDesc(object):
         return desc
         
 class ProcDag(object):
-    """Process DAG. Controls creation and management of process graph."""
-    def __init__(self):
+    """Process DAG. Controls creation and management of process graph.
+
+    If timeout is not None, all processes are killed if the DAG runs for
+    longer than timeout seconds, measured from start().  Timeouts can also
+    be specified for individual processes.  Processes are sent SIGTERM,
+    followed by SIGKILL if they haven't exited after killGrace seconds, and
+    ProcDagTimeout is raised by wait() once they have exited.
+    """
+    def __init__(self, timeout=None, killGrace=5.0):
         self.procs = set()
         self.devs = set()
         self.pgid = None      # process group leader
         self.byPid = dict()   # indexed by pid
         self.started = False  # have procs been started
         self.finished = False # have all procs finished
+        self.timeout = timeout
+        self.killGrace = killGrace
+        self.watchdogs = []
+        self.timeoutExcept = None
 
     def __str__(self):
         """get a string more or less describing the DAG"""
         return str(_ProcDagDesc(self))
 
-    def create(self, cmd, stdin=None, stdout=None, stderr=None):
-        "create a new process"
-        proc = Proc(self, cmd, stdin, stdout, stderr)
+    def create(self, cmd, stdin=None, stdout=None, stderr=None, timeout=None):
+        "create a new process, with an optional timeout in seconds"
+        proc = Proc(self, cmd, stdin, stdout, stderr, timeout)
         self.procs.add(proc)
         for pio in proc.getPios():
             self.devs.add(pio.dev)
@@ -1027,6 +1637,9 @@ class ProcDag(object):
             seen |= self.__validateRoot(root)
         if seen != self.procs:
             raise ProcDagException("process graph not full connected")
+        # fail before starting any process if a program doesn't exist
+        for proc in self.procs:
+            proc._resolveProg()
 
     def __preFork(self):
         for d in self.devs:
@@ -1045,11 +1658,37 @@ class ProcDag(object):
         for d in self.devs:
             d.postExecParent()
 
+    def __startWatchdogs(self):
+        if self.timeout is not None:
+            self.watchdogs.append(_Watchdog(self, self.timeout, self.killGrace))
+        for p in self.procs:
+            if p.timeout is not None:
+                self.watchdogs.append(_Watchdog(self, p.timeout, self.killGrace, p))
+        for w in self.watchdogs:
+            w.start()
+
+    def __stopWatchdogs(self):
+        for w in self.watchdogs:
+            expired = w.cancel()
+            if (expired is not None) and (self.timeoutExcept is None):
+                self.timeoutExcept = expired
+        self.watchdogs = []
+
     def __finish(self):
         "finish up when no errors have occurred"
         self.finished = True
+        self.__stopWatchdogs()
+        self.__traceResources()
         for d in self.devs:
             d.finish()
+        for p in self.procs:
+            p._updateErrStderr()
+
+    def __traceResources(self):
+        tr = trace.getCurrentTrace()
+        if tr is not None:
+            tr.log("ProcDag resources: ", self)
+            tr.log(self.getResourceTable())
 
     def __cleanupDev(self, dev):
         try:
@@ -1070,10 +1709,12 @@ class ProcDag(object):
     def __cleanup(self):
         """forced cleanup of child processed after failure"""
         self.finished = True
+        self.__stopWatchdogs()
         for d in self.devs:
             self.__cleanupDev(d)
         for p in self.procs:
             self.__cleanupProc(p)
+        self.__traceResources()
 
     def start(self):
         """start processes"""
@@ -1086,12 +1727,16 @@ class ProcDag(object):
             self.__start()
             self.__execBarrier()
             self.__postExec()
+            self.__startWatchdogs()
         except:
             self.__cleanup()
             raise
 
     def raiseIfExcept(self):
-        """raise exception if any process has one, otherwise do nothing"""
+        """raise exception if a timeout was exceeded or any process has one,
+        otherwise do nothing"""
+        if self.timeoutExcept is not None:
+            raise self.timeoutExcept
         for p in self.procs:
             p.raiseIfExcept()
 
@@ -1113,13 +1758,13 @@ class ProcDag(object):
     def __waitOnOne(self):
         "wait on the next process in group to complete, return False if no more"
         try:
-            w = os.waitpid(-self.pgid, 0)
+            w = os.wait4(-self.pgid, 0)
         except OSError as ex:
             if ex.errno == errno.ECHILD:
                 return False
             raise
         p = self.byPid[w[0]]
-        p._handleExit(w[1])
+        p._handleExit(w[1], w[2])
         return True
 
     def wait(self):
@@ -1137,6 +1782,21 @@ class ProcDag(object):
             raise
         self.raiseIfExcept()
 
+    def _reapProc(self, pid, waitStat, rusage=None):
+        """Handle the exit of a process that was reaped by an external wait
+        loop, such as PipelinePool.  Return True if all processes have
+        finished."""
+        try:
+            self.byPid[pid]._handleExit(waitStat, rusage)
+            for p in self.procs:
+                if not p.finished:
+                    return False
+            self.__finish()
+        except:
+            self.__cleanup()
+            raise
+        return True
+
     def failed(self):
         "check if any process failed, call after poll() or wait()"
         for p in self.procs:
@@ -1147,17 +1807,50 @@ class ProcDag(object):
     def kill(self, sig=signal.SIGTERM):
         "send a signal to the process"
         os.kill(-self.pgid, sig)
+
+    def __getReapedProcs(self):
+        "get processes with resource usage, in the order started"
+        return sorted([p for p in self.procs if p.resources is not None],
+                      key=lambda p: (p.startTime, p.pid))
+
+    def getTotalResources(self):
+        """get a ProcResources object summarizing the processes that have
+        been reaped, or None if there are none.  The maxRss and wallTime are
+        the maximums of the processes, other fields are totals."""
+        procs = self.__getReapedProcs()
+        if len(procs) == 0:
+            return None
+        res = [p.resources for p in procs]
+        return ProcResources(sum(r.userTime for r in res), sum(r.sysTime for r in res),
+                             max(r.maxRss for r in res), sum(r.inBlocks for r in res),
+                             sum(r.outBlocks for r in res), max(r.wallTime for r in res))
+
+    def getResourceTable(self):
+        """get a string with a table of the resource usage of each process
+        that has been reaped, and the total"""
+        fmt = "%8s %8s %10s %10s %10s %8s  %s"
+        lines = [fmt % ("user", "sys", "maxRss", "inBlocks", "outBlocks", "wall", "command")]
+        def addRow(res, desc):
+            lines.append(fmt % ("%0.3f" % res.userTime, "%0.3f" % res.sysTime, res.maxRss,
+                                res.inBlocks, res.outBlocks, "%0.3f" % res.wallTime, desc))
+        for p in self.__getReapedProcs():
+            addRow(p.resources, str(p))
+        total = self.getTotalResources()
+        if total is not None:
+            addRow(total, "[total]")
+        return "\n".join(lines)
         
 class Procline(ProcDag):
     """Process pipeline"""
-    def __init__(self, cmds, stdin=None, stdout=None, stderr=None):
+    def __init__(self, cmds, stdin=None, stdout=None, stderr=None, timeout=None):
         """cmds is either a list of arguments for a single process, or a list
         of such lists for a pipeline. If the stdin/out/err arguments are none,
         they are inherited.  Otherwise they can be string file names, a file-like
         object, a file number,  a Dev object, or a PIn or POut object.  Stdin is
         input to the first process, stdout is output to the last process and
-        stderr is attached to all processed."""
-        ProcDag.__init__(self)
+        stderr is attached to all processed.  If timeout is not None, the
+        processes are killed if they run longer than timeout seconds."""
+        ProcDag.__init__(self, timeout=timeout)
         # FIXME: needed??
         self.stdin = stdin
         self.stdout = stdout
@@ -1166,9 +1859,8 @@ class Procline(ProcDag):
         if isinstance(cmds[0], str):
             cmds = [cmds]  # one-process pipeline
         prevPipe = None
-        lastCmd = cmds[len(cmds)-1]
-        for cmd in cmds:
-            prevPipe = self._createProc(cmd, prevPipe, (cmd==lastCmd), stdin, stdout, stderr)
+        for i in xrange(len(cmds)):
+            prevPipe = self._createProc(cmds[i], prevPipe, (i == len(cmds)-1), stdin, stdout, stderr)
         
     def _createProc(self, cmd, prevPipe, isLastCmd, stdinFirst, stdoutLast, stderr):
         """create one process"""
@@ -1193,13 +1885,14 @@ class Pipeline(Procline):
     """
 
     # FIXME: change otherEnd stdio, or stdin/stdout, match with mode
-    def __init__(self, cmds, mode='r', otherEnd=None):
+    def __init__(self, cmds, mode='r', otherEnd=None, bufSize=-1, stderr=None):
         """cmds is either a list of arguments for a single process, or
         a list of such lists for a pipeline.  Mode is 'r' for a pipeline
         who's output will be read, or 'w' for a pipeline to that is to
         have data written to it.  If otherEnd is specified, and is a string,
         it is a file to open as stdio file at the other end of the pipeline.
         If it's not a string, it is assumed to be a file object to use for output.
+        If stderr is not None, it is attached to all processes, as with Procline.
         
         read pipeline ('r'):
           otherEnd --> cmd[0] --> ... --> cmd[n] --> fh
@@ -1207,7 +1900,8 @@ class Pipeline(Procline):
         write pipeline ('w')
           fh --> cmd[0] --> ... --> cmd[n] --> otherEnd
 
-        The field fh is the file object used to access the pipeline.
+        The field fh is the file object used to access the pipeline, with
+        a buffer size of bufSize, as with open().
         """
         # FIXME update doc on otherEnd
         if not ((mode == "r") or (mode == "w")):
@@ -1226,9 +1920,9 @@ class Pipeline(Procline):
             lastOut = otherFh if (otherFh is not None) else 1
             self.pio = POut(Pipe())
             firstIn = PIn(self.pio.dev)
-        Procline.__init__(self, cmds, stdin=firstIn, stdout=lastOut)
+        Procline.__init__(self, cmds, stdin=firstIn, stdout=lastOut, stderr=stderr)
         self.start()
-        self.fh = self.pio.getFh()
+        self.fh = self.pio.getFh(bufSize)
 
     def __enter__(self):
         "support for with statement"
@@ -1288,6 +1982,40 @@ class Pipeline(Procline):
     def readlines(self, size=-1):
         return self.fh.readlines(size)
 
+    def pump(self, other, zeroCopy=True):
+        """Copy data between the pipeline and other, which is a file path,
+        file object or file descriptor.  For a read pipeline, all remaining
+        output is copied to other; for a write pipeline, all of other is copied
+        to the pipeline.  The data is moved in the kernel when possible,
+        see fileOps.copyFd().  For read pipelines, this should not be mixed
+        with reading from the file object, as buffered data would be skipped.
+        Returns the number of bytes copied."""
+        from pycbio.sys import fileOps  # avoid mutual import
+        if self.mode == "w":
+            self.fh.flush()
+        if isinstance(other, str):
+            if self.mode == "r":
+                otherFd = os.open(other, os.O_WRONLY|os.O_CREAT|os.O_TRUNC, 0666)
+            else:
+                otherFd = os.open(other, os.O_RDONLY)
+            closeOther = True
+        else:
+            if isinstance(other, int):
+                otherFd = other
+            else:
+                if self.mode == "r":
+                    other.flush()
+                otherFd = other.fileno()
+            closeOther = False
+        try:
+            if self.mode == "r":
+                return fileOps.copyFd(self.fh.fileno(), otherFd, zeroCopy=zeroCopy)
+            else:
+                return fileOps.copyFd(otherFd, self.fh.fileno(), zeroCopy=zeroCopy)
+        finally:
+            if closeOther:
+                os.close(otherFd)
+
     def wait(self):
         """wait to for processes to complete, generate an exception if one
         exits no-zero"""
@@ -1306,6 +2034,165 @@ class Pipeline(Procline):
         if not self.finished:
             self.wait()
 
-__all__ = [ProcException.__name__, PIn.__name__, POut.__name__, Dev.__name__,
-           DataReader.__name__, DataWriter.__name__, Pipe.__name__, File.__name__,
-           Proc.__name__, ProcDag.__name__, Procline.__name__, Pipeline.__name__]
+class PipelinePoolJob(object):
+    """A ProcDag run by a PipelinePool, with an optional tag to identify it.
+    After completion, exceptInfo is set if it failed."""
+    def __init__(self, dag, tag=None):
+        self.dag = dag
+        self.tag = tag
+        self.startTime = None
+        self.endTime = None
+        self.exceptInfo = None
+
+    def __str__(self):
+        return str(self.dag) if self.tag is None else str(self.tag)
+
+    def getLatency(self):
+        "get run time in seconds, or None if not completed"
+        return None if self.endTime is None else self.endTime - self.startTime
+
+    def failed(self):
+        return self.exceptInfo is not None
+
+    def raiseIfExcept(self):
+        if self.exceptInfo is not None:
+            raise self.exceptInfo[0], self.exceptInfo[1], self.exceptInfo[2]
+
+class PipelinePoolStats(object):
+    "throughput and latency statistics for completed PipelinePool jobs"
+    def __init__(self, jobs, elapsed):
+        latencies = sorted([j.getLatency() for j in jobs if j.endTime is not None])
+        self.numJobs = len(latencies)
+        self.numFailed = len([j for j in jobs if j.failed()])
+        self.elapsed = elapsed
+        self.jobsPerSec = self.numJobs / elapsed if elapsed > 0 else 0.0
+        if self.numJobs > 0:
+            self.minLatency = latencies[0]
+            self.maxLatency = latencies[-1]
+            self.meanLatency = sum(latencies) / self.numJobs
+            self.medianLatency = latencies[self.numJobs // 2]
+        else:
+            self.minLatency = self.maxLatency = self.meanLatency = self.medianLatency = None
+
+    def __str__(self):
+        if self.numJobs == 0:
+            return "jobs: 0"
+        return ("jobs: %d failed: %d elapsed: %.3fs jobs/sec: %.1f latency min: %.3fs median: %.3fs mean: %.3fs max: %.3fs"
+                % (self.numJobs, self.numFailed, self.elapsed, self.jobsPerSec, self.minLatency,
+                   self.medianLatency, self.meanLatency, self.maxLatency))
+
+class PipelinePool(object):
+    """Run many independent ProcDag objects, such as Proclines, with up to
+    maxRunning running at once.  Processes are reaped by a single waitpid()
+    loop across the process groups of all running DAGs.  Failures are
+    collected rather than raised, and can be obtained with getFailed() or
+    raised with raiseIfFailed().
+
+    As waitpid() is used on all children, other child processes must not be
+    run by the process while wait() is running.
+    """
+    def __init__(self, maxRunning=None):
+        "maxRunning defaults to the number of CPUs"
+        self.maxRunning = maxRunning if maxRunning is not None else multiprocessing.cpu_count()
+        self.jobs = []
+        self.pending = collections.deque()
+        self.byPid = {}  # pid -> job for running jobs
+        self.numRunning = 0
+        self.elapsed = 0.0
+
+    def add(self, dag, tag=None):
+        """add a ProcDag to run, or a list of commands, which is used to
+        create a Procline.  Returns a PipelinePoolJob object."""
+        if not isinstance(dag, ProcDag):
+            dag = Procline(dag)
+        job = PipelinePoolJob(dag, tag)
+        self.jobs.append(job)
+        self.pending.append(job)
+        return job
+
+    def __startJob(self, job):
+        job.startTime = time.time()
+        try:
+            job.dag.start()
+        except Exception:
+            job.exceptInfo = sys.exc_info()
+            job.endTime = time.time()
+            return
+        for pid in job.dag.byPid.iterkeys():
+            self.byPid[pid] = job
+        self.numRunning += 1
+
+    def __finishJob(self, job, exceptInfo):
+        job.endTime = time.time()
+        self.numRunning -= 1
+        for pid in job.dag.byPid.iterkeys():
+            self.byPid.pop(pid, None)
+        if exceptInfo is None:
+            try:
+                job.dag.raiseIfExcept()
+            except Exception:
+                exceptInfo = sys.exc_info()
+        job.exceptInfo = exceptInfo
+
+    def __startJobs(self):
+        while (len(self.pending) > 0) and (self.numRunning < self.maxRunning):
+            self.__startJob(self.pending.popleft())
+
+    def __waitAny(self):
+        "wait on any child, return (pid, waitStat, rusage)"
+        while True:
+            try:
+                return os.wait4(-1, 0)
+            except OSError as ex:
+                if ex.errno == errno.EINTR:
+                    continue
+                if ex.errno == errno.ECHILD:
+                    raise ProcDagException("PipelinePool: child processes were reaped outside of the pool")
+                raise
+
+    def __reapOne(self):
+        (pid, waitStat, rusage) = self.__waitAny()
+        job = self.byPid.get(pid)
+        if job is None:
+            return  # not one of ours
+        try:
+            if job.dag._reapProc(pid, waitStat, rusage):
+                self.__finishJob(job, None)
+        except Exception:
+            self.__finishJob(job, sys.exc_info())
+
+    def wait(self):
+        "run all added jobs, returning when all have completed"
+        startTime = time.time()
+        try:
+            self.__startJobs()
+            while self.numRunning > 0:
+                self.__reapOne()
+                self.__startJobs()
+        finally:
+            self.elapsed += time.time() - startTime
+
+    def getFailed(self):
+        "get list of failed jobs"
+        return [j for j in self.jobs if j.failed()]
+
+    def raiseIfFailed(self):
+        """raise a ProcDagException if any job failed, with the exception of
+        the first failed job as the cause"""
+        failed = self.getFailed()
+        if len(failed) > 0:
+            try:
+                failed[0].raiseIfExcept()
+            except Exception as ex:
+                raise ProcDagException("%d of %d pipelines failed" % (len(failed), len(self.jobs)), ex)
+
+    def getStats(self):
+        "get a PipelinePoolStats object on completed jobs"
+        return PipelinePoolStats(self.jobs, self.elapsed)
+
+__all__ = [ProcException.__name__, ProcDagException.__name__, ProcDagTimeout.__name__,
+           PIn.__name__, POut.__name__, Dev.__name__,
+           DataReader.__name__, DataWriter.__name__, StreamReader.__name__, StreamWriter.__name__,
+           Tee.__name__, Pipe.__name__, File.__name__,
+           ProcResources.__name__, Proc.__name__, ProcDag.__name__, Procline.__name__, Pipeline.__name__,
+           PipelinePool.__name__, PipelinePoolJob.__name__, PipelinePoolStats.__name__]
@@ -0,0 +1,361 @@
+# Copyright 2006-2012 Mark Diekhans
+"""Event-driven execution of many Proclines from a single thread.  The
+stdin, stdout, and stderr of each pipeline are non-blocking pipes serviced
+by a poll() loop, and child processes are reaped when SIGCHLD wakes the
+loop, so no threads are used per pipeline."""
+import os, sys, fcntl, select, signal, errno
+from pycbio.sys.pipeline import Procline, ProcException, ProcDagException
+
+_readSize = 64 * 1024
+
+def _setNonBlock(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags|os.O_NONBLOCK)
+
+def _setCloseOnExec(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+    fcntl.fcntl(fd, fcntl.F_SETFD, flags|fcntl.FD_CLOEXEC)
+
+class LoopProcline(object):
+    """A Procline run by a PipelineLoop.  Created by PipelineLoop.add().
+
+    Output lines are either passed to the onLine callback, or, if it is
+    None, buffered to be returned by iterLines() or getOutput().  Standard
+    error is collected and included in the exception for failed processes.
+    If the timeout is exceeded, the exception is a ProcDagTimeout.
+    """
+    def __init__(self, loop, cmds, stdin, onLine, onDone, timeout=None):
+        self.loop = loop
+        self.cmds = cmds
+        self.timeout = timeout
+        self.stdinData = stdin
+        self.stdinPos = 0
+        self.onLine = onLine
+        self.onDone = onDone
+        self.dag = None
+        self.lines = []        # buffered output lines, when no onLine
+        self.partial = ""      # partial output line
+        self.stderr = []
+        self.stdinFd = self.stdoutFd = self.stderrFd = None
+        self.procsDone = False
+        self.done = False
+        self.exceptInfo = None
+
+    def __str__(self):
+        return str(self.dag) if self.dag is not None else str(self.cmds)
+
+    def _start(self):
+        "create pipes and start processes"
+        childFds = []
+        try:
+            stdin = None
+            if self.stdinData is not None:
+                (stdin, self.stdinFd) = os.pipe()
+                childFds.append(stdin)
+            (self.stdoutFd, stdout) = os.pipe()
+            childFds.append(stdout)
+            (self.stderrFd, stderr) = os.pipe()
+            childFds.append(stderr)
+            for fd in (self.stdinFd, self.stdoutFd, self.stderrFd):
+                if fd is not None:
+                    _setNonBlock(fd)
+                    _setCloseOnExec(fd)
+            self.dag = Procline(self.cmds, stdin=stdin, stdout=stdout, stderr=stderr, timeout=self.timeout)
+            self.dag.start()
+        except:
+            for fd in (self.stdinFd, self.stdoutFd, self.stderrFd):
+                if fd is not None:
+                    os.close(fd)
+            self.stdinFd = self.stdoutFd = self.stderrFd = None
+            raise
+        finally:
+            for fd in childFds:
+                os.close(fd)
+
+    def _writeStdin(self):
+        "write some stdin data, return False when done"
+        try:
+            self.stdinPos += os.write(self.stdinFd, self.stdinData[self.stdinPos:self.stdinPos+_readSize])
+        except OSError as ex:
+            if ex.errno == errno.EAGAIN:
+                return True
+            if ex.errno != errno.EPIPE:
+                raise
+            self.stdinPos = len(self.stdinData)  # reader exited
+        return self.stdinPos < len(self.stdinData)
+
+    def _readStdout(self):
+        "read some stdout data, return False on EOF"
+        data = os.read(self.stdoutFd, _readSize)
+        if len(data) == 0:
+            if len(self.partial) > 0:
+                self.__addLines([self.partial])
+                self.partial = ""
+            return False
+        lines = data.split("\n")
+        lines[0] = self.partial + lines[0]
+        self.partial = lines.pop()
+        self.__addLines(lines)
+        return True
+
+    def __addLines(self, lines):
+        if self.onLine is None:
+            self.lines.extend(lines)
+        else:
+            for line in lines:
+                self.onLine(self, line)
+
+    def _readStderr(self):
+        "read some stderr data, return False on EOF"
+        data = os.read(self.stderrFd, _readSize)
+        self.stderr.append(data)
+        return len(data) > 0
+
+    def _isComplete(self):
+        return self.procsDone and (self.stdoutFd is None) and (self.stderrFd is None)
+
+    def _finish(self, exceptInfo=None):
+        self.done = True
+        if (exceptInfo is None) and (self.dag.timeoutExcept is not None):
+            exceptInfo = (self.dag.timeoutExcept, None, None)
+        if exceptInfo is None:
+            for p in self.dag.procs:
+                if p.failed():
+                    # include collected stderr
+                    exceptInfo = (ProcException(str(p), p.returncode, self.getStderr()), None, None)
+                    break
+        self.exceptInfo = exceptInfo
+        if self.onDone is not None:
+            self.onDone(self)
+
+    def getStderr(self):
+        "get the standard error collected so far"
+        return "".join(self.stderr)
+
+    def iterLines(self):
+        """generator over output lines, without newlines, running the loop
+        as needed.  This can't be used if onLine was specified."""
+        assert self.onLine is None
+        while True:
+            while len(self.lines) > 0:
+                lines = self.lines
+                self.lines = []
+                for line in lines:
+                    yield line
+            if self.done:
+                break
+            self.loop.runOnce()
+        self.raiseIfExcept()
+
+    def getOutput(self):
+        "wait for completion and get all buffered output lines"
+        self.wait()
+        lines = self.lines
+        self.lines = []
+        return lines
+
+    def wait(self):
+        """run the loop until this pipeline completes, raising an exception
+        if it failed"""
+        while not self.done:
+            self.loop.runOnce()
+        self.raiseIfExcept()
+
+    def failed(self):
+        return self.exceptInfo is not None
+
+    def raiseIfExcept(self):
+        if self.exceptInfo is not None:
+            raise self.exceptInfo[0], self.exceptInfo[1], self.exceptInfo[2]
+
+class PipelineLoop(object):
+    """Single-threaded loop running many Proclines concurrently, using
+    poll() on non-blocking pipes for I/O.  A SIGCHLD handler, with the
+    signal wakeup file descriptor, is installed while the loop exists, and
+    must be created in the main thread.  Exited processes are reaped by
+    waitpid() on any child, so other child processes must not be run
+    while the loop is active.  Call close() when finished to restore the
+    signal handler.
+
+    This provides the functionality of an asynchronous API on Python 2:
+    add() starts a pipeline and returns immediately, and the pipeline's
+    wait() and iterLines() methods run the loop until the data they need is
+    available, while servicing all other pipelines.
+    """
+    def __init__(self, pollTimeout=1.0):
+        """pollTimeout is the maximum seconds to wait in poll, as a
+        safeguard against missed signals"""
+        self.pollTimeout = pollTimeout
+        self.poller = select.poll()
+        self.fdMap = {}   # fd -> (LoopProcline, handler)
+        self.byPid = {}   # pid -> LoopProcline
+        self.active = set()
+        (self.wakeRfd, self.wakeWfd) = os.pipe()
+        for fd in (self.wakeRfd, self.wakeWfd):
+            _setNonBlock(fd)
+            _setCloseOnExec(fd)
+        self.poller.register(self.wakeRfd, select.POLLIN)
+        self.prevHandler = signal.signal(signal.SIGCHLD, self.__sigChld)
+        signal.siginterrupt(signal.SIGCHLD, False)  # restart other system calls
+        self.prevWakeupFd = signal.set_wakeup_fd(self.wakeWfd)
+
+    @staticmethod
+    def __sigChld(signum, frame):
+        pass  # wakeup fd is written by Python's C handler
+
+    def close(self):
+        "restore signal handling and close wakeup pipe"
+        if self.wakeRfd is not None:
+            signal.set_wakeup_fd(self.prevWakeupFd)
+            signal.signal(signal.SIGCHLD, self.prevHandler)
+            os.close(self.wakeRfd)
+            os.close(self.wakeWfd)
+            self.wakeRfd = self.wakeWfd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def add(self, cmds, stdin=None, onLine=None, onDone=None, timeout=None):
+        """Start a pipeline. cmds is a list of commands, as with Procline.
+        If stdin is not None, it is a string written to the pipeline.  If
+        onLine is not None, it is called as onLine(lpl, line) for each output
+        line, otherwise lines are buffered.  If onDone is not None, it is
+        called as onDone(lpl) when the pipeline completes.  If timeout is not
+        None, the processes are killed if they run longer than timeout
+        seconds.  Returns a LoopProcline object."""
+        lpl = LoopProcline(self, cmds, stdin, onLine, onDone, timeout)
+        try:
+            lpl._start()
+        except Exception:
+            lpl._finish(sys.exc_info())
+            return lpl
+        self.active.add(lpl)
+        for pid in lpl.dag.byPid.iterkeys():
+            self.byPid[pid] = lpl
+        if lpl.stdinFd is not None:
+            if len(lpl.stdinData) > 0:
+                self.__register(lpl.stdinFd, lpl, self.__handleStdin, select.POLLOUT)
+            else:
+                self.__closeFd(lpl, "stdinFd")
+        self.__register(lpl.stdoutFd, lpl, self.__handleStdout, select.POLLIN)
+        self.__register(lpl.stderrFd, lpl, self.__handleStderr, select.POLLIN)
+        return lpl
+
+    def __register(self, fd, lpl, handler, events):
+        self.fdMap[fd] = (lpl, handler)
+        self.poller.register(fd, events)
+
+    def __closeFd(self, lpl, attr):
+        fd = getattr(lpl, attr)
+        if fd in self.fdMap:
+            self.poller.unregister(fd)
+            del self.fdMap[fd]
+        os.close(fd)
+        setattr(lpl, attr, None)
+
+    def __handleStdin(self, lpl):
+        if not lpl._writeStdin():
+            self.__closeFd(lpl, "stdinFd")
+
+    def __handleStdout(self, lpl):
+        if not lpl._readStdout():
+            self.__closeFd(lpl, "stdoutFd")
+
+    def __handleStderr(self, lpl):
+        if not lpl._readStderr():
+            self.__closeFd(lpl, "stderrFd")
+
+    def __abort(self, lpl, exceptInfo):
+        "close down a pipeline after an error in the loop"
+        for attr in ("stdinFd", "stdoutFd", "stderrFd"):
+            if getattr(lpl, attr) is not None:
+                self.__closeFd(lpl, attr)
+        if not lpl.procsDone:
+            for pid in lpl.dag.byPid.iterkeys():
+                self.byPid.pop(pid, None)
+            try:
+                lpl.dag.kill(signal.SIGKILL)
+            except OSError:
+                pass
+            for p in lpl.dag.procs:
+                if not p.finished:
+                    w = os.wait4(p.pid, 0)
+                    try:
+                        lpl.dag._reapProc(p.pid, w[1], w[2])  # also stops timeouts
+                    except Exception:
+                        pass  # reporting original error
+        self.active.discard(lpl)
+        lpl._finish(exceptInfo)
+
+    def __checkComplete(self, lpl):
+        if (not lpl.done) and lpl._isComplete():
+            self.active.discard(lpl)
+            lpl._finish()
+
+    def __reapChildren(self):
+        "reap all exited children"
+        while len(self.byPid) > 0:
+            try:
+                (pid, waitStat, rusage) = os.wait4(-1, os.WNOHANG)
+            except OSError as ex:
+                if ex.errno == errno.EINTR:
+                    continue
+                if ex.errno == errno.ECHILD:
+                    raise ProcDagException("PipelineLoop: child processes were reaped outside of the loop")
+                raise
+            if pid == 0:
+                break
+            lpl = self.byPid.pop(pid, None)
+            if lpl is not None:
+                try:
+                    if lpl.dag._reapProc(pid, waitStat, rusage):
+                        lpl.procsDone = True
+                        self.__checkComplete(lpl)
+                except Exception:
+                    self.__abort(lpl, sys.exc_info())
+
+    def __drainWakeup(self):
+        try:
+            while len(os.read(self.wakeRfd, 1024)) > 0:
+                pass
+        except OSError as ex:
+            if ex.errno != errno.EAGAIN:
+                raise
+
+    def __poll(self):
+        while True:
+            try:
+                return self.poller.poll(int(self.pollTimeout * 1000))
+            except select.error as ex:
+                if ex.args[0] != errno.EINTR:
+                    raise
+
+    def runOnce(self):
+        """wait for and process one round of events, return False if no
+        pipelines are active"""
+        if len(self.active) == 0:
+            return False
+        for (fd, event) in self.__poll():
+            if fd == self.wakeRfd:
+                self.__drainWakeup()
+                continue
+            entry = self.fdMap.get(fd)
+            if entry is None:
+                continue  # closed by earlier event
+            (lpl, handler) = entry
+            try:
+                handler(lpl)
+            except Exception:
+                self.__abort(lpl, sys.exc_info())
+                continue
+            self.__checkComplete(lpl)
+        self.__reapChildren()
+        return len(self.active) > 0
+
+    def run(self):
+        "run until all pipelines have completed"
+        while self.runOnce():
+            pass
@@ -9,38 +9,41 @@ import os, re
 from pycbio.sys import pipeline
 
 
-def callProc(cmd, keepLastNewLine=False):
+def callProc(cmd, keepLastNewLine=False, timeout=None):
     """call a process and return stdout, exception with stderr in message.
     The  cmd is either a list of command and arguments, or pipeline, specified by
-    a list of lists of commands and arguments."""
+    a list of lists of commands and arguments.  If timeout is not None, the
+    processes are killed and pipeline.ProcDagTimeout is raised if they run
+    longer than timeout seconds."""
     stdout = pipeline.DataReader()
-    pl = pipeline.Procline(cmd, stdin="/dev/null", stdout=stdout)
+    pl = pipeline.Procline(cmd, stdin="/dev/null", stdout=stdout, timeout=timeout)
     pl.wait()
     out = stdout.get()
     if (not keepLastNewLine) and (len(out) > 0) and (out[-1] == "\n"):
         out = out[0:-1]
     return out
 
-def callProcLines(cmd):
+def callProcLines(cmd, timeout=None):
     """call a process and return stdout, split into a list of lines, exception
     with stderr in message."""
-    out = callProc(cmd)
+    out = callProc(cmd, timeout=timeout)
     if len(out) == 0:
         return []  # split creates a list of one empty string from an empty string
     return out.split("\n")
 
-def runProc(cmd, stdin="/dev/null", stdout=None, stderr=None):
+def runProc(cmd, stdin="/dev/null", stdout=None, stderr=None, timeout=None):
     """run a process, with I/O redirection to specified file paths or open
-    file objects. None specifies inheriting open file."""
-    pl = pipeline.Procline(cmd, stdin=stdin, stdout=stdout, stderr=stderr)
+    file objects. None specifies inheriting open file.  If timeout is not
+    None, the processes are killed if they run longer than timeout seconds."""
+    pl = pipeline.Procline(cmd, stdin=stdin, stdout=stdout, stderr=stderr, timeout=timeout)
     pl.wait()
 
-def runProcCode(cmd, stdin="/dev/null", stdout=None, stderr=None):
+def runProcCode(cmd, stdin="/dev/null", stdout=None, stderr=None, timeout=None):
     """run a process, with I/O redirection to specified file paths or open
     file objects. None specifies inheriting open file.  Return exit code rather
-    than raising exception"""
+    than raising exception, timeouts still raise an exception"""
     try:
-        pl = pipeline.Procline(cmd, stdin=stdin, stdout=stdout, stderr=stderr)
+        pl = pipeline.Procline(cmd, stdin=stdin, stdout=stdout, stderr=stderr, timeout=timeout)
         pl.wait()
     except pipeline.ProcException as ex:
         if ex.returncode is not None:
@@ -49,18 +52,60 @@ def runProcCode(cmd, stdin="/dev/null", stdout=None, stderr=None):
             raise ex
     return 0
     
-def which(prog, makeAbs=False):
-    "search PATH for prog, optionally generating an absolute path.  Exception if not found."
-    for d in os.environ["PATH"].split(":"):
+# cache of programs found in absolute PATH directories, cleared when PATH changes
+_progPathCache = {}
+_progPathCachePath = None
+
+def _isExecutable(f):
+    return os.access(f, os.X_OK) and not os.path.isdir(f)
+
+def _searchPath(prog, envPath):
+    "search PATH, returning path or None"
+    for d in envPath.split(":"):
         if d == "":
             d = "."
         f = d + "/" + prog
-        if os.access(f, os.X_OK):
-            if (makeAbs):
-                return os.path.abspath(f)
-            else:
-                return f
-    raise Exception("Can't find program \"" + prog + "\" on path \"" + os.environ["PATH"] + "\"")
+        if _isExecutable(f):
+            return f
+    return None
+
+def findProg(prog, makeAbs=False):
+    """Search PATH for prog, optionally generating an absolute path.  Return
+    None if not found.  If prog contains a `/', it is checked without
+    searching PATH.  Programs found in absolute directories are cached,
+    with the cache cleared if PATH changes; call flushProgCache() if programs
+    are removed or installed."""
+    global _progPathCachePath
+    envPath = os.environ.get("PATH", "")
+    if envPath != _progPathCachePath:
+        _progPathCache.clear()
+        _progPathCachePath = envPath
+    key = (prog, makeAbs)
+    f = _progPathCache.get(key)
+    if f is not None:
+        return f
+    if "/" in prog:
+        f = prog if _isExecutable(prog) else None
+    else:
+        f = _searchPath(prog, envPath)
+    if f is None:
+        return None
+    if makeAbs:
+        f = os.path.abspath(f)
+    if f.startswith("/"):
+        _progPathCache[key] = f
+    return f
+
+def flushProgCache():
+    "clear cache of program paths used by findProg() and which()"
+    _progPathCache.clear()
+
+def which(prog, makeAbs=False):
+    "search PATH for prog, optionally generating an absolute path.  Exception if not found."
+    f = findProg(prog, makeAbs)
+    if f is None:
+        raise Exception("Can't find program \"" + prog + "\" on path \"" + os.environ.get("PATH", "") + "\"")
+    return f
 
 shSafeRe = re.compile("^[-+./_=,:@0-9A-Za-z]+$")
 def shQuoteWord(word):
@@ -83,5 +128,6 @@ def sshCmd(host, cmd, direct=None):
     pass
 
 __all__ = (callProc.__name__, callProcLines.__name__, runProc.__name__, which.__name__,
+           findProg.__name__, flushProgCache.__name__,
            shQuoteWord.__name__, shQuote.__name__)
 
@@ -0,0 +1,206 @@
+# Copyright 2006-2012 Mark Diekhans
+"""Cache of results of expensive computations on files, such as deriving
+tables from genePred or PSL files.  Results are keyed on the contents (or size
+and modification time) of the input files and the parameters of the
+computation, and are stored in a cache directory with least-recently-used
+eviction."""
+import os, hashlib, inspect, shutil, functools
+import cPickle as pickle
+from pycbio.sys import fileOps
+
+_blockSize = 1024 * 1024
+
+class ResultCache(object):
+    """Directory of cached results.  Results are either files created by a
+    function or picklable objects.  Entries are stored in subdirectories of
+    cacheDir named by a hash of the name of the computation, the input files
+    and the parameters.  The modification time of an entry is updated when it
+    is used, and the least recently used entries are removed when the total
+    size exceeds maxBytes.  Entries are written to temporary files in the
+    tmp subdirectory, which is not subject to eviction, and installed
+    atomically, so a cache may be shared by multiple processes.
+    """
+    tmpSubDir = "tmp"
+
+    def __init__(self, cacheDir, maxBytes=None, useDigest=True):
+        """If useDigest is True, input files are identified by a SHA1 digest
+        of their contents, otherwise by their size and modification time.
+        If maxBytes is None, entries are never evicted."""
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.useDigest = useDigest
+        self.digests = {}  # (path, size, mtime) -> digest, to avoid reading files twice
+        self.tmpDir = os.path.join(cacheDir, self.tmpSubDir)
+        fileOps.ensureDir(self.tmpDir)
+
+    def __fileDigest(self, path, st):
+        memoKey = (os.path.realpath(path), st.st_size, st.st_mtime)
+        digest = self.digests.get(memoKey)
+        if digest is None:
+            h = hashlib.sha1()
+            with open(path, "rb") as fh:
+                while True:
+                    buf = fh.read(_blockSize)
+                    if len(buf) == 0:
+                        break
+                    h.update(buf)
+            digest = self.digests[memoKey] = h.hexdigest()
+        return digest
+
+    def getFileSignature(self, path):
+        "get the string identifying the current contents of a file"
+        st = os.stat(path)
+        if self.useDigest:
+            return self.__fileDigest(path, st)
+        else:
+            return "%d:%r" % (st.st_size, st.st_mtime)
+
+    def getKey(self, name, inFiles, params):
+        """get the key for a computation, given its name, list of input files
+        and parameters, which must have a reproducible repr().  Dictionaries
+        are sorted."""
+        h = hashlib.sha1()
+        h.update(name)
+        for inFile in inFiles:
+            h.update("\0" + self.getFileSignature(inFile))
+        if isinstance(params, dict):
+            params = sorted(params.iteritems())
+        h.update("\0" + repr(params))
+        return h.hexdigest()
+
+    def __getEntryPath(self, key, ext):
+        return os.path.join(self.cacheDir, key[0:2], key + ext)
+
+    def __lookup(self, entryPath):
+        "return True if entry exists, marking it as recently used"
+        try:
+            os.utime(entryPath, None)
+            return True
+        except OSError:
+            return False
+
+    def __install(self, tmpPath, entryPath):
+        fileOps.atomicInstall(tmpPath, entryPath)
+        if self.maxBytes is not None:
+            self.evict(self.maxBytes, keep=entryPath)
+
+    def __getTmpPath(self, entryPath):
+        fileOps.ensureFileDir(entryPath)
+        return fileOps.atomicTmpFile(os.path.join(self.tmpDir, os.path.basename(entryPath)))
+
+    def getFile(self, name, inFiles, params, createFunc, ext=""):
+        """Get the path to a cached result file, calling createFunc(path) to
+        create it if it is not in the cache.  The ext is the extension of
+        the cached file, which should be included to allow compression to be
+        recognized.  The returned file should not be modified."""
+        entryPath = self.__getEntryPath(self.getKey(name, inFiles, params), ext)
+        if not self.__lookup(entryPath):
+            tmpPath = self.__getTmpPath(entryPath)
+            try:
+                createFunc(tmpPath)
+            except:
+                fileOps.rmFiles(tmpPath)
+                raise
+            self.__install(tmpPath, entryPath)
+        return entryPath
+
+    def getObject(self, name, inFiles, params, createFunc):
+        """Get a cached object, calling createFunc() to create it if it is not
+        in the cache.  Objects are stored using pickle."""
+        entryPath = self.__getEntryPath(self.getKey(name, inFiles, params), ".pkl")
+        if self.__lookup(entryPath):
+            with open(entryPath, "rb") as fh:
+                return pickle.load(fh)
+        obj = createFunc()
+        tmpPath = self.__getTmpPath(entryPath)
+        try:
+            with open(tmpPath, "wb") as fh:
+                pickle.dump(obj, fh, pickle.HIGHEST_PROTOCOL)
+        except:
+            fileOps.rmFiles(tmpPath)
+            raise
+        self.__install(tmpPath, entryPath)
+        return obj
+
+    def __getEntries(self):
+        "get list of (mtime, size, path) of entries, excluding temporary files"
+        entries = []
+        for subDir in os.listdir(self.cacheDir):
+            subPath = os.path.join(self.cacheDir, subDir)
+            if (subDir != self.tmpSubDir) and os.path.isdir(subPath):
+                for entry in os.listdir(subPath):
+                    path = os.path.join(subPath, entry)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue  # removed by another process
+                    entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def getSize(self):
+        "get total size of cache entries"
+        return sum(e[1] for e in self.__getEntries())
+
+    def evict(self, maxBytes, keep=None):
+        """remove least-recently-used entries until the size of the cache is
+        no more than maxBytes.  The entry keep is not removed."""
+        entries = self.__getEntries()
+        total = sum(e[1] for e in entries)
+        entries.sort()
+        for (mtime, size, path) in entries:
+            if total <= maxBytes:
+                break
+            if path != keep:
+                fileOps.rmFiles(path)
+                total -= size
+
+    def clear(self):
+        "remove all entries"
+        self.evict(0)
+
+def _getFuncName(func):
+    return func.__module__ + "." + func.__name__
+
+def cachedObject(cache, fileArgs=()):
+    """Decorator for a function returning a picklable object that is cached
+    in the ResultCache cache.  The fileArgs are the names of the arguments
+    that are input files, all other arguments are parameters, and must have
+    a reproducible repr()."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            callArgs = inspect.getcallargs(func, *args, **kwargs)
+            inFiles = [callArgs.pop(a) for a in fileArgs]
+            return cache.getObject(_getFuncName(func), inFiles, callArgs, lambda: func(*args, **kwargs))
+        return wrapper
+    return decorate
+
+def cachedFile(cache, fileArgs=(), outArg="outFile", ext=""):
+    """Decorator for a function that creates a file that is cached in the
+    ResultCache cache.  The fileArgs are the names of the arguments that
+    are input files and outArg is the name of the argument for the output
+    file, which should have a default of None, all other arguments are
+    parameters.  The decorated function returns the path to the cached file.
+    If the output file argument is specified and not None, the cached file
+    is also copied to it and that path is returned."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            callArgs = inspect.getcallargs(func, *args, **kwargs)
+            outFile = callArgs.pop(outArg)
+            inFiles = [callArgs.pop(a) for a in fileArgs]
+            def create(path):
+                createArgs = dict(callArgs)
+                createArgs[outArg] = path
+                for a, f in zip(fileArgs, inFiles):
+                    createArgs[a] = f
+                func(**createArgs)
+            cachePath = cache.getFile(_getFuncName(func), inFiles, callArgs, create, ext)
+            if outFile is None:
+                return cachePath
+            tmpPath = fileOps.atomicTmpFile(outFile)
+            shutil.copy(cachePath, tmpPath)
+            fileOps.atomicInstall(tmpPath, outFile)
+            return outFile
+        return wrapper
+    return decorate
@@ -8,10 +8,17 @@ import sys, os, types, linecache, threading
 # used to detect traces that are currently open to prevent closing
 _activeTraceFds = set()
 
+# trace currently enabled, if any
+_currentTrace = None
+
 def getActiveTraceFds():
     "return snapshot of currently active traces"
     return frozenset(_activeTraceFds)
 
+def getCurrentTrace():
+    "return the currently enabled Trace object, or None"
+    return _currentTrace
+
 class Trace(object):
     """Trace object, associate with an open trace file.  File is flushed after
     each write to debug blocking"""
@@ -33,14 +40,19 @@ class Trace(object):
 
     def enable(self):
         """enable logging on all threads."""
+        global _currentTrace
         assert(self.fh is not None)
         sys.settrace(self.__callback)
         threading.settrace(self.__callback)
+        _currentTrace = self
 
     def disable(self):
         """disable logging on all threads."""
+        global _currentTrace
         sys.settrace(None)
         threading.settrace(None)
+        if _currentTrace is self:
+            _currentTrace = None
 
     def close(self):
         "disable and close log file"
@@ -105,4 +117,4 @@ class Trace(object):
                 self.__logLine(frame, event)
         return self.__callback
 
-__all__ = (getActiveTraceFds.__name__, Trace.__name__)
+__all__ = (getActiveTraceFds.__name__, getCurrentTrace.__name__, Trace.__name__)
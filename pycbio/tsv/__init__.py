@@ -10,9 +10,14 @@ class TsvError(PycbioException):
         PycbioException.__init__(self, msg, cause)
 
 
+from pycbio.tsv.categorical import Categorical
 from pycbio.tsv.tsvRow import TsvRow
-from pycbio.tsv.tsvReader import TsvReader, strOrNoneType, intOrNoneType
+from pycbio.tsv.tsvReader import TsvReader, strOrNoneType, intOrNoneType, floatOrNoneType
+from pycbio.tsv.tsvWriter import TsvWriter
 from pycbio.tsv.tsvTable import TsvTable
 from pycbio.tsv.tabFile import TabFile
 from pycbio.tsv.tabFile import TabFileReader
 
+from pycbio.tsv.tsvGroupBy import TsvGroupBy, tsvGroupBy
+from pycbio.tsv.tsvParallelReader import TsvParallelReader
+from pycbio.tsv.tsvSchema import TsvSchema, getCachedSchema, getCachedTypeMap
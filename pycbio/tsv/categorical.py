@@ -0,0 +1,61 @@
+# Copyright 2006-2012 Mark Diekhans
+"""Categorical column type, storing small integer codes with a shared
+dictionary of values"""
+from array import array
+
+class Categorical(object):
+    """Column type for columns with a small number of distinct values, such
+    as chrom or strand.  Used as a value in a TsvReader typeMap, the column
+    is stored in rows as an integer code, with the string values kept in this
+    object.  Codes are assigned in the order values are first seen, the same
+    object must be used for all files whose codes are to be compared.
+    Comparisons of a column to a value are done by comparing codes:
+
+        chromCat = Categorical()
+        rows = TsvReader(tsvFile, typeMap={"chrom": chromCat})
+        chr1 = chromCat.encode("chr1")
+        chr1Rows = [r for r in rows if r.chrom == chr1]
+
+    The column is formatted back to the string value on output.
+    """
+    def __init__(self, values=()):
+        "values are optional initial values, in code order"
+        self.values = []
+        self.codes = {}
+        for value in values:
+            self.encode(value)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __nonzero__(self):
+        # typeMap entries are tested for truth, don't let an empty object be false
+        return True
+
+    def encode(self, value):
+        "get code for a value, adding it if it doesn't exist"
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    __call__ = encode  # use as a parse function in typeMap
+
+    def decode(self, code):
+        "get value for a code"
+        return self.values[code]
+
+    def getCode(self, value):
+        "get code for a value, or None if it has not been seen"
+        return self.codes.get(value)
+
+    def encodeColumn(self, col):
+        "encode a column of values, returning an array of codes"
+        encode = self.encode
+        return array("i", [encode(v) for v in col])
+
+    def decodeColumn(self, codes):
+        "decode an array or list of codes into a list of values"
+        values = self.values
+        return [values[c] for c in codes]
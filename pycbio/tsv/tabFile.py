@@ -22,13 +22,7 @@ class TabFile(list):
     @staticmethod
     def write(fh, row):
         """print a row (list or tuple) to a tab file."""
-        cnt = 0;
-        for col in row:
-            if cnt > 0:
-                fh.write("\t")
-            fh.write(str(col))
-            cnt += 1
-        fh.write("\n")
+        fileOps.prRow(fh, row)
 
 class TabFileReader(object):
     def __init__(self, tabFile, rowClass=None, hashAreComments=False, skipBlankLines=False):
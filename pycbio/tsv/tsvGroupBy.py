@@ -0,0 +1,224 @@
+# Copyright 2006-2012 Mark Diekhans
+"""Streaming group-by and aggregation over TSV rows"""
+import sys
+from pycbio.tsv.tsvRow import TsvRow
+from pycbio.tsv.tsvReader import TsvReader
+from pycbio.tsv import TsvError
+
+class Agg(object):
+    """Base class for an aggregation of one column over the rows of a group.
+    A new instance is created for each group.  Derived classes must define
+    the methods add(val), which is called with the column value for each
+    row, and get(), which returns the aggregated value."""
+    def __init__(self, colName):
+        self.colName = colName
+
+class CountAgg(Agg):
+    """count rows in group, or non-None values of the column if a column is
+    specified"""
+    def __init__(self, colName):
+        Agg.__init__(self, colName)
+        self.cnt = 0
+
+    def add(self, val):
+        if (self.colName is None) or (val is not None):
+            self.cnt += 1
+
+    def get(self):
+        return self.cnt
+
+class SumAgg(Agg):
+    "sum of non-None values of a column"
+    def __init__(self, colName):
+        Agg.__init__(self, colName)
+        self.total = 0
+
+    def add(self, val):
+        if val is not None:
+            self.total += val
+
+    def get(self):
+        return self.total
+
+class MinAgg(Agg):
+    "minimum of non-None values of a column, None if there are no values"
+    def __init__(self, colName):
+        Agg.__init__(self, colName)
+        self.minVal = None
+
+    def add(self, val):
+        if (val is not None) and ((self.minVal is None) or (val < self.minVal)):
+            self.minVal = val
+
+    def get(self):
+        return self.minVal
+
+class MaxAgg(Agg):
+    "maximum of non-None values of a column, None if there are no values"
+    def __init__(self, colName):
+        Agg.__init__(self, colName)
+        self.maxVal = None
+
+    def add(self, val):
+        if (val is not None) and ((self.maxVal is None) or (val > self.maxVal)):
+            self.maxVal = val
+
+    def get(self):
+        return self.maxVal
+
+class MeanAgg(Agg):
+    "mean of non-None values of a column, None if there are no values"
+    def __init__(self, colName):
+        Agg.__init__(self, colName)
+        self.total = 0.0
+        self.cnt = 0
+
+    def add(self, val):
+        if val is not None:
+            self.total += val
+            self.cnt += 1
+
+    def get(self):
+        return (self.total / self.cnt) if self.cnt > 0 else None
+
+class DistinctAgg(Agg):
+    "number of distinct non-None values of a column"
+    def __init__(self, colName):
+        Agg.__init__(self, colName)
+        self.vals = set()
+
+    def add(self, val):
+        if val is not None:
+            self.vals.add(val)
+
+    def get(self):
+        return len(self.vals)
+
+# aggregate names that maybe used in specifications
+aggTypes = {"count": CountAgg,
+            "sum": SumAgg,
+            "min": MinAgg,
+            "max": MaxAgg,
+            "mean": MeanAgg,
+            "distinct": DistinctAgg}
+
+class _Group(object):
+    "key and aggregates for one group"
+    __slots__ = ("key", "aggs")
+
+    def __init__(self, key, aggSpecs):
+        self.key = key
+        self.aggs = [aggClass(colName) for (outCol, aggClass, colName) in aggSpecs]
+
+    def add(self, row):
+        for agg in self.aggs:
+            agg.add(None if agg.colName is None else getattr(row, agg.colName))
+
+class TsvGroupBy(object):
+    """Group TSV rows by one or more key columns and compute aggregates over
+    other columns.  Results are TsvRow objects with the key columns followed
+    by one column per aggregate, so they can be written as TSV.
+
+    keyCols - name or sequence of names of columns to group by.
+    aggs - sequence of (outCol, aggType, colName), where aggType is one of
+        the names in aggTypes or an Agg derived class and colName is the input
+        column to aggregate.  colName maybe None for count.
+    isSorted - input is sorted in ascending order by the key columns,
+        compared after type conversion.  Groups are then output as soon as
+        they end, using constant memory, and TsvError is raised if a key
+        is out of order.  Otherwise, all groups are kept in a hash and output
+        at the end, in the order they were first seen.
+
+    Aggregated columns should have types set by the reader's typeMap.
+    """
+    def __init__(self, keyCols, aggs, isSorted=False):
+        if isinstance(keyCols, str):
+            keyCols = (keyCols,)
+        self.keyCols = tuple(keyCols)
+        self.isSorted = isSorted
+        self.aggSpecs = tuple(self.__parseAggSpec(spec) for spec in aggs)
+        # fields used by TsvRow
+        self.columns = list(self.keyCols) + [spec[0] for spec in self.aggSpecs]
+        self.colMap = dict((self.columns[i], i) for i in xrange(len(self.columns)))
+        self.colTypes = None
+        if len(self.colMap) != len(self.columns):
+            raise TsvError("duplicate column names in group-by output: " + ", ".join(self.columns))
+
+    @staticmethod
+    def __parseAggSpec(spec):
+        "convert spec to (outCol, aggClass, colName)"
+        (outCol, aggType, colName) = spec
+        if isinstance(aggType, str):
+            aggClass = aggTypes.get(aggType)
+            if aggClass is None:
+                raise TsvError("unknown aggregate type \"" + aggType + "\", expected one of: "
+                               + ", ".join(sorted(aggTypes.iterkeys())))
+        else:
+            aggClass = aggType
+        if (colName is None) and (aggClass != CountAgg):
+            raise TsvError("column must be specified for aggregate: " + outCol)
+        return (outCol, aggClass, colName)
+
+    def __getKey(self, row):
+        return tuple(getattr(row, col) for col in self.keyCols)
+
+    def __mkRow(self, group):
+        return TsvRow(self, list(group.key) + [agg.get() for agg in group.aggs])
+
+    def __sortedAggregate(self, rows):
+        group = None
+        for row in rows:
+            key = self.__getKey(row)
+            if (group is None) or (key != group.key):
+                if group is not None:
+                    if key < group.key:
+                        raise TsvError("input not sorted by " + ", ".join(self.keyCols)
+                                       + ": " + str(key) + " follows " + str(group.key))
+                    yield self.__mkRow(group)
+                group = _Group(key, self.aggSpecs)
+            group.add(row)
+        if group is not None:
+            yield self.__mkRow(group)
+
+    def __hashAggregate(self, rows):
+        groups = {}
+        groupOrder = []
+        for row in rows:
+            key = self.__getKey(row)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = _Group(key, self.aggSpecs)
+                groupOrder.append(group)
+            group.add(row)
+        for group in groupOrder:
+            yield self.__mkRow(group)
+
+    def aggregate(self, rows):
+        """generator over aggregated rows for each group in rows, which
+        is any iterable of TsvRow objects, such as a TsvReader"""
+        if self.isSorted:
+            return self.__sortedAggregate(rows)
+        else:
+            return self.__hashAggregate(rows)
+
+    def write(self, fh, rows):
+        "aggregate rows and write results as a TSV with a header"
+        fh.write("\t".join(self.columns))
+        fh.write("\n")
+        for row in self.aggregate(rows):
+            row.write(fh)
+
+def tsvGroupBy(fileName, keyCols, aggs, isSorted=False, typeMap=None, **readerArgs):
+    """Generator over results of grouping a TSV file.  See TsvGroupBy for
+    details on keyCols, aggs and isSorted.  Other arguments are passed to
+    TsvReader."""
+    reader = TsvReader(fileName, typeMap=typeMap, **readerArgs)
+    try:
+        for row in TsvGroupBy(keyCols, aggs, isSorted).aggregate(reader):
+            yield row
+    except TsvError:
+        raise
+    except Exception as ex:
+        raise TsvError("group-by failed", reader=reader, cause=ex), None, sys.exc_info()[2]
+    finally:
+        reader.close()
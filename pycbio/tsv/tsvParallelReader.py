@@ -0,0 +1,181 @@
+# Copyright 2006-2012 Mark Diekhans
+"""Parallel parsing of large, uncompressed TSV files using multiple processes"""
+import os, multiprocessing
+from pycbio.sys import fileOps
+from pycbio.tsv.tsvRow import TsvRow
+from pycbio.tsv.categorical import Categorical
+from pycbio.tsv import TsvError
+
+# Column types and file used by workers.  These are set in each worker by
+# _workerInit, which is passed to the pool as its initializer.  The
+# initializer arguments are inherited by the forked workers rather than
+# pickled, as typeMap often contains lambda functions, which can't be pickled.
+_workerFileName = None
+_workerColTypes = None
+_workerNumCols = None
+
+def _workerInit(fileName, colTypes, numCols):
+    global _workerFileName, _workerColTypes, _workerNumCols
+    _workerFileName = fileName
+    _workerColTypes = colTypes
+    _workerNumCols = numCols
+
+def _parseCol(col, ct):
+    if type(ct) == tuple:
+        return ct[0](col)
+    elif ct:
+        return ct(col)
+    else:
+        return col
+
+def _readRange(byteRange):
+    "read lines in a range, returning list of rows split into columns"
+    (start, end) = byteRange
+    with open(_workerFileName, "rb") as fh:
+        fh.seek(start)
+        buf = fh.read(end - start)
+    lines = buf.split("\n")
+    if lines[-1] == "":
+        lines.pop()
+    rows = []
+    for line in lines:
+        row = line.split("\t")
+        if len(row) != _workerNumCols:
+            raise TsvError("%s: line at or after byte offset %d has %d columns, expected %d"
+                           % (_workerFileName, start, len(row), _workerNumCols))
+        rows.append(row)
+    return rows
+
+def _parseRows(byteRange):
+    "worker function to parse a range into a list of rows"
+    rows = _readRange(byteRange)
+    if _workerColTypes is not None:
+        colTypes = _workerColTypes
+        rows = [[_parseCol(row[i], colTypes[i]) for i in xrange(len(row))] for row in rows]
+    return rows
+
+def _parseColumns(byteRange):
+    "worker function to parse a range into a list of columns"
+    rows = _readRange(byteRange)
+    columns = [list(col) for col in zip(*rows)] if len(rows) > 0 else [[] for i in xrange(_workerNumCols)]
+    if _workerColTypes is not None:
+        columns = [[_parseCol(v, ct) for v in col] if ct else col
+                   for col, ct in zip(columns, _workerColTypes)]
+    return columns
+
+class TsvParallelReader(object):
+    """Read an uncompressed TSV file using multiple processes.  The file is
+    split into byte ranges aligned to the start of lines, which are parsed by
+    worker processes and reassembled in the original order.  The header is
+    handled as in TsvReader, removing a leading #.
+
+    Unlike TsvReader, lines are split on tabs without any quote handling, as
+    is done by fileOps.iterRows.  Values of the typeMap must return picklable
+    objects, as the parsed rows are returned from the workers.  Categorical
+    columns are encoded in the parent process, so that codes are consistent,
+    and are returned as arrays of codes in columnar chunks.
+    """
+    def __init__(self, fileName, typeMap=None, defaultColType=None, columnNameMapper=None,
+                 numProcs=None, chunkSize=16*1024*1024):
+        """
+        fileName - name of uncompressed TSV file.
+        typeMap, defaultColType, columnNameMapper - see TsvReader.
+        numProcs - number of worker processes, default is the number of CPUs.
+        chunkSize - approximate size of byte range parsed at one time by
+           a worker.
+        """
+        if fileOps.isCompressed(fileName):
+            raise TsvError("parallel reading of compressed TSV files not supported: " + fileName)
+        self.fileName = fileName
+        self.numProcs = numProcs if numProcs is not None else multiprocessing.cpu_count()
+        self.chunkSize = chunkSize
+        self.columns = []
+        self.colMap = {}
+        self.colTypes = None
+        self.columnNameMapper = columnNameMapper
+        self.__readHeader()
+        self.__initColTypes(typeMap, defaultColType)
+        self.__rowSpec = _ParsedRowSpec(self)
+
+    def __readHeader(self):
+        with open(self.fileName) as fh:
+            line = fh.readline()
+            if len(line) == 0:
+                raise TsvError("empty TSV file: " + self.fileName)
+            self.bodyStart = fh.tell()
+        row = line[0:-1].split("\t")
+        if row[0].startswith('#'):
+            row[0] = row[0][1:]
+        for col in row:
+            if self.columnNameMapper is not None:
+                col = self.columnNameMapper(col)
+            col = intern(col)
+            if col in self.colMap:
+                raise TsvError("Duplicate column name: " + col)
+            self.colMap[col] = len(self.columns)
+            self.columns.append(col)
+
+    def __initColTypes(self, typeMap, defaultColType):
+        if (typeMap is not None) or (defaultColType is not None):
+            typeMap = typeMap if typeMap is not None else {}
+            self.colTypes = [typeMap.get(col, defaultColType) for col in self.columns]
+        # columns to encode in parent
+        self.catCols = []
+        if self.colTypes is not None:
+            self.catCols = [i for i in xrange(len(self.colTypes)) if isinstance(self.colTypes[i], Categorical)]
+
+    def __getWorkerColTypes(self):
+        "column types to use in workers"
+        if self.colTypes is None:
+            return None
+        return [None if isinstance(ct, Categorical) else ct for ct in self.colTypes]
+
+    def __getRanges(self):
+        numRanges = (os.path.getsize(self.fileName) - self.bodyStart) // self.chunkSize
+        return fileOps.lineAlignedRanges(self.fileName, max(numRanges, self.numProcs), self.bodyStart)
+
+    def __mapRanges(self, func):
+        "generator of results of func over ranges, in file order"
+        pool = multiprocessing.Pool(self.numProcs, _workerInit, (self.fileName, self.__getWorkerColTypes(), len(self.columns)))
+        try:
+            for result in pool.imap(func, self.__getRanges()):
+                yield result
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    def __mkRow(self, values):
+        # values are already parsed, so build row without types and then
+        # set types for formatting
+        for i in self.catCols:
+            values[i] = self.colTypes[i].encode(values[i])
+        row = TsvRow(self.__rowSpec, values)
+        row._colTypes_ = self.colTypes
+        return row
+
+    def __iter__(self):
+        "generator over TsvRow objects, in file order"
+        for rows in self.__mapRanges(_parseRows):
+            for values in rows:
+                yield self.__mkRow(values)
+
+    def iterChunks(self):
+        """generator over columnar chunks, in file order. Each chunk is a
+        list, indexed by column number, of lists of column values, or arrays
+        of codes for Categorical columns"""
+        for columns in self.__mapRanges(_parseColumns):
+            for i in self.catCols:
+                columns[i] = self.colTypes[i].encodeColumn(columns[i])
+            yield columns
+
+class _ParsedRowSpec(object):
+    "column information used to construct TsvRow objects from parsed values"
+    __slots__ = ("columns", "colMap", "colTypes")
+
+    def __init__(self, reader):
+        self.columns = reader.columns
+        self.colMap = reader.colMap
+        self.colTypes = None
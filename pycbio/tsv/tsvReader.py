@@ -12,8 +12,6 @@ from pycbio.tsv import TsvError
 # FIXME: put in same module as TSV
 # FIXME: TsvError and preserving the traceback is a pain
 # FIXME: is colMap needed any more???
-# FIXME: need to add write stuff. (see GeneCheck), where str() is called on
-#        alfor all column ty
 # FIXME: change TsvRow to be based on collections.namedtuple **** (thanks Max)
 #
 # rename  typeMap -> colTypes
@@ -30,6 +28,10 @@ strOrNoneType = (lambda v: None if (v == "") else v,
 intOrNoneType = (lambda v: None if (v == "") else int(v),
                  lambda v: "" if (v is None) else str(v))
 
+# typeMap converter for float types were empty represents None
+floatOrNoneType = (lambda v: None if (v == "") else float(v),
+                   lambda v: "" if (v is None) else str(v))
+
 class TsvReader(object):
     """Class for reading TSV files.  Reads header and builds column name to
     column index map.  After a next, object contains a row and each column
@@ -100,7 +102,9 @@ class TsvReader(object):
         """Open TSV file and read header into object.  Removes leading # from
         UCSC header.
 
-        fileName - name of file, opened unless inFh is specified
+        fileName - name of file, opened unless inFh is specified.  This may
+            also be a list of commands or a Pipeline to read from, see
+            fileOps.openInput().
         rowClass - class or class factory function to use for a row. Must take
             TsvReader and list of string values of columns.
         typeMap - if specified, it maps column names to the type objects to
@@ -134,7 +138,7 @@ class TsvReader(object):
         if inFh is not None:
             self.inFh = inFh
         else:
-            self.inFh = fileOps.opengz(fileName, "r")
+            self.inFh = fileOps.openInput(fileName)
         try:
             self.reader = csv.reader(self.inFh, dialect=dialect)
             if columns:
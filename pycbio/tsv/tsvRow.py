@@ -1,4 +1,5 @@
 # Copyright 2006-2012 Mark Diekhans
+from pycbio.tsv.categorical import Categorical
 
 # FIXME: danger of bdump, etc, methods conflicting with columns.  maybe
 # a better convention to avoid collisions
@@ -63,6 +64,8 @@ class TsvRow(object):
                 col = ""
             elif type(ct) == tuple:
                 col = ct[1](col)
+            elif isinstance(ct, Categorical):
+                col = ct.values[col]
             else:
                 col = str(col)
             row.append(col)
@@ -95,8 +98,7 @@ class TsvRow(object):
         return subRow
 
     def write(self, fh):
-        fh.write(str(self))
-        fh.write("\n")
+        fh.write(str(self) + "\n")
 
     def dump(self, fh):
         i = 0;
@@ -0,0 +1,167 @@
+# Copyright 2006-2012 Mark Diekhans
+"""Inference of TSV column types from a sample of rows, with caching of the
+inferred types in a sidecar file."""
+import os
+from pycbio.sys import fileOps
+from pycbio.tsv.tsvReader import TsvReader, strOrNoneType, intOrNoneType, floatOrNoneType
+from pycbio.tsv import TsvError
+
+# names used in schema files for inferred types
+typeNames = {"int": int,
+             "float": float,
+             "str": None,
+             "intern": intern,
+             "intOrNone": intOrNoneType,
+             "floatOrNone": floatOrNoneType,
+             "strOrNone": strOrNoneType}
+
+schemaFileExt = ".tsvschema"
+_schemaFileMagic = "#tsvSchema"
+
+def _isInt(v):
+    "is a string an integer that will format back to the same string?"
+    try:
+        return str(int(v)) == v
+    except ValueError:
+        return False
+
+def _isFloat(v):
+    try:
+        float(v)
+        return True
+    except ValueError:
+        return False
+
+class _ColStats(object):
+    "statistics collected on one column"
+    __slots__ = ("cnt", "emptyCnt", "allInt", "allFloat", "distinct", "maxDistinct")
+
+    def __init__(self, maxDistinct):
+        self.cnt = self.emptyCnt = 0
+        self.allInt = self.allFloat = True
+        self.distinct = set()
+        self.maxDistinct = maxDistinct  # stop collecting after this
+
+    def add(self, v):
+        self.cnt += 1
+        if v == "":
+            self.emptyCnt += 1
+            return
+        if self.allInt and not _isInt(v):
+            self.allInt = False
+        if self.allFloat and (not self.allInt) and not _isFloat(v):
+            self.allFloat = False
+        if len(self.distinct) <= self.maxDistinct:
+            self.distinct.add(v)
+
+    def getTypeName(self, internFrac):
+        if self.emptyCnt == self.cnt:
+            return "str"  # no information
+        hasEmpty = (self.emptyCnt > 0)
+        if self.allInt:
+            return "intOrNone" if hasEmpty else "int"
+        elif self.allFloat:
+            return "floatOrNone" if hasEmpty else "float"
+        elif len(self.distinct) <= max(int(internFrac * self.cnt), 1):
+            return "intern"
+        else:
+            return "str"
+
+class TsvSchema(object):
+    """Inferred column types of a TSV file.  The types are stored as names
+    from typeNames in colTypeNames, a dict of column name to type name.
+    """
+    def __init__(self, colTypeNames, srcSize=None, srcMTime=None):
+        self.colTypeNames = colTypeNames
+        self.srcSize = srcSize
+        self.srcMTime = srcMTime
+
+    def getTypeMap(self):
+        "get typeMap for use with TsvReader"
+        return dict((col, typeNames[tn]) for col, tn in self.colTypeNames.iteritems()
+                    if typeNames[tn] is not None)
+
+    @staticmethod
+    def infer(fileName, sampleRows=1000, internFrac=0.1, **readerArgs):
+        """Infer column types from up to sampleRows rows of the file.  String
+        columns where the number of distinct values is no more than
+        internFrac of the rows sampled are inferred as intern.  Other
+        arguments are passed to TsvReader."""
+        reader = TsvReader(fileName, **readerArgs)
+        try:
+            maxDistinct = max(int(internFrac * sampleRows), 1)
+            colStats = [_ColStats(maxDistinct) for col in reader.columns]
+            iRow = 0
+            for row in reader:
+                for i in xrange(len(colStats)):
+                    colStats[i].add(row[i])
+                iRow += 1
+                if iRow >= sampleRows:
+                    break
+        finally:
+            reader.close()
+        colTypeNames = dict((reader.columns[i], colStats[i].getTypeName(internFrac)) for i in xrange(len(colStats)))
+        st = os.stat(fileName) if os.path.isfile(fileName) else None
+        return TsvSchema(colTypeNames, st.st_size if st else None, st.st_mtime if st else None)
+
+    def write(self, schemaFile):
+        "atomically write schema to a file"
+        tmpFile = fileOps.atomicTmpFile(schemaFile)
+        fh = open(tmpFile, "w")
+        try:
+            fileOps.prRowv(fh, _schemaFileMagic, self.srcSize, repr(self.srcMTime))
+            for col in sorted(self.colTypeNames.iterkeys()):
+                fileOps.prRowv(fh, col, self.colTypeNames[col])
+        finally:
+            fh.close()
+        fileOps.atomicInstall(tmpFile, schemaFile)
+
+    @staticmethod
+    def read(schemaFile):
+        "read a schema file"
+        rows = fileOps.readFileLines(schemaFile)
+        hdr = rows[0].split("\t") if len(rows) > 0 else []
+        if (len(hdr) != 3) or (hdr[0] != _schemaFileMagic):
+            raise TsvError("invalid TSV schema file: " + schemaFile)
+        colTypeNames = {}
+        for line in rows[1:]:
+            (col, tn) = line.split("\t")
+            if tn not in typeNames:
+                raise TsvError("invalid type name \"" + tn + "\" in TSV schema file: " + schemaFile)
+            colTypeNames[col] = tn
+        return TsvSchema(colTypeNames, int(hdr[1]) if hdr[1] != "None" else None,
+                         float(hdr[2]) if hdr[2] != "None" else None)
+
+    def isCurrent(self, fileName):
+        "does this schema appear to be inferred from the current version of fileName"
+        if (self.srcSize is None) or not os.path.isfile(fileName):
+            return False
+        st = os.stat(fileName)
+        return (st.st_size == self.srcSize) and (st.st_mtime == self.srcMTime)
+
+def getSchemaFile(fileName):
+    "get the path to the sidecar file used to cache the schema of a TSV file"
+    return fileName + schemaFileExt
+
+def getCachedSchema(fileName, sampleRows=1000, internFrac=0.1, **readerArgs):
+    """Get the schema for a TSV file, using the sidecar file if it exists
+    and matches the size and modification time of the TSV, otherwise infer the schema and attempt to save
+    it in the sidecar.  Failure to write the sidecar, such as for a read-only
+    directory, is not an error.  Other arguments are as in TsvSchema.infer()"""
+    schemaFile = getSchemaFile(fileName)
+    if os.path.exists(schemaFile):
+        schema = TsvSchema.read(schemaFile)
+        if schema.isCurrent(fileName):
+            return schema
+    schema = TsvSchema.infer(fileName, sampleRows, internFrac, **readerArgs)
+    if schema.srcSize is not None:
+        try:
+            schema.write(schemaFile)
+        except (IOError, OSError):
+            pass
+    return schema
+
+def getCachedTypeMap(fileName, sampleRows=1000, internFrac=0.1, **readerArgs):
+    """get an inferred typeMap for TsvReader, using or creating the cached
+    schema, see getCachedSchema()"""
+    return getCachedSchema(fileName, sampleRows, internFrac, **readerArgs).getTypeMap()
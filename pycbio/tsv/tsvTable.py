@@ -1,7 +1,10 @@
 # Copyright 2006-2012 Mark Diekhans
 from pycbio.tsv.tsvReader import TsvReader
+from pycbio.tsv.tsvWriter import TsvWriter
+from pycbio.tsv.tsvRow import TsvRow
 from pycbio.tsv import TsvError
 from pycbio.sys.multiDict import MultiDict
+from pycbio.sys import fileOps
 import sys,csv
 
 # FIX: maybe make each index it's own class to handle uniq check, etc.
@@ -99,6 +102,7 @@ class TsvTable(list):
             self.columns = reader.columns
             self.colTypes = reader.colTypes
             self.colMap = reader.colMap
+            self.rowClass = reader.rowClass
             self.__buildIndices(uniqKeyCols, multiKeyCols)
             self.__readBody(reader)
         except Exception as ex:
@@ -122,19 +126,18 @@ class TsvTable(list):
             setattr(row, colName, initValue)
 
     def write(self, fh):
-        fh.write(str.join("\t", self.columns))
-        fh.write("\n")
-        for row in self:
-            row.write(fh)
+        """write the table with a header.  Rows are formatted in batches by
+        TsvWriter, unless a rowClass other than TsvRow was specified, in which
+        case the write() method of each row is used."""
+        if self.rowClass is TsvRow:
+            TsvWriter(None, self.columns, colTypes=self.colTypes, outFh=fh).writeRows(self)
+        else:
+            fh.write(str.join("\t", self.columns))
+            fh.write("\n")
+            for row in self:
+                row.write(fh)
 
-# FIXME: duped in TabFile, also file ops
 def tsvPrRow(fh, row):
     """Print a row (list or tupe) to a tab file.
     does string conversions on columns"""
-    cnt = 0;
-    for col in row:
-        if cnt > 0:
-            fh.write("\t")
-        fh.write(str(col))
-        cnt += 1
-    fh.write("\n")
+    fileOps.prRow(fh, row)
@@ -0,0 +1,109 @@
+# Copyright 2006-2012 Mark Diekhans
+"""TSV writing class"""
+from itertools import izip
+from pycbio.sys import fileOps
+from pycbio.tsv.categorical import Categorical
+
+def _mkColFormatter(ct):
+    "create a function to format a column given a typeMap entry"
+    if type(ct) == tuple:
+        fmt = ct[1]
+        return lambda v: "" if (v is None) else fmt(v)
+    elif isinstance(ct, Categorical):
+        values = ct.values
+        return lambda v: "" if (v is None) else values[v]
+    else:
+        return lambda v: "" if (v is None) else str(v)
+
+def _fmtNoTypes(row):
+    return "\t".join(["" if (v is None) else str(v) for v in row])
+
+class TsvWriter(object):
+    """Class for writing TSV files.  Rows are formatted into a single string
+    before being written, and batches of rows are written with one write.
+    Columns are formatted using the format function from the typeMap, or str()
+    if no format function is specified; None is written as an empty string.
+    Files ending in .gz are compressed.
+    """
+    def __init__(self, fileName, columns, typeMap=None, colTypes=None, outFh=None,
+                 writeHeader=True, batchSize=1024):
+        """
+        fileName - name of file, opened unless outFh is specified.
+        columns - list of column names.
+        typeMap - if specified, it maps column names to the type objects,
+            as in TsvReader.  The format function of tuple types is used.
+        colTypes - column types as list parallel to column, such as
+            TsvReader.colTypes.  Used instead of typeMap
+        outFh - If not None, this is used as the open file, rather than
+            opening it.  It is not closed.
+        writeHeader - write a header containing column names
+        batchSize - number of rows to format before writing in writeRows.
+        """
+        self.fileName = fileName
+        self.columns = list(columns)
+        self.batchSize = batchSize
+        if (colTypes is None) and (typeMap is not None):
+            colTypes = [typeMap.get(col) for col in self.columns]
+        self.colFmts = None
+        if colTypes is not None:
+            self.colFmts = [_mkColFormatter(ct) for ct in colTypes]
+        if outFh is not None:
+            self.outFh = outFh
+            self.closeFh = False
+        else:
+            self.outFh = fileOps.opengz(fileName, "w")
+            self.closeFh = True
+        if writeHeader:
+            self.outFh.write("\t".join(self.columns) + "\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def close(self):
+        "close file if it was opened by this object"
+        if self.outFh is not None:
+            if self.closeFh:
+                self.outFh.close()
+            self.outFh = None
+
+    def formatRow(self, row):
+        """format a row, which can be a TsvRow or a list or tuple of values,
+        into a string without a newline"""
+        if self.colFmts is None:
+            return _fmtNoTypes(row)
+        else:
+            return "\t".join([fmt(v) for fmt, v in izip(self.colFmts, row)])
+
+    def writeRow(self, row):
+        "write a TsvRow or a list or tuple of column values"
+        self.outFh.write(self.formatRow(row) + "\n")
+
+    def __writeLines(self, lines):
+        lines.append("")  # get final newline
+        self.outFh.write("\n".join(lines))
+
+    def writeRows(self, rows):
+        "write an iterable of rows, in batches of batchSize"
+        lines = []
+        for row in rows:
+            lines.append(self.formatRow(row))
+            if len(lines) >= self.batchSize:
+                self.__writeLines(lines)
+                lines = []
+        if len(lines) > 0:
+            self.__writeLines(lines)
+
+    def writeColumns(self, columns):
+        """write columnar data, which is a list, index by column number,
+        of lists of column values, such as the chunks returned by
+        TsvParallelReader.iterChunks"""
+        if self.colFmts is None:
+            fmtCols = [["" if (v is None) else str(v) for v in col] for col in columns]
+        else:
+            fmtCols = [[fmt(v) for v in col] for fmt, col in izip(self.colFmts, columns)]
+        lines = ["\t".join(row) for row in izip(*fmtCols)]
+        if len(lines) > 0:
+            self.__writeLines(lines)
@@ -278,6 +278,27 @@ class CmdCompressTests(ExRunTestCaseBase):
         self.diffExpected(".txt")
         self.checkGraphStates(er)
 
+    def __testCompressArgs(self, ext):
+        er = ExRun(verbFlags=verbFlags)
+        ifp = er.getFile(self.getInputFile("numbers.txt"))
+        ofp1 = er.getFile(self.getOutputFile(".txt" + ext))
+        ofp2 = er.getFile(self.getOutputFile(".txt"))
+        er.addCmd(["sort", "-r"], stdin=ifp, stdout=ofp1)
+        er.addCmd(["sed", "-e", "s/^/= /", FileIn(ofp1)], stdout=FileOut(ofp2))
+        try:
+            er.run()
+        except Exception, ex:
+            prExceptions(er, ex)
+            raise
+        self.diffExpected(".txt")
+        self.checkGraphStates(er)
+
+    def testZstdArgs(self):
+        self.__testCompressArgs(".zst")
+
+    def testLz4Args(self):
+        self.__testCompressArgs(".lz4")
+
     def testCmdErr(self):
         "handling of pipes when process has error"
         er = ExRun(verbFlags=set())
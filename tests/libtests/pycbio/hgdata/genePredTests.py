@@ -5,6 +5,7 @@ if __name__ == '__main__':
 from pycbio.sys.testCaseBase import TestCaseBase
 from pycbio.hgdata.genePred import GenePred
 from pycbio.hgdata.genePred import GenePredTbl
+from pycbio.hgdata.genePred import GenePredReader
 
 # lists defining expected results from exon features.
 # they are in the form (utr5 cds utr3)
@@ -88,6 +89,13 @@ class ReadTests(TestCaseBase):
         self.assertEqual(r.name, "NM_000066.1")
         self.chkFeatures(r, featsNM_000066)
 
+    def testReadPipeline(self):
+        gps = list(GenePredReader(["sort", "-k", "1,1", self.getInputFile("fromPslMinTest.gp")]))
+        self.assertEqual(len(gps), 9)
+        names = [gp.name for gp in gps]
+        self.assertEqual(names, sorted(names))
+        self.chkFeatures([gp for gp in gps if gp.name == "NM_000017.1"][0], featsNM_000017)
+
     def testLoadFrameStat(self):
         gpTbl = GenePredTbl(self.getInputFile("fileFrameStatTest.gp"))
         self.assertEqual(len(gpTbl), 5)
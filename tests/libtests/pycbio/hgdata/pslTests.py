@@ -3,7 +3,8 @@ import unittest, sys
 if __name__ == '__main__':
     sys.path.append("../../../..")
 from pycbio.sys.testCaseBase import TestCaseBase
-from pycbio.hgdata.psl import Psl,PslTbl
+from pycbio.hgdata.psl import Psl,PslTbl,PslReader
+from pycbio.sys import fileOps, pipeline
 
 class ReadTests(TestCaseBase):
     def testLoad(self):
@@ -14,6 +15,25 @@ class ReadTests(TestCaseBase):
         self.assertEqual(len(r.blocks), 13)
         self.assertEqual(r.qName, "NM_198943.1")
 
+    def testReadAhead(self):
+        inFh = fileOps.ReadAheadReader(self.getInputFile("pslTest.psl"), blockSize=1024)
+        psls = list(PslReader(None, inFh=inFh))
+        self.assertEqual(len(psls), 14)
+        self.assertEqual(psls[1].qName, "NM_198943.1")
+
+    def testReadPipeline(self):
+        psls = list(PslReader(["sort", "-k", "10,10", self.getInputFile("pslTest.psl")]))
+        self.assertEqual(len(psls), 14)
+        qNames = [p.qName for p in psls]
+        self.assertEqual(qNames, sorted(qNames))
+        psls = list(PslReader(pipeline.Pipeline(["cat", self.getInputFile("pslTest.psl")])))
+        self.assertEqual(len(psls), 14)
+        self.assertEqual(psls[1].qName, "NM_198943.1")
+
+    def testReadPipelineFail(self):
+        with self.assertRaises(pipeline.ProcException):
+            list(PslReader([["cat", self.getInputFile("pslTest.psl")], ["false"]]))
+
     def countQNameHits(self, pslTbl, qName):
         cnt = 0
         for p in pslTbl.getByQName(qName):
@@ -0,0 +1,537 @@
+# Copyright 2006-2012 Mark Diekhans
+import unittest, sys, os, errno, threading, gzip
+if __name__ == '__main__':
+    sys.path.extend(["../../..", "../../../.."])
+from pycbio.sys import fileOps, procOps
+from pycbio.sys.testCaseBase import TestCaseBase
+
+class OpengzTests(TestCaseBase):
+    simple1 = "one\ntwo\nthree\nfour\nfive\nsix\n"
+
+    def __mkCompressed(self, prog, ext):
+        path = self.getOutputFile(ext)
+        procOps.runProc([prog, "-c", self.getInputFile("simple1.txt")], stdout=path)
+        return path
+
+    def __readLines(self, path, decompress):
+        fh = fileOps.opengz(path, decompress=decompress)
+        try:
+            return "".join([line for line in fh])
+        finally:
+            fh.close()
+
+    def __testDecompress(self, decompress):
+        self.assertEqual(self.__readLines(self.__mkCompressed("gzip", ".txt.gz"), decompress), self.simple1)
+        self.assertEqual(self.__readLines(self.__mkCompressed("bzip2", ".txt.bz2"), decompress), self.simple1)
+        self.assertEqual(self.__readLines(self.getInputFile("simple1.txt"), decompress), self.simple1)
+
+    def testInproc(self):
+        self.__testDecompress(fileOps.DECOMPRESS_INPROC)
+
+    def testPipe(self):
+        self.__testDecompress(fileOps.DECOMPRESS_PIPE)
+
+    def testThread(self):
+        self.__testDecompress(fileOps.DECOMPRESS_THREAD)
+
+    def testAuto(self):
+        self.__testDecompress(fileOps.DECOMPRESS_AUTO)
+
+    def testDefaultInproc(self):
+        fh = fileOps.opengz(self.__mkCompressed("gzip", ".txt.gz"))
+        self.assertTrue(isinstance(fh, gzip.GzipFile))
+        fh.close()
+
+    def testPipeError(self):
+        "truncated file is reported as an IOError on close"
+        gzFile = self.__mkCompressed("gzip", ".txt.gz")
+        with open(gzFile) as fh:
+            data = fh.read()
+        with open(gzFile, "w") as fh:
+            fh.write(data[0:len(data)//2])
+        fh = fileOps.opengz(gzFile, decompress=fileOps.DECOMPRESS_PIPE)
+        fh.read()
+        with self.assertRaises(IOError) as cm:
+            fh.close()
+        self.assertEqual(cm.exception.filename, gzFile)
+        self.assertNoChildProcs()
+
+    def testThreadRead(self):
+        fh = fileOps.opengz(self.__mkCompressed("gzip", ".txt.gz"), decompress=fileOps.DECOMPRESS_THREAD)
+        self.assertEqual(fh.readline(), "one\n")
+        self.assertEqual(fh.read(5), "two\nt")
+        self.assertEqual(fh.read(), "hree\nfour\nfive\nsix\n")
+        self.assertEqual(fh.read(), "")
+        fh.close()
+        self.assertSingleThread()
+
+    def testEarlyClose(self):
+        for decompress in (fileOps.DECOMPRESS_PIPE, fileOps.DECOMPRESS_THREAD):
+            fh = fileOps.opengz(self.__mkCompressed("gzip", ".txt.gz"), decompress=decompress)
+            self.assertEqual(fh.readline(), "one\n")
+            fh.close()
+        self.assertSingleThread()
+        self.assertNoChildProcs()
+
+class CompressTests(TestCaseBase):
+    data = "".join(["line %d of some text\n" % i for i in xrange(20000)])
+
+    def __testCompress(self, compress, data, compressLevel=9):
+        gzFile = self.getOutputFile(".txt.gz")
+        with fileOps.opengz(gzFile, "w", compress=compress, compressLevel=compressLevel, compressThreads=2) as fh:
+            fh.write(data)
+        self.assertEqual(procOps.callProc(["zcat", gzFile], keepLastNewLine=True), data)
+        fh = fileOps.opengz(gzFile)
+        self.assertEqual(fh.read(), data)
+        fh.close()
+
+    def testInproc(self):
+        self.__testCompress(fileOps.COMPRESS_INPROC, self.data)
+
+    def testThread(self):
+        self.__testCompress(fileOps.COMPRESS_THREAD, self.data)
+        self.assertSingleThread()
+
+    def testThreadBlocks(self):
+        gzFile = self.getOutputFile(".txt.gz")
+        fh = fileOps._ParallelGzipWriter(gzFile, level=1, numThreads=3, blockSize=1000)
+        fh.writelines(self.data.splitlines(True))
+        fh.close()
+        self.assertEqual(procOps.callProc(["zcat", gzFile], keepLastNewLine=True), self.data)
+
+    def testThreadEmpty(self):
+        self.__testCompress(fileOps.COMPRESS_THREAD, "")
+
+    def testPipe(self):
+        self.__testCompress(fileOps.COMPRESS_PIPE, self.data, compressLevel=1)
+        self.assertNoChildProcs()
+
+    def testAuto(self):
+        self.__testCompress(fileOps.COMPRESS_AUTO, self.data)
+
+    def testDefaultInproc(self):
+        "default is single-threaded"
+        gzFile = self.getOutputFile(".txt.gz")
+        with fileOps.opengz(gzFile, "w") as fh:
+            self.assertTrue(isinstance(fh, gzip.GzipFile))
+            fh.write(self.data)
+        self.assertSingleThread()
+        self.assertEqual(procOps.callProc(["zcat", gzFile], keepLastNewLine=True), self.data)
+
+class BgzfTests(TestCaseBase):
+    lines = ["line %d of some text that is bgzf compressed\n" % i for i in xrange(20000)]
+
+    def __writeBgzf(self):
+        "write test file, returning virtual offsets of each line"
+        bgzFile = self.getOutputFile(".txt.bgz")
+        offsets = []
+        with fileOps.BgzfWriter(bgzFile) as fh:
+            for line in self.lines:
+                offsets.append(fh.tell())
+                fh.write(line)
+        return bgzFile, offsets
+
+    def testReadSequential(self):
+        bgzFile, offsets = self.__writeBgzf()
+        self.assertTrue(fileOps.isBgzf(bgzFile))
+        self.assertFalse(fileOps.isBgzf(self.getInputFile("simple1.txt")))
+        self.assertEqual(procOps.callProc(["zcat", bgzFile], keepLastNewLine=True), "".join(self.lines))
+        fh = fileOps.opengz(bgzFile)
+        self.assertEqual(fh.read(), "".join(self.lines))
+        fh.close()
+        with fileOps.BgzfReader(bgzFile) as fh:
+            self.assertEqual(list(fh), self.lines)
+
+    def testSeek(self):
+        bgzFile, offsets = self.__writeBgzf()
+        with fileOps.BgzfReader(bgzFile) as fh:
+            for i in (19999, 0, 1500, 1501, 7777):
+                fh.seek(offsets[i])
+                self.assertEqual(fh.readline(), self.lines[i])
+            fh.seek(offsets[1500])
+            self.assertEqual(fh.read(len(self.lines[1500]) + 4), self.lines[1500] + "line")
+
+    def testRanges(self):
+        bgzFile, offsets = self.__writeBgzf()
+        ranges = fileOps.bgzfLineAlignedRanges(bgzFile, 4)
+        self.assertTrue(len(ranges) > 1)
+        lines = []
+        with fileOps.BgzfReader(bgzFile) as fh:
+            for (start, end) in ranges:
+                self.assertTrue(start in offsets)
+                fh.seek(start)
+                while (end is None) or (fh.tell() < end):
+                    line = fh.readline()
+                    if len(line) == 0:
+                        break
+                    lines.append(line)
+        self.assertEqual(lines, self.lines)
+
+class ReadAheadTests(TestCaseBase):
+    simple1 = ["one", "two", "three", "four", "five", "six"]
+
+    def testPath(self):
+        with fileOps.ReadAheadReader(self.getInputFile("simple1.txt"), blockSize=5, maxBlocks=2) as fh:
+            self.assertEqual([l[0:-1] for l in fh], self.simple1)
+        self.assertSingleThread()
+
+    def testCompressed(self):
+        gzPath = self.getOutputFile(".txt.gz")
+        procOps.runProc(["gzip", "-c", self.getInputFile("simple1.txt")], stdout=gzPath)
+        with fileOps.ReadAheadReader(gzPath, blockSize=3) as fh:
+            self.assertEqual(list(fileOps.iterLines(fh)), self.simple1)
+
+    def testFileObj(self):
+        inFh = open(self.getInputFile("simple1.txt"))
+        fh = fileOps.ReadAheadReader(inFh, blockSize=4)
+        self.assertEqual(fh.readline(), "one\n")
+        self.assertEqual(fh.read(), "two\nthree\nfour\nfive\nsix\n")
+        fh.close()
+        self.assertTrue(inFh.closed)
+        self.assertSingleThread()
+
+class ZstdLz4Tests(TestCaseBase):
+    data = "".join(["line %d of some text\n" % i for i in xrange(2000)])
+
+    def __testRoundTrip(self, ext, decompCmd):
+        path = self.getOutputFile(".txt" + ext)
+        with fileOps.opengz(path, "w") as fh:
+            fh.write(self.data)
+        self.assertEqual(procOps.callProc([decompCmd, path], keepLastNewLine=True), self.data)
+        fh = fileOps.opengz(path)
+        self.assertEqual(fh.read(), self.data)
+        fh.close()
+        self.assertEqual(fileOps.getCompressFormat(path), ext)
+        self.assertEqual(fileOps.decompressCmd(path), decompCmd)
+        self.assertEqual(list(fileOps.iterLines(path))[-1], "line 1999 of some text")
+
+    def testZstd(self):
+        self.__testRoundTrip(".zst", "zstdcat")
+
+    def testLz4(self):
+        self.__testRoundTrip(".lz4", "lz4cat")
+
+    def testMagic(self):
+        "detection of compression by magic number rather than extension"
+        path = self.getOutputFile(".txt")
+        procOps.runProc(["zstd", "-q", "-c", self.getInputFile("simple1.txt")], stdout=path)
+        self.assertFalse(fileOps.isCompressed(path))
+        self.assertEqual(fileOps.getCompressFormat(path), ".zst")
+        self.assertEqual(fileOps.decompressCmd(path), "zstdcat")
+        self.assertEqual(fileOps.readFileLines(path), ["one", "two", "three", "four", "five", "six"])
+        # non-existent files by extension
+        self.assertEqual(fileOps.getCompressFormat(self.getOutputFile(".none.lz4")), ".lz4")
+        self.assertEqual(fileOps.getCompressFormat(self.getOutputFile(".none.txt")), None)
+
+    def testFifo(self):
+        "FIFOs are not read to check magic number"
+        fifoPath = self.getOutputFile(".fifo.gz")
+        os.mkfifo(fifoPath)
+        self.assertEqual(fileOps.getCompressFormat(fifoPath), ".gz")
+        self.assertEqual(fileOps.decompressCmd(fifoPath), "zcat")
+
+    def testLevel(self):
+        self.assertEqual(fileOps._pipeCompressCmd("x.lz4", None, None), ["lz4", "-q"])
+        self.assertEqual(fileOps._pipeCompressCmd("x.zst", None, None), ["zstd", "-q"])
+        self.assertEqual(fileOps._pipeCompressCmd("x.zst", 3, 2), ["zstd", "-q", "-T2", "-3"])
+        self.assertEqual(fileOps._pipeCompressCmd("x.gz", None, None)[-1], "-9")
+        path = self.getOutputFile(".txt.zst")
+        with fileOps.opengz(path, "w", compressLevel=1) as fh:
+            fh.write(self.data)
+        self.assertEqual(procOps.callProc(["zstdcat", path], keepLastNewLine=True), self.data)
+
+    def testMissingProg(self):
+        path = self.getOutputFile(".txt.zst")
+        procOps.runProc(["zstd", "-q", "-c", self.getInputFile("simple1.txt")], stdout=path)
+        savePath = os.environ["PATH"]
+        os.environ["PATH"] = "/nonexistent"
+        try:
+            with self.assertRaises(IOError) as cm:
+                fileOps.opengz(path)
+        finally:
+            os.environ["PATH"] = savePath
+        self.assertEqual(cm.exception.errno, errno.ENOENT)
+        self.assertEqual(cm.exception.filename, path)
+
+    def testNames(self):
+        self.assertEqual(fileOps.compressCmd("x.zst"), "zstd")
+        self.assertEqual(fileOps.compressCmd("x.lz4"), "lz4")
+        self.assertTrue(fileOps.isCompressed("x.lz4"))
+        self.assertEqual(fileOps.uncompressedBase("x.tsv.zst"), "x.tsv")
+
+class IterTests(TestCaseBase):
+    simple1 = ["one", "two", "three", "four", "five", "six"]
+
+    def testIterLines(self):
+        for bufSize in (1, 3, 4, 1024):
+            self.assertEqual(list(fileOps.iterLines(self.getInputFile("simple1.txt"), bufSize=bufSize)), self.simple1)
+            self.assertEqual(list(fileOps.iterLines(self.getInputFile("simple1.txt"), skipLines=2, bufSize=bufSize)), self.simple1[2:])
+
+    def testIterLinesNoNewline(self):
+        self.createOutputFile(".txt", "one\ntwo")
+        self.assertEqual(list(fileOps.iterLines(self.getOutputFile(".txt"), bufSize=2)), ["one", "two"])
+
+    def testIterLinesFileObj(self):
+        "file objects are not read past the lines returned"
+        with open(self.getInputFile("simple1.txt")) as fh:
+            lines = fileOps.iterLines(fh, skipLines=1)
+            self.assertEqual([lines.next(), lines.next()], ["two", "three"])
+            self.assertEqual(fh.readline(), "four\n")
+
+    def testReadFileLines(self):
+        self.assertEqual(fileOps.readFileLines(self.getInputFile("simple1.txt")), self.simple1)
+
+    def testIterRows(self):
+        self.createOutputFile(".tsv", "#c1\tc2\na\tb\n\nc\td\n#x\n")
+        tsv = self.getOutputFile(".tsv")
+        self.assertEqual(list(fileOps.iterRows(tsv, bufSize=5)), [["a", "b"], [""], ["c", "d"]])
+        self.assertEqual(list(fileOps.iterRows(tsv, skipComments=False)),
+                         [["#c1", "c2"], ["a", "b"], [""], ["c", "d"], ["#x"]])
+        with open(tsv) as fh:
+            self.assertEqual(list(fileOps.iterRows(fh, skipLines=1)), [["a", "b"], [""], ["c", "d"]])
+
+    def testIterRowBatches(self):
+        batches = list(fileOps.iterRowBatches(self.getInputFile("simple1.txt"), bufSize=9))
+        self.assertTrue(len(batches) > 1)
+        self.assertEqual([row[0] for rows in batches for row in rows], self.simple1)
+
+class LineIndexTests(TestCaseBase):
+    def __mkFile(self, ext, lines):
+        self.createOutputFile(ext, "".join([l + "\n" for l in lines]))
+        return self.getOutputFile(ext)
+
+    def testIndex(self):
+        lines = ["line%d%s" % (i, (i % 7) * "x") for i in xrange(100)]
+        path = self.__mkFile(".txt", lines)
+        with fileOps.LineIndex(path) as idx:
+            self.assertEqual(len(idx), 100)
+            self.assertEqual([idx[i] for i in xrange(len(idx))], lines)
+            self.assertEqual(list(idx.iterLines(98)), lines[98:])
+            self.assertEqual(idx.getLineNum(idx.getOffset(50)), 50)
+            self.assertEqual(idx.getLineNum(idx.getOffset(50) + 2), 50)
+            self.assertRaises(IndexError, idx.getOffset, 100)
+        self.assertTrue(os.path.exists(path + fileOps.lineIndexExt))
+        # should be from cache
+        with fileOps.LineIndex(path) as idx:
+            self.assertEqual(idx[99], lines[99])
+
+    def testBlockScan(self):
+        "lines spanning blocks"
+        data = "one\ntwo\n\nthree\nfour"
+        expect = [0, 4, 8, 9, 15, len(data)]
+        for blockSize in (1, 2, 3, 4, 7, 100):
+            self.assertEqual(list(fileOps._buildLineOffsets(data, len(data), blockSize)), expect)
+            self.assertEqual(list(fileOps._buildLineOffsets(data + "\n", len(data) + 1, blockSize)), expect[0:-1] + [len(data) + 1])
+
+    def testStaleCache(self):
+        path = self.__mkFile(".txt", ["one", "two"])
+        fileOps.LineIndex(path).close()
+        with open(path, "a") as fh:
+            fh.write("three")  # no newline
+        with fileOps.LineIndex(path) as idx:
+            self.assertEqual(list(idx.iterLines()), ["one", "two", "three"])
+
+    def testEmpty(self):
+        path = self.__mkFile(".txt", [])
+        with fileOps.LineIndex(path, useCache=False) as idx:
+            self.assertEqual(len(idx), 0)
+            self.assertEqual(idx.byteRanges(4), [])
+
+    def testRanges(self):
+        lines = [str(i) * (i % 13 + 1) for i in xrange(1000)]
+        path = self.__mkFile(".txt", lines)
+        with fileOps.LineIndex(path, useCache=False) as idx:
+            for numRanges in (1, 3, 8, 2000):
+                lineRanges = idx.lineRanges(numRanges)
+                self.assertTrue(len(lineRanges) <= numRanges)
+                self.assertEqual([l for s, e in lineRanges for l in idx.iterLines(s, e)], lines)
+                byteRanges = idx.byteRanges(numRanges)
+                self.assertEqual(byteRanges[0][0], 0)
+                self.assertEqual(byteRanges[-1][1], os.path.getsize(path))
+            self.assertEqual(idx.lineRanges(3, 900)[0][0], 900)
+
+class AtomicOutputSetTests(TestCaseBase):
+    def __outputs(self, num, ext=".txt"):
+        return [self.getOutputFile(".%d%s" % (i, ext)) for i in xrange(num)]
+
+    def __tmpFiles(self):
+        return [f for f in os.listdir(self.getOutputDir()) if ".tmp" in f]
+
+    def testCommit(self):
+        paths = self.__outputs(10) + self.__outputs(2, ".txt.gz")
+        with fileOps.AtomicOutputSet() as outs:
+            for path in paths:
+                outs.open(path).write(path + "\n")
+            self.assertFalse(os.path.exists(paths[0]))
+            self.assertTrue(os.path.exists(outs.getTmpPath(paths[0])))
+        for path in paths:
+            self.assertEqual(fileOps.readFileLines(path), [path])
+        self.assertEqual(self.__tmpFiles(), [])
+
+    def testRollback(self):
+        paths = self.__outputs(3)
+        with self.assertRaises(ValueError):
+            with fileOps.AtomicOutputSet() as outs:
+                for path in paths:
+                    outs.open(path).write("data\n")
+                raise ValueError("fail")
+        for path in paths:
+            self.assertFalse(os.path.exists(path))
+        self.assertEqual(self.__tmpFiles(), [])
+
+    def testCompressed(self):
+        paths = self.__outputs(1, ".txt.gz") + self.__outputs(1, ".txt.zst") + self.__outputs(1, ".txt.lz4")
+        with fileOps.AtomicOutputSet() as outs:
+            for path in paths:
+                outs.open(path).write(path + "\n")
+            self.assertSingleThread()
+        for path in paths:
+            self.assertTrue(fileOps.getCompressFormat(path) is not None)
+            self.assertEqual(fileOps.readFileLines(path), [path])
+
+    def testUnsupportedCompress(self):
+        for ext in (".bz2", ".Z"):
+            path = self.getOutputFile(".txt" + ext)
+            with self.assertRaises(ValueError):
+                with fileOps.AtomicOutputSet() as outs:
+                    outs.open(path).write("data\n")
+            self.assertFalse(os.path.exists(path))
+        self.assertEqual(self.__tmpFiles(), [])
+
+    def testThreads(self):
+        paths = self.__outputs(40)
+        outs = fileOps.AtomicOutputSet(bufSize=4096)
+        def writer(paths):
+            for path in paths:
+                outs.open(path).write(path + "\n")
+        threads = [threading.Thread(target=writer, args=(paths[i::4],)) for i in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        outs.commit()
+        for path in paths:
+            self.assertEqual(fileOps.readFileLines(path), [path])
+
+class ShardedWriterTests(TestCaseBase):
+    def __getRecs(self, num):
+        return [("chr%d" % (i % 7), "rec%d" % i) for i in xrange(num)]
+
+    def __checkShards(self, wr, recs, header=None):
+        for (key, path, count) in wr.getShards():
+            expect = [rec for (k, rec) in recs if k == key]
+            if header is not None:
+                expect.insert(0, header)
+            self.assertEqual(fileOps.readFileLines(path), expect)
+            self.assertEqual(count, len(expect) - (1 if header is not None else 0))
+
+    def testLru(self):
+        recs = self.__getRecs(1000)
+        outPre = self.getOutputFile(".shards")
+        with fileOps.ShardedWriter(outPre + "/{key}.txt", maxOpen=3, bufSize=16,
+                                   manifestPath=outPre + ".manifest.tsv") as wr:
+            for (key, rec) in recs:
+                wr.write(key, rec)
+                self.assertTrue(len(wr.openShards) <= 3)
+        self.assertEqual(len(wr.getShards()), 7)
+        self.__checkShards(wr, recs)
+        manifest = [row for row in fileOps.iterRows(outPre + ".manifest.tsv")]
+        self.assertEqual(manifest[0], ["key", "path", "count"])
+        self.assertEqual(manifest[1], ["chr0", outPre + "/chr0.txt", "143"])
+
+    def testGzipHeader(self):
+        recs = self.__getRecs(500)
+        outPre = self.getOutputFile(".shards")
+        with fileOps.ShardedWriter(lambda key: "%s.%s.txt.gz" % (outPre, key), maxOpen=2, bufSize=64,
+                                   header="#name") as wr:
+            for (key, rec) in recs:
+                wr.writeRow(key, [rec])
+        self.__checkShards(wr, recs, header="#name")
+        self.assertEqual(procOps.callProc(["zcat", outPre + ".chr3.txt.gz"]).split("\n")[0:2], ["#name", "rec3"])
+
+    def testNoManifestOnError(self):
+        recs = self.__getRecs(100)
+        outPre = self.getOutputFile(".shards")
+        manifest = outPre + ".manifest.tsv"
+        with self.assertRaises(ValueError):
+            with fileOps.ShardedWriter(outPre + "/{key}.txt", manifestPath=manifest) as wr:
+                for (key, rec) in recs:
+                    wr.write(key, rec)
+                raise ValueError("fail")
+        self.assertTrue(wr.closed)
+        self.assertFalse(os.path.exists(manifest))
+
+    def testMaxBuffered(self):
+        recs = self.__getRecs(1000)
+        outPre = self.getOutputFile(".shards")
+        with fileOps.ShardedWriter(outPre + "/{key}.txt", bufSize=1024*1024, maxBuffered=100) as wr:
+            for (key, rec) in recs:
+                wr.write(key, rec)
+                self.assertTrue(wr.bufferedBytes < 100)
+        self.assertEqual(wr.bufferedBytes, 0)
+        self.__checkShards(wr, recs)
+
+    def testHashKey(self):
+        self.assertEqual(fileOps.hashShardKey("NM_000014.4", 16), fileOps.hashShardKey("NM_000014.4", 16))
+        self.assertEqual(len(set(fileOps.hashShardKey("NM_%d" % i, 16) for i in xrange(1000))), 16)
+
+class CopyTests(TestCaseBase):
+    def __mkInput(self):
+        inf = self.getOutputFile(".in")
+        with open(inf, "w") as fh:
+            for i in xrange(100000):
+                fh.write("line %d\n" % i)
+        return inf
+
+    def __checkCopyFile(self, zeroCopy):
+        inf = self.__mkInput()
+        outf = self.getOutputFile(".out")
+        self.assertEqual(fileOps.copyFile(inf, outf, zeroCopy=zeroCopy), os.path.getsize(inf))
+        self.assertEqual(open(outf).read(), open(inf).read())
+
+    def testCopyFile(self):
+        self.__checkCopyFile(True)
+
+    def testCopyFileNoZeroCopy(self):
+        self.__checkCopyFile(False)
+
+    def testCopyCount(self):
+        inf = self.__mkInput()
+        outf = self.getOutputFile(".out")
+        with open(inf) as inFh, open(outf, "w") as outFh:
+            inFh.seek(7)
+            self.assertEqual(fileOps.copyFd(inFh.fileno(), outFh.fileno(), count=100, bufSize=16), 100)
+        self.assertEqual(open(outf).read(), open(inf).read()[7:107])
+
+    def testCopyPipe(self):
+        "copy from a pipe and through a pipe"
+        inf = self.__mkInput()
+        outf = self.getOutputFile(".out")
+        (rfd, wfd) = os.pipe()
+        th = threading.Thread(target=lambda: (fileOps.copyFile(inf, "/dev/fd/%d" % wfd), os.close(wfd)))
+        th.start()
+        try:
+            with open(outf, "w") as outFh:
+                cnt = fileOps.copyFd(rfd, outFh.fileno())
+        finally:
+            th.join()
+            os.close(rfd)
+        self.assertEqual(cnt, os.path.getsize(inf))
+        self.assertEqual(open(outf).read(), open(inf).read())
+
+def suite():
+    ts = unittest.TestSuite()
+    ts.addTest(unittest.makeSuite(OpengzTests))
+    ts.addTest(unittest.makeSuite(CompressTests))
+    ts.addTest(unittest.makeSuite(BgzfTests))
+    ts.addTest(unittest.makeSuite(ReadAheadTests))
+    ts.addTest(unittest.makeSuite(ZstdLz4Tests))
+    ts.addTest(unittest.makeSuite(IterTests))
+    ts.addTest(unittest.makeSuite(LineIndexTests))
+    ts.addTest(unittest.makeSuite(AtomicOutputSetTests))
+    ts.addTest(unittest.makeSuite(ShardedWriterTests))
+    ts.addTest(unittest.makeSuite(CopyTests))
+    return ts
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+# Copyright 2006-2012 Mark Diekhans
+import unittest, sys
+if __name__ == '__main__':
+    sys.path.extend(["../../..", "../../../.."])
+from pycbio.sys.pipeline import ProcException, ProcDagTimeout
+from pycbio.sys.pipelineLoop import PipelineLoop
+from pycbio.sys.testCaseBase import TestCaseBase
+
+class PipelineLoopTests(TestCaseBase):
+    def testIterLines(self):
+        nopen = self.numOpenFiles()
+        with PipelineLoop() as loop:
+            lpl = loop.add([["printf", "one\\ntwo\\nthree"], ["sort"]])
+            self.assertEqual(list(lpl.iterLines()), ["one", "three", "two"])
+        self.assertNoChildProcs()
+        self.assertNumOpenFilesSame(nopen)
+
+    def testStdin(self):
+        data = "".join(["%d\n" % i for i in xrange(100000)])
+        with PipelineLoop() as loop:
+            lpl = loop.add([["cat"], ["wc", "-l"]], stdin=data)
+            self.assertEqual([l.strip() for l in lpl.getOutput()], ["100000"])
+
+    def testMany(self):
+        nopen = self.numOpenFiles()
+        results = {}
+        done = []
+        def onLine(lpl, line):
+            results.setdefault(lpl, []).append(line)
+        with PipelineLoop() as loop:
+            lpls = [loop.add([["seq", str(i)], ["tail", "-1"]], onLine=onLine, onDone=done.append)
+                    for i in xrange(1, 51)]
+            loop.run()
+        self.assertEqual(len(done), 50)
+        for i in xrange(len(lpls)):
+            self.assertEqual(results[lpls[i]], [str(i + 1)])
+        self.assertNoChildProcs()
+        self.assertNumOpenFilesSame(nopen)
+
+    def testFail(self):
+        with PipelineLoop() as loop:
+            bad = loop.add([["sh", "-c", "echo bad news >&2; exit 3"]])
+            good = loop.add([["echo", "good"]])
+            noexec = loop.add([["pipelineLoopTestsNoSuchProg"]])
+            with self.assertRaises(ProcException) as cm:
+                bad.wait()
+            self.assertEqual(cm.exception.returncode, 3)
+            self.assertEqual(cm.exception.stderr, "bad news\n")
+            self.assertEqual(good.getOutput(), ["good"])
+            self.assertTrue(noexec.failed())
+        self.assertNoChildProcs()
+
+    def testTimeout(self):
+        done = []
+        with PipelineLoop() as loop:
+            slow = loop.add([["sleep", "30"], ["cat"]], timeout=0.5, onDone=done.append)
+            fast = loop.add([["echo", "fast"]], timeout=30)
+            with self.assertRaises(ProcDagTimeout) as cm:
+                slow.wait()
+            self.assertEqual(sorted(cm.exception.running), ["cat", "sleep 30"])
+            self.assertEqual(done, [slow])
+            self.assertEqual(fast.getOutput(), ["fast"])
+        self.assertNoChildProcs()
+        self.assertSingleThread()
+
+def suite():
+    ts = unittest.TestSuite()
+    ts.addTest(unittest.makeSuite(PipelineLoopTests))
+    return ts
+
+if __name__ == '__main__':
+    unittest.main()
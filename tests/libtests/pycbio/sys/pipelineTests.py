@@ -1,9 +1,9 @@
 # Copyright 2006-2012 Mark Diekhans
-import unittest, sys
+import unittest, sys, os
 if __name__ == '__main__':
     sys.path.extend(["../../..", "../../../.."])
 from pycbio.sys.pipeline import *
-from pycbio.sys import procOps
+from pycbio.sys import procOps, fileOps
 from pycbio.sys.testCaseBase import TestCaseBase
 
 # FIXME from: ccds2/modules/gencode/src/progs/gencodeMakeTracks/gencodeGtfToGenePred
@@ -109,6 +109,30 @@ class PipelineTests(TestCaseBase):
 
         self.diffExpected(".wc")
 
+    def testPumpRead(self):
+        inf = self.getInputFile("simple1.txt")
+        infGz = self.getOutputFile(".txt.gz")
+        outf = self.getOutputFile(".out")
+        procOps.runProc(("gzip", "-c", inf), stdout=infGz)
+
+        pl = Pipeline(("gzip", "-dc"), "r", otherEnd=infGz)
+        cnt = pl.pump(outf)
+        pl.wait()
+        self.assertEqual(fileOps.readFileLines(outf), fileOps.readFileLines(inf))
+        self.assertEqual(cnt, os.path.getsize(inf))
+
+    def testPumpWrite(self):
+        inf = self.getInputFile("simple1.txt")
+        outf = self.getOutputFile(".out")
+
+        pl = Pipeline(("sort", "-r"), "w", otherEnd=outf)
+        pl.write("zero\n")
+        with open(inf) as fh:
+            pl.pump(fh, zeroCopy=False)
+        pl.wait()
+        self.assertEqual(fileOps.readFileLines(outf),
+                         sorted(fileOps.readFileLines(inf) + ["zero"], reverse=True))
+
     def XXtestPassRead(self):
         "using FIFO to pass pipe to another process for reading"
         # FIXME: should this be supported somehow
@@ -1,9 +1,11 @@
 # Copyright 2006-2012 Mark Diekhans
-import unittest, sys, re, os
+import unittest, sys, re, os, itertools, time, signal
 if __name__ == '__main__':
     sys.path.extend(["../../..", "../../../.."])
 from pycbio.sys.pipeline import ProcDag, ProcException, ProcDagException, Pipe, DataReader, DataWriter, File, PIn, POut
-from pycbio.sys import procOps
+from pycbio.sys.pipeline import StreamReader, StreamWriter, Tee
+from pycbio.sys.pipeline import Procline, PipelinePool, ProcDagTimeout
+from pycbio.sys import procOps, fileOps, trace, pipeline
 from pycbio.sys.testCaseBase import TestCaseBase
 
 class ProcDagTests(TestCaseBase):
@@ -72,6 +74,20 @@ class ProcDagTests(TestCaseBase):
                       + expect + "', cause: " + str(getattr(ex,"cause", None)))
         self.commonChecks(nopen, pd, "procDoesNotExist -r <[DataWriter]")
 
+    def testMissingProgNoStart(self):
+        "missing program detected before any process is started"
+        nopen = self.numOpenFiles()
+        pd = ProcDag()
+        io = Pipe()
+        p1 = pd.create(("sleep", "30"), stdout=io)
+        p2 = pd.create(("procDoesNotExist",), stdin=io)
+        with self.assertRaises(ProcException) as cm:
+            pd.wait()
+        self.assertTrue(str(cm.exception).startswith("exec failed: procDoesNotExist,\n    caused by: OSError: [Errno 2] No such file or directory"))
+        self.assertEqual(p1.pid, None)
+        self.assertEqual(p2.pid, None)
+        self.assertEqual(self.numOpenFiles(), nopen)
+
     def testStdinMem(self):
         "write from memory to stdin"
         nopen = self.numOpenFiles()
@@ -290,9 +306,384 @@ class ProcDagTests(TestCaseBase):
             self.fail("'"+ msg + "' != '"+ expect + "'")
         self.commonChecks(nopen, pd, "{CYCLE}: cat ; cat ; cat /dev/stdin <([Pipe])")
 
+    def testSameStages(self):
+        "pipeline where a stage is the same as the last stage"
+        dr = DataReader()
+        pl = Procline([["echo", "hello"], ["cat"], ["cat"]], stdout=dr)
+        pl.wait()
+        self.assertEqual(dr.get(), "hello\n")
+        self.assertEqual(str(pl), "echo hello | cat | cat >[DataWriter]")
+
+    def testErrStderr(self):
+        "all of stderr saved by a DataReader is in the exception"
+        for i in xrange(10):
+            dr = DataReader()
+            pl = Procline(["sh", "-c", "echo bad news >&2; exit 1"], stderr=dr)
+            with self.assertRaises(ProcException) as cm:
+                pl.wait()
+            self.assertEqual(cm.exception.stderr, "bad news\n")
+
+class PipelinePoolTests(TestCaseBase):
+    def testMany(self):
+        nopen = self.numOpenFiles()
+        pool = PipelinePool(maxRunning=3)
+        outFiles = [self.getOutputFile(".%d.txt.gz" % i) for i in xrange(20)]
+        for i in xrange(len(outFiles)):
+            pool.add(Procline([["echo", "line", str(i)], ["sort"], ["gzip", "-c"]], stdout=outFiles[i]), tag=i)
+        pool.wait()
+        pool.raiseIfFailed()
+        for i in xrange(len(outFiles)):
+            self.assertEqual(fileOps.readFileLines(outFiles[i]), ["line " + str(i)])
+        stats = pool.getStats()
+        self.assertEqual(stats.numJobs, 20)
+        self.assertEqual(stats.numFailed, 0)
+        self.assertTrue(stats.maxLatency >= stats.minLatency)
+        self.assertNoChildProcs()
+        self.assertNumOpenFilesSame(nopen)
+
+    def testFailures(self):
+        pool = PipelinePool(maxRunning=2)
+        pool.add([["true"], ["cat"]], tag="ok1")
+        pool.add([["false"], ["cat"]], tag="fail")
+        pool.add([["procDagTestsNoSuchProg"]], tag="noexec")
+        stderrDag = ProcDag()
+        stderrDag.create(["sh", "-c", "echo bad >&2; exit 2"], stderr=DataReader)
+        pool.add(stderrDag, tag="stderr")
+        pool.add(["true"], tag="ok2")
+        pool.wait()
+        self.assertEqual([str(j) for j in pool.getFailed()], ["fail", "noexec", "stderr"])
+        with self.assertRaises(ProcException) as cm:
+            pool.jobs[3].raiseIfExcept()
+        self.assertEqual(cm.exception.stderr, "bad\n")
+        with self.assertRaises(ProcDagException) as cm:
+            pool.raiseIfFailed()
+        self.assertTrue(str(cm.exception).startswith("3 of 5 pipelines failed"))
+        self.assertEqual(pool.getStats().numFailed, 3)
+        self.assertNoChildProcs()
+
+class StreamTests(TestCaseBase):
+    def testStreamReader(self):
+        "incrementally read output larger than the queue"
+        nopen = self.numOpenFiles()
+        pd = ProcDag()
+        sr = StreamReader(chunkSize=4096, maxChunks=2)
+        pd.create(("seq", "1", "100000"), stdout=sr)
+        pd.start()
+        cnt = 0
+        for line in sr:
+            cnt += 1
+            self.assertEqual(line, str(cnt))
+        pd.wait()
+        self.assertEqual(cnt, 100000)
+        self.assertEqual(str(pd), "seq 1 100000 >[StreamReader]")
+        self.assertNoChildProcs()
+        self.assertNumOpenFilesSame(nopen)
+
+    def testStreamReaderChunks(self):
+        pd = ProcDag()
+        sr = StreamReader()
+        pd.create(("printf", "one\ntwo"), stdout=sr)
+        pd.start()
+        data = "".join(sr.iterChunks())
+        pd.wait()
+        self.assertEqual(data, "one\ntwo")
+        self.assertEqual(list(sr.iterLines()), [])
+
+    def testStreamReaderUnconsumed(self):
+        "unconsumed output is discarded"
+        nopen = self.numOpenFiles()
+        pd = ProcDag()
+        sr = StreamReader(maxChunks=1)
+        pd.create(("echo", "hello"), stdout=sr)
+        pd.wait()
+        self.assertNoChildProcs()
+        self.assertNumOpenFilesSame(nopen)
+
+    def testStreamWriter(self):
+        "write from a generator"
+        nopen = self.numOpenFiles()
+        pd = ProcDag()
+        sw = StreamWriter("%d\n" % i for i in xrange(100000))
+        dr = DataReader()
+        pd.create(("wc", "-l"), stdin=sw, stdout=dr)
+        pd.wait()
+        self.assertEqual(dr.get().strip(), "100000")
+        self.assertEqual(str(pd), "wc -l <[StreamWriter] >[DataWriter]")
+        self.assertNoChildProcs()
+        self.assertNumOpenFilesSame(nopen)
+
+    def testStreamWriterEarlyExit(self):
+        "process exits without reading all of an infinite generator"
+        nopen = self.numOpenFiles()
+        pd = ProcDag()
+        sw = StreamWriter("%d\n" % i for i in itertools.count())
+        dr = DataReader()
+        pd.create(("head", "-2"), stdin=sw, stdout=dr)
+        pd.wait()
+        self.assertEqual(dr.get(), "0\n1\n")
+        self.assertNoChildProcs()
+        self.assertNumOpenFilesSame(nopen)
+
+    def testStreamWriterExcept(self):
+        def gen():
+            yield "one\n"
+            raise ValueError("gen failed")
+        pd = ProcDag()
+        pd.create(("cat",), stdin=StreamWriter(gen()), stdout="/dev/null")
+        with self.assertRaises(ValueError):
+            pd.wait()
+        self.assertNoChildProcs()
+
+    def testStreamThrough(self):
+        "stream through a process"
+        pd = ProcDag()
+        sr = StreamReader()
+        pd.create(("tr", "a-z", "A-Z"), stdin=StreamWriter(["one\n", "two\n"]), stdout=sr)
+        pd.start()
+        self.assertEqual(list(sr), ["ONE", "TWO"])
+        pd.wait()
+
+class ResourceTests(TestCaseBase):
+    def testResources(self):
+        pl = Procline([["sh", "-c", "i=0; while [ $i -lt 20000 ]; do i=$((i+1)); done; echo $i"], ["cat"]],
+                      stdout="/dev/null")
+        pl.wait()
+        for p in pl.procs:
+            self.assertTrue(p.resources is not None)
+            self.assertTrue(p.resources.maxRss > 0)
+            self.assertTrue(p.resources.wallTime > 0.0)
+        total = pl.getTotalResources()
+        self.assertTrue(total.userTime + total.sysTime > 0.0)
+        self.assertEqual(total.maxRss, max(p.resources.maxRss for p in pl.procs))
+        lines = pl.getResourceTable().split("\n")
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[0].split()[0:3], ["user", "sys", "maxRss"])
+        cmds = sorted(l.split("  ")[-1] for l in lines[1:3])
+        self.assertEqual(cmds, ["cat", 'sh -c "i=0; while [ $i -lt 20000 ]; do i=$((i+1)); done; echo $i"'])
+        self.assertTrue(lines[3].endswith("  [total]"))
+
+    def testResourceTableArgs(self):
+        "non-string arguments in resource table"
+        dr = DataReader()
+        pl = Procline([["seq", 5], ["head", "-n", 2]], stdout=dr)
+        pl.wait()
+        self.assertEqual(dr.get(), "1\n2\n")
+        cmds = sorted(l.split("  ")[-1] for l in pl.getResourceTable().split("\n")[1:3])
+        self.assertEqual(cmds, ["head -n 2", "seq 5"])
+
+        pd = ProcDag()
+        dw = DataWriter("one\ntwo\n")
+        pd.create(("cat", PIn(dw)), stdout="/dev/null")
+        pd.wait()
+        lines = pd.getResourceTable().split("\n")
+        self.assertEqual(lines[1].split("  ")[-1], "cat <([DataWriter])")
+
+    def testTraceArgs(self):
+        traceFile = self.getOutputFile(".trace")
+        tr = trace.Trace(traceFile, ignoreMods=[trace, "pycbio.sys.pipeline", "pycbio.sys.fifo"])
+        tr.enable()
+        try:
+            Procline([["seq", 5], ["head", "-n", 2]], stdout="/dev/null").wait()
+        finally:
+            tr.close()
+        lines = fileOps.readFileLines(traceFile)
+        self.assertTrue("ProcDag resources: seq 5 | head -n 2 >/dev/null" in lines)
+
+    def testPoolResources(self):
+        pool = PipelinePool(maxRunning=2)
+        for i in xrange(3):
+            pool.add([["true"], ["cat"]])
+        pool.wait()
+        for job in pool.jobs:
+            self.assertEqual(len([p for p in job.dag.procs if p.resources is not None]), 2)
+
+    def testTrace(self):
+        traceFile = self.getOutputFile(".trace")
+        tr = trace.Trace(traceFile, ignoreMods=[trace, "pycbio.sys.pipeline", "pycbio.sys.fifo"])
+        tr.enable()
+        try:
+            Procline([["true"], ["cat"]], stdout="/dev/null").wait()
+        finally:
+            tr.close()
+        self.assertTrue(trace.getCurrentTrace() is None)
+        lines = fileOps.readFileLines(traceFile)
+        self.assertTrue("ProcDag resources: true | cat >/dev/null" in lines)
+        self.assertTrue(lines[-1].endswith("  [total]"))
+
+class SpawnTests(TestCaseBase):
+    "tests of both posix_spawn and fork process start"
+    def __runBoth(self, testFunc, noListFds=False):
+        saveEnabled = pipeline.spawnEnabled
+        saveGetOpenFds = pipeline._getOpenFds
+        try:
+            for spawnEnabled in (True, False):
+                pipeline.spawnEnabled = spawnEnabled
+                if noListFds:
+                    pipeline._getOpenFds = lambda: None
+                testFunc()
+        finally:
+            pipeline.spawnEnabled = saveEnabled
+            pipeline._getOpenFds = saveGetOpenFds
+
+    def __checkStages(self):
+        dr = DataReader()
+        pl = Procline([["echo", "hello"], ["cat"], ["cat"]], stdout=dr)
+        pl.wait()
+        self.assertEqual(dr.get(), "hello\n")
+        self.assertEqual(str(pl), "echo hello | cat | cat >[DataWriter]")
+
+    def testStages(self):
+        self.__runBoth(self.__checkStages)
+
+    def __checkFiles(self):
+        inf = self.getInputFile("simple1.txt")
+        outf = self.getOutputFile(".out")
+        Procline([["sort", "-r"], ["cat"]], stdin=inf, stdout=outf).wait()
+        Procline(["echo", "end"], stdout=File(outf, append=True)).wait()
+        self.assertEqual(fileOps.readFileLines(outf),
+                         ["two", "three", "six", "one", "four", "five", "end"])
+
+    def testFiles(self):
+        self.__runBoth(self.__checkFiles)
+
+    def __checkExecFail(self):
+        pd = ProcDag()
+        pd.create(["procDoesNotExist"], stdout=DataReader())
+        with self.assertRaises(ProcException) as cm:
+            pd.wait()
+        self.assertTrue(str(cm.exception).startswith("exec failed: procDoesNotExist"))
+        self.assertNoChildProcs()
+
+    def testExecFail(self):
+        self.__runBoth(self.__checkExecFail)
+
+    def __checkFdsClosed(self):
+        with open(self.getInputFile("simple1.txt")) as fh:
+            dr = DataReader()
+            Procline(["ls", "/proc/self/fd"], stdout=dr).wait()
+            # 3 is used by ls
+            self.assertEqual(sorted(dr.get().split()), ["0", "1", "2", "3"])
+
+    def testFdsClosed(self):
+        if not os.path.exists("/proc/self/fd"):
+            return
+        self.__runBoth(self.__checkFdsClosed)
+        self.__runBoth(self.__checkFdsClosed, noListFds=True)
+
+class TeeTests(TestCaseBase):
+    def testTee(self):
+        "one decompression feeding several processes"
+        nopen = self.numOpenFiles()
+        infGz = self.getOutputFile(".txt.gz")
+        procOps.runProc(["gzip", "-c", self.getInputFile("simple1.txt")], stdout=infGz)
+        pd = ProcDag()
+        tee = Tee(bufSize=8)
+        sortOut = DataReader()
+        wcOut = DataReader()
+        pd.create(["zcat", infGz], stdout=tee)
+        pd.create(["sort"], stdin=tee, stdout=sortOut)
+        pd.create(["wc", "-l"], stdin=tee, stdout=wcOut)
+        pd.wait()
+        self.assertEqual(sortOut.get(), "five\nfour\none\nsix\nthree\ntwo\n")
+        self.assertEqual(wcOut.get().strip(), "6")
+        self.assertNoChildProcs()
+        self.assertNumOpenFilesSame(nopen)
+
+    def testTeeArg(self):
+        "tee to a file argument"
+        pd = ProcDag()
+        tee = Tee()
+        catOut = DataReader()
+        tailOut = DataReader()
+        pd.create(["seq", "1", "100000"], stdout=tee)
+        pd.create(["cat", PIn(tee)], stdout=catOut)
+        pd.create(["tail", "-1"], stdin=tee, stdout=tailOut)
+        pd.wait()
+        self.assertEqual(len(catOut.get().split("\n")), 100001)
+        self.assertEqual(tailOut.get(), "100000\n")
+        self.assertNoChildProcs()
+
+    def testTeeEarlyExit(self):
+        "consumers exiting without reading all input"
+        pd = ProcDag()
+        tee = Tee()
+        out2 = DataReader()
+        out3 = DataReader()
+        pd.create(["yes"], stdout=tee)
+        pd.create(["head", "-2"], stdin=tee, stdout=out2)
+        pd.create(["head", "-3"], stdin=tee, stdout=out3)
+        pd.wait()
+        self.assertEqual(out2.get(), "y\ny\n")
+        self.assertEqual(out3.get(), "y\ny\ny\n")
+        self.assertNoChildProcs()
+
+    def testTeeNoConsumers(self):
+        pd = ProcDag()
+        pd.create(["true"], stdout=Tee())
+        with self.assertRaises(Exception) as cm:
+            pd.wait()
+        self.assertEqual(str(cm.exception), "Tee must be used for process input")
+        self.assertNoChildProcs()
+
+class TimeoutTests(TestCaseBase):
+    def testDagTimeout(self):
+        nopen = self.numOpenFiles()
+        startTime = time.time()
+        with self.assertRaises(ProcDagTimeout) as cm:
+            Procline([["sleep", "30"], ["cat"]], stdout="/dev/null", timeout=0.5).wait()
+        self.assertTrue(time.time() - startTime < 10.0)
+        self.assertEqual(sorted(cm.exception.running), ["cat", "sleep 30"])
+        self.assertNoChildProcs()
+        self.assertNumOpenFilesSame(nopen)
+
+    def testProcTimeout(self):
+        pd = ProcDag()
+        dr = DataReader()
+        pd.create(["sh", "-c", "echo started; exec sleep 30"], stdout=dr, timeout=0.5)
+        pd.create(["true"])
+        with self.assertRaises(ProcDagTimeout) as cm:
+            pd.wait()
+        self.assertEqual(str(cm.exception),
+                         "timeout of 0.5 seconds exceeded, killed running processes: sh -c \"echo started; exec sleep 30\"")
+        self.assertEqual(dr.get(), "started\n")
+        self.assertNoChildProcs()
+
+    def testKillEscalation(self):
+        "process ignoring SIGTERM"
+        pl = Procline(["sh", "-c", "trap '' TERM; sleep 30"], timeout=0.3)
+        pl.killGrace = 0.3
+        startTime = time.time()
+        with self.assertRaises(ProcDagTimeout):
+            pl.wait()
+        self.assertTrue(time.time() - startTime < 10.0)
+        self.assertEqual(list(pl.procs)[0].returncode, -signal.SIGKILL)
+        self.assertNoChildProcs()
+
+    def testNoTimeout(self):
+        dr = DataReader()
+        pl = Procline([["echo", "hello"], ["cat"]], stdout=dr, timeout=30)
+        pl.wait()
+        self.assertEqual(dr.get(), "hello\n")
+        self.assertTrue(pl.timeoutExcept is None)
+
+    def testPoolTimeout(self):
+        pool = PipelinePool(maxRunning=2)
+        slow = pool.add(Procline([["sleep", "30"]], timeout=0.5))
+        fast = pool.add(Procline([["true"]], timeout=30))
+        pool.wait()
+        self.assertTrue(isinstance(slow.exceptInfo[1], ProcDagTimeout))
+        self.assertFalse(fast.failed())
+        self.assertNoChildProcs()
+
 def suite():
     ts = unittest.TestSuite()
     ts.addTest(unittest.makeSuite(ProcDagTests))
+    ts.addTest(unittest.makeSuite(PipelinePoolTests))
+    ts.addTest(unittest.makeSuite(StreamTests))
+    ts.addTest(unittest.makeSuite(ResourceTests))
+    ts.addTest(unittest.makeSuite(SpawnTests))
+    ts.addTest(unittest.makeSuite(TeeTests))
+    ts.addTest(unittest.makeSuite(TimeoutTests))
     return ts
 
 if __name__ == '__main__':
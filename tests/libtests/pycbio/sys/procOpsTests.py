@@ -1,5 +1,5 @@
 # Copyright 2006-2012 Mark Diekhans
-import unittest, sys
+import unittest, sys, os
 if __name__ == '__main__':
     sys.path.extend(["../../..", "../../../.."])
 from pycbio.sys import procOps, pipeline
@@ -19,6 +19,16 @@ class ProcRunTests(TestCaseBase):
             procOps.callProc(["false"])
         self.assertEqual(str(cm.exception), 'process exited 1: false')
 
+    def testCallTimeout(self):
+        with self.assertRaises(pipeline.ProcDagTimeout) as cm:
+            procOps.callProc([["sleep", "30"], ["cat"]], timeout=0.5)
+        self.assertEqual(sorted(cm.exception.running), ["cat", "sleep 30"])
+
+    def testRunTimeout(self):
+        procOps.runProc(["true"], timeout=30)
+        with self.assertRaises(pipeline.ProcDagTimeout):
+            procOps.runProcCode(["sleep", "30"], timeout=0.5)
+
     def testCallLines(self):
         out = procOps.callProcLines(["sort", self.getInputFile("simple1.txt")])
         self.assertEqual(out, ['five', 'four', 'one', 'six', 'three', 'two'])
@@ -76,6 +86,48 @@ class ProcRunTests(TestCaseBase):
             procOps.runProc(["false"], stdin=self.getInputFile("simple1.txt"))
         self.assertEqual(str(cm.exception), 'process exited 1: false')
 
+class FindProgTests(TestCaseBase):
+    def setUp(self):
+        self.savePath = os.environ["PATH"]
+        procOps.flushProgCache()
+
+    def tearDown(self):
+        os.environ["PATH"] = self.savePath
+        procOps.flushProgCache()
+
+    def __mkProg(self, name):
+        progDir = os.path.abspath(self.getOutputFile(".bin"))
+        if not os.path.exists(progDir):
+            os.makedirs(progDir)
+        prog = os.path.join(progDir, name)
+        with open(prog, "w") as fh:
+            fh.write("#!/bin/sh\necho " + name + "\n")
+        os.chmod(prog, 0o755)
+        return prog
+
+    def testFind(self):
+        self.assertEqual(procOps.findProg("sh"), procOps.which("sh"))
+        self.assertTrue(os.path.isabs(procOps.findProg("sh")))
+        self.assertEqual(procOps.findProg("procDoesNotExist"), None)
+        with self.assertRaises(Exception):
+            procOps.which("procDoesNotExist")
+
+    def testPathChange(self):
+        prog = self.__mkProg("fooProg")
+        self.assertEqual(procOps.findProg("fooProg"), None)
+        os.environ["PATH"] = os.path.dirname(prog) + os.pathsep + self.savePath
+        self.assertEqual(procOps.findProg("fooProg"), prog)
+        self.assertEqual(procOps.callProc(["fooProg"]), "fooProg")
+
+    def testFlush(self):
+        prog = self.__mkProg("barProg")
+        os.environ["PATH"] = os.path.dirname(prog) + os.pathsep + self.savePath
+        self.assertEqual(procOps.findProg("barProg"), prog)
+        os.unlink(prog)
+        self.assertEqual(procOps.findProg("barProg"), prog)  # cached
+        procOps.flushProgCache()
+        self.assertEqual(procOps.findProg("barProg"), None)
+
 class ShellQuoteTests(TestCaseBase):
     # set of test words and expected response string
     testData = (
@@ -99,6 +151,7 @@ class ShellQuoteTests(TestCaseBase):
 def suite():
     ts = unittest.TestSuite()
     ts.addTest(unittest.makeSuite(ProcRunTests))
+    ts.addTest(unittest.makeSuite(FindProgTests))
     ts.addTest(unittest.makeSuite(ShellQuoteTests))
     return ts
 
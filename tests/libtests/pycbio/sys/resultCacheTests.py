@@ -0,0 +1,107 @@
+# Copyright 2006-2012 Mark Diekhans
+import unittest, sys, os
+if __name__ == '__main__':
+    sys.path.extend(["../../..", "../../../.."])
+from pycbio.sys import fileOps
+from pycbio.sys.resultCache import ResultCache, cachedObject, cachedFile
+from pycbio.sys.testCaseBase import TestCaseBase
+
+class ResultCacheTests(TestCaseBase):
+    def __mkInput(self, ext, lines):
+        path = self.getOutputFile(ext)
+        with open(path, "w") as fh:
+            for line in lines:
+                fh.write(line + "\n")
+        return path
+
+    def __mkCache(self, **kwargs):
+        cacheDir = self.getOutputFile(".cache")
+        if os.path.exists(cacheDir):
+            fileOps.rmTree(cacheDir)
+        return ResultCache(cacheDir, **kwargs)
+
+    def testObject(self):
+        cache = self.__mkCache()
+        inFile = self.__mkInput(".txt", ["one", "two", "three"])
+        calls = []
+
+        @cachedObject(cache, fileArgs=("inFile",))
+        def countLines(inFile, minLen=0):
+            calls.append(inFile)
+            return len([l for l in fileOps.iterLines(inFile) if len(l) >= minLen])
+
+        self.assertEqual(countLines(inFile), 3)
+        self.assertEqual(countLines(inFile), 3)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(countLines(inFile, minLen=4), 1)
+        self.assertEqual(len(calls), 2)
+        # changed input
+        self.__mkInput(".txt", ["one", "two"])
+        self.assertEqual(countLines(inFile), 2)
+        self.assertEqual(len(calls), 3)
+
+    def testFile(self):
+        cache = self.__mkCache(useDigest=False)
+        inFile = self.__mkInput(".txt", ["one", "two", "three"])
+        calls = []
+
+        @cachedFile(cache, fileArgs=("inFile",), outArg="outFile", ext=".txt")
+        def upper(inFile, outFile=None, prefix=""):
+            calls.append(outFile)
+            with open(outFile, "w") as fh:
+                for line in fileOps.iterLines(inFile):
+                    fh.write(prefix + line.upper() + "\n")
+
+        cachePath = upper(inFile, prefix="> ")
+        self.assertTrue(cachePath.startswith(cache.cacheDir))
+        self.assertEqual(fileOps.readFileLines(cachePath), ["> ONE", "> TWO", "> THREE"])
+        outFile = self.getOutputFile(".out.txt")
+        self.assertEqual(upper(inFile, outFile, prefix="> "), outFile)
+        self.assertEqual(fileOps.readFileLines(outFile), ["> ONE", "> TWO", "> THREE"])
+        self.assertEqual(len(calls), 1)
+
+    def testFailure(self):
+        cache = self.__mkCache()
+        def fail(path):
+            with open(path, "w") as fh:
+                fh.write("partial")
+            raise ValueError("fail")
+        self.assertRaises(ValueError, cache.getFile, "fail", [], {}, fail)
+        self.assertEqual(cache.getSize(), 0)
+
+    def testEvict(self):
+        cache = self.__mkCache(maxBytes=2600)
+        def mkData(i):
+            return lambda: i * 500 * "x"
+        for i in xrange(1, 4):
+            cache.getObject("obj%d" % i, [], {}, mkData(i))
+        self.assertTrue(cache.getSize() <= 2600)
+        # oldest should have been evicted
+        calls = []
+        self.assertEqual(cache.getObject("obj3", [], {}, lambda: calls.append(3)), 1500 * "x")
+        self.assertEqual(calls, [])
+        cache.getObject("obj1", [], {}, lambda: calls.append(1))
+        self.assertEqual(calls, [1])
+        cache.clear()
+        self.assertEqual(cache.getSize(), 0)
+
+    def testEvictKeepsTmp(self):
+        "eviction, as by another process, doesn't remove results being created"
+        cache = self.__mkCache()
+        cache.getObject("obj1", [], {}, lambda: 1000 * "x")
+        def create(path):
+            with open(path, "w") as fh:
+                fh.write("data\n")
+            cache.evict(0)
+            self.assertTrue(os.path.exists(path))
+        cachePath = cache.getFile("file1", [], {}, create, ext=".txt")
+        self.assertEqual(fileOps.readFileLines(cachePath), ["data"])
+        self.assertEqual(os.listdir(cache.tmpDir), [])
+
+def suite():
+    ts = unittest.TestSuite()
+    ts.addTest(unittest.makeSuite(ResultCacheTests))
+    return ts
+
+if __name__ == '__main__':
+    unittest.main()
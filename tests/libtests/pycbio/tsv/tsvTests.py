@@ -1,12 +1,18 @@
 # Copyright 2006-2012 Mark Diekhans
-import unittest, sys, string
+import unittest, sys, string, shutil
 if __name__ == '__main__':
     sys.path.append("../../../..")
 from pycbio.tsv import TsvTable
 from pycbio.tsv import TsvError
 from pycbio.tsv import TsvReader
+from pycbio.tsv import TsvGroupBy, tsvGroupBy
+from pycbio.tsv import TsvParallelReader
+from pycbio.tsv import TsvWriter
+from pycbio.tsv.tsvRow import TsvRow
+from pycbio.tsv import TsvSchema, getCachedSchema, getCachedTypeMap
+from pycbio.tsv import Categorical
 from pycbio.sys.testCaseBase import TestCaseBase
-from pycbio.sys import procOps
+from pycbio.sys import procOps, fileOps, pipeline
 from pycbio.hgdata.autoSql import intArrayType
 
 class ReadTests(TestCaseBase):
@@ -20,6 +26,12 @@ class ReadTests(TestCaseBase):
         self.assertEqual(r[10],"BC032353")
         self.assertEqual(r.qName, "BC032353")
 
+    def testReadAhead(self):
+        rdr = TsvReader(self.getInputFile("mrna1.tsv"), inFh=fileOps.ReadAheadReader(self.getInputFile("mrna1.tsv"), blockSize=512))
+        rows = list(rdr)
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(rows[0].qName, "BC032353")
+
     def testMultiIdx(self):
         tsv = TsvTable(self.getInputFile("mrna1.tsv"), multiKeyCols=("tName", "tStart"))
         rows = tsv.idx.tName["chr1"]
@@ -121,6 +133,21 @@ class ReadTests(TestCaseBase):
         fh.close()
         self.diffExpected(".tsv")
 
+    class UpperRow(TsvRow):
+        "row class with its own write"
+        def write(self, fh):
+            fh.write(str(self).upper() + "\n")
+
+    def testWriteRowClass(self):
+        tsv = TsvTable(self.getInputFile("types.tsv"), rowClass=self.UpperRow)
+        fh = open(self.getOutputFile(".tsv"), "w")
+        tsv.write(fh)
+        fh.close()
+        self.verifyOutputFile(".tsv", "strCol\tintCol\tfloatCol\tonOffCol\n"
+                              "NAME1\t10\t10.01\tON\n"
+                              "NAME2\t20\t20.22\tOFF\n"
+                              "NAME3\t30\t30.555\tOFF\n")
+
     def testAddColumn(self):
         tsv = TsvTable(self.getInputFile("mrna1.tsv"), uniqKeyCols="qName")
         tsv.addColumn("joke")
@@ -154,6 +181,12 @@ class ReadTests(TestCaseBase):
         procOps.runProc(["bzip2", "-c", self.getInputFile("mrna1.tsv")], stdout=tsvBz)
         self.readMRna1(tsvBz)
 
+    def testReadPipeline(self):
+        self.readMRna1([["cat", self.getInputFile("mrna1.tsv")], ["cat"]])
+        tsvGz = self.getOutputFile("tsv.gz")
+        procOps.runProc(["gzip", "-c", self.getInputFile("mrna1.tsv")], stdout=tsvGz)
+        self.readMRna1(pipeline.Pipeline(["gzip", "-dc", tsvGz]))
+
     def testDupColumn(self):
         with self.assertRaises(TsvError) as cm:
             tsv = TsvTable(self.getInputFile("dupCol.tsv"))
@@ -169,9 +202,187 @@ class ReadTests(TestCaseBase):
         tbl = TsvTable("/dev/null", allowEmpty=True)
         self.assertEqual(len(tbl), 0)
 
+class GroupByTests(TestCaseBase):
+    typeMap = {"matches": int, "misMatches": int, "tStart": int, "tEnd": int}
+    aggs = (("cnt", "count", None),
+            ("matchesSum", "sum", "matches"),
+            ("tStartMin", "min", "tStart"),
+            ("tEndMax", "max", "tEnd"),
+            ("misMatchesMean", "mean", "misMatches"),
+            ("qNameDistinct", "distinct", "qName"))
+
+    def __writeRows(self, groupBy, rows):
+        fh = open(self.getOutputFile(".tsv"), "w")
+        fh.write("\t".join(groupBy.columns) + "\n")
+        for row in rows:
+            row.write(fh)
+        fh.close()
+
+    def testHash(self):
+        groupBy = TsvGroupBy("strand", self.aggs)
+        rows = list(groupBy.aggregate(TsvReader(self.getInputFile("mrna1.tsv"), typeMap=self.typeMap)))
+        self.assertEqual([r.strand for r in rows], ["+", "-"])
+        self.assertEqual(sum(r.cnt for r in rows), 10)
+        self.__writeRows(groupBy, rows)
+        self.diffExpected(".tsv")
+
+    def testSorted(self):
+        # input is grouped by tName and strand
+        groupBy = TsvGroupBy(("tName", "strand"), self.aggs, isSorted=True)
+        rows = list(groupBy.aggregate(TsvReader(self.getInputFile("mrna1.tsv"), typeMap=self.typeMap)))
+        self.assertEqual([(r.tName, r.strand, r.cnt) for r in rows], [("chr1", "+", 1), ("chr1", "-", 9)])
+        self.assertEqual(rows[1].tStartMin, 4222)
+
+    def testUnsorted(self):
+        groupBy = TsvGroupBy("strand", (("cnt", "count", None),), isSorted=True)
+        with self.assertRaises(TsvError) as cm:
+            list(groupBy.aggregate(TsvReader(self.getInputFile("geneCheck.tsv"))))
+        self.assertEqual(str(cm.exception), "input not sorted by strand: ('+',) follows ('-',)")
+
+    geneCheckTypeMap = {"chrStart": int, "chrEnd": int, "orfStop": int, "smallGap": int, "unknownSplice": int}
+    geneCheckAggs = (("cnt", "count", None),
+                     ("chrStartMin", "min", "chrStart"),
+                     ("orfStopSum", "sum", "orfStop"),
+                     ("accDistinct", "distinct", "acc"))
+
+    def testGeneCheck(self):
+        "sorted and hash modes give the same results on geneCheck output"
+        keyCols = ("chr", "stat")
+        inTsv = self.getInputFile("geneCheck.tsv")
+        hashRows = list(tsvGroupBy(inTsv, keyCols, self.geneCheckAggs, typeMap=self.geneCheckTypeMap))
+        with self.assertRaises(TsvError):
+            list(tsvGroupBy(inTsv, keyCols, self.geneCheckAggs, isSorted=True, typeMap=self.geneCheckTypeMap))
+        inRows = sorted(TsvReader(inTsv, typeMap=self.geneCheckTypeMap), key=lambda r: (r.chr, r.stat))
+        sortedRows = list(TsvGroupBy(keyCols, self.geneCheckAggs, isSorted=True).aggregate(inRows))
+        self.assertEqual(sorted(str(r) for r in sortedRows), sorted(str(r) for r in hashRows))
+        self.assertEqual(sum(r.cnt for r in sortedRows), 53)
+
+    def testFile(self):
+        rows = list(tsvGroupBy(self.getInputFile("mrna1.tsv"), "tName", (("cnt", "count", None),)))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(str(rows[0]), "chr1\t10")
+
+    def testBadAgg(self):
+        with self.assertRaises(TsvError) as cm:
+            TsvGroupBy("strand", (("cnt", "median", "tStart"),))
+        self.assertEqual(str(cm.exception), "unknown aggregate type \"median\", expected one of: count, distinct, max, mean, min, sum")
+
+class ParallelReadTests(TestCaseBase):
+    typeMap = {"matches": int, "tStart": int, "blockSizes": intArrayType}
+
+    def testRows(self):
+        inTsv = self.getInputFile("mrna1.tsv")
+        expect = [str(r) for r in TsvReader(inTsv, typeMap=self.typeMap)]
+        rows = list(TsvParallelReader(inTsv, typeMap=self.typeMap, numProcs=3, chunkSize=500))
+        self.assertEqual([str(r) for r in rows], expect)
+        self.assertEqual(rows[1].qName, "AK095183")
+        self.assertEqual(rows[1].tStart, 4222)
+        self.assertEqual(rows[1].blockSizes[0], 470)
+
+    def testChunks(self):
+        rdr = TsvParallelReader(self.getInputFile("mrna1.tsv"), typeMap=self.typeMap, numProcs=2, chunkSize=500)
+        qNames = []
+        matches = []
+        for chunk in rdr.iterChunks():
+            qNames.extend(chunk[rdr.colMap["qName"]])
+            matches.extend(chunk[rdr.colMap["matches"]])
+        self.assertEqual(len(qNames), 10)
+        self.assertEqual(qNames[0:2], ["BC032353", "AK095183"])
+        self.assertEqual(matches[0:2], [1631, 1973])
+
+class WriteTests(TestCaseBase):
+    typeMap = {"intCol": int, "floatCol": float, "onOffCol": (ReadTests.onOffParse, ReadTests.onOffFmt)}
+
+    def testWriteRows(self):
+        rdr = TsvReader(self.getInputFile("types.tsv"), typeMap=self.typeMap)
+        with TsvWriter(self.getOutputFile(".tsv"), rdr.columns, typeMap=self.typeMap, batchSize=2) as wr:
+            wr.writeRows(rdr)
+        self.diffExpected(".tsv", "tsvTests.WriteTests.types")
+
+    def testWriteRowGz(self):
+        tsvGz = self.getOutputFile(".tsv.gz")
+        rdr = TsvReader(self.getInputFile("types.tsv"), typeMap=self.typeMap)
+        with TsvWriter(tsvGz, rdr.columns, colTypes=rdr.colTypes) as wr:
+            for row in rdr:
+                wr.writeRow(row)
+        procOps.runProc(["zcat", tsvGz], stdout=self.getOutputFile(".tsv"))
+        self.diffExpected(".tsv", "tsvTests.WriteTests.types")
+
+    def testWriteColumns(self):
+        columns = [["name1", "name2", "name3"], [10, None, 30], [10.01, 20.5, 30.555], [True, False, False]]
+        with TsvWriter(self.getOutputFile(".tsv"), ("strCol", "intCol", "floatCol", "onOffCol"), typeMap=self.typeMap) as wr:
+            wr.writeColumns(columns)
+        self.verifyOutputFile(".tsv", "strCol\tintCol\tfloatCol\tonOffCol\n"
+                              "name1\t10\t10.01\ton\n"
+                              "name2\t\t20.5\toff\n"
+                              "name3\t30\t30.555\toff\n")
+
+class SchemaTests(TestCaseBase):
+    def testInfer(self):
+        schema = TsvSchema.infer(self.getInputFile("mrna1.tsv"))
+        self.assertEqual(schema.colTypeNames["matches"], "int")
+        self.assertEqual(schema.colTypeNames["qName"], "str")
+        self.assertEqual(schema.colTypeNames["tName"], "intern")
+        self.assertEqual(schema.colTypeNames["blockSizes"], "str")
+        tsv = TsvTable(self.getInputFile("mrna1.tsv"), typeMap=schema.getTypeMap())
+        self.assertEqual(tsv[1].tStart, 4222)
+
+    def testInferNone(self):
+        tsvFile = self.getOutputFile(".tsv")
+        self.createOutputFile(".tsv", "iCol\tfCol\tsCol\n1\t1.5\ta\n\t\t\n3\t\tc\n")
+        schema = TsvSchema.infer(tsvFile)
+        self.assertEqual(schema.colTypeNames, {"iCol": "intOrNone", "fCol": "floatOrNone", "sCol": "str"})
+        rows = list(TsvReader(tsvFile, typeMap=schema.getTypeMap()))
+        self.assertEqual([r.iCol for r in rows], [1, None, 3])
+        self.assertEqual([r.fCol for r in rows], [1.5, None, None])
+
+    def testCache(self):
+        tsvFile = self.getOutputFile(".tsv")
+        shutil.copy(self.getInputFile("types.tsv"), tsvFile)
+        typeMap = getCachedTypeMap(tsvFile)
+        self.assertEqual(typeMap, {"intCol": int, "floatCol": float})
+        self.mustExist(tsvFile + ".tsvschema")
+        # edit the cache to make sure it is used
+        schema = TsvSchema.read(tsvFile + ".tsvschema")
+        schema.colTypeNames["strCol"] = "intern"
+        schema.write(tsvFile + ".tsvschema")
+        self.assertEqual(getCachedSchema(tsvFile).colTypeNames["strCol"], "intern")
+
+class CategoricalTests(TestCaseBase):
+    def testReader(self):
+        strandCat = Categorical(("+", "-"))
+        typeMap = {"strand": strandCat, "tName": Categorical()}
+        rows = list(TsvReader(self.getInputFile("mrna1.tsv"), typeMap=typeMap))
+        minus = strandCat.getCode("-")
+        self.assertEqual(minus, 1)
+        self.assertEqual(len([r for r in rows if r.strand == minus]), 9)
+        self.assertEqual(rows[0].tName, 0)
+        self.assertEqual(str(rows[0]), str(list(TsvReader(self.getInputFile("mrna1.tsv")))[0]))
+
+    def testTable(self):
+        tsv = TsvTable(self.getInputFile("mrna1.tsv"), typeMap={"strand": Categorical(), "qName": Categorical()})
+        fh = open(self.getOutputFile(".tsv"), "w")
+        tsv.write(fh)
+        fh.close()
+        self.diffExpected(".tsv", "tsvTests.ReadTests.testWrite")
+
+    def testParallel(self):
+        strandCat = Categorical()
+        rdr = TsvParallelReader(self.getInputFile("mrna1.tsv"), typeMap={"strand": strandCat}, numProcs=2, chunkSize=500)
+        codes = []
+        for chunk in rdr.iterChunks():
+            codes.extend(chunk[rdr.colMap["strand"]])
+        self.assertEqual(codes, [0] + 9 * [1])
+        self.assertEqual(strandCat.decodeColumn(codes[0:2]), ["+", "-"])
+
 def suite():
     ts = unittest.TestSuite()
     ts.addTest(unittest.makeSuite(ReadTests))
+    ts.addTest(unittest.makeSuite(GroupByTests))
+    ts.addTest(unittest.makeSuite(ParallelReadTests))
+    ts.addTest(unittest.makeSuite(WriteTests))
+    ts.addTest(unittest.makeSuite(SchemaTests))
+    ts.addTest(unittest.makeSuite(CategoricalTests))
     return ts
 
 if __name__ == '__main__':